@@ -4,7 +4,7 @@
 # Runtime Settings
 #########################################
 collect_demographics = True
-manual_demographics_collection = False
+manual_demographics_collection = True  # collected in setup(), skipped when resuming
 manual_trial_generation = False
 run_practice_blocks = True
 multi_user = False
@@ -52,6 +52,28 @@ default_condition = 'PP'
 dm_trial_show_mouse = False
 dm_ignore_local_overrides = False
 show_gamepad_debug = False
+debug_overlay_rate = 5  # max updates per second for the gamepad debug overlay
+debug_overlay_graphical = False  # if True, draws gamepad state as shapes, not text
+run_benchmarks = False  # if True, prints per-frame benchmarks at startup
+prerender_screens = True  # if False, instruction screens are rendered on demand
+profile = False  # if True, saves per-block profiles to ExpAssets/Data/profiles
+
+#########################################
+# Live Telemetry Settings
+#########################################
+telemetry = False  # if True, publishes live trial data for tools/telemetry_reader.py
+telemetry_socket = "/tmp/motormapping_telemetry.sock"
+
+#########################################
+# Frame Watchdog Settings
+#########################################
+frame_watchdog = True  # if True, sheds optional per-frame work if frames run slow
+frame_budget = 0.8  # max fraction of the refresh interval for each frame's work
+shed_levels = {
+    1: 0,  # debug overlay (can be turned off entirely)
+    2: 8,  # live telemetry (can be reduced to every 8th frame)
+    3: 1,  # raw input archive (never reduced, so that it stays per-frame)
+}
 
 #########################################
 # Data Export Settings
@@ -78,3 +100,5 @@ test_mapping = 'inverted_x'
 run_kviq = True
 practice_trials = 10
 cursor_size = 1.0  # degrees
+raw_archive = True  # if True, saves all raw per-frame input to ExpAssets/Data/raw
+resume_session = False  # if True, resumes the last unfinished session on this computer
@@ -61,6 +61,7 @@ CREATE TABLE trials (
     mapping text not null,
     dominant boolean not null,
     target_onset text not null,
+    onset_err text not null,
     target_dist float not null,
     target_angle float not null,
     movement_rt text not null,
@@ -74,6 +75,17 @@ CREATE TABLE trials (
 );
 
 
+CREATE TABLE trial_errors (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    dominant boolean not null,
+    err text not null,
+    target_shown boolean not null
+);
+
+
 CREATE TABLE kviq (
     id integer primary key autoincrement not null,
     participant_id integer not null references participants(id),
@@ -86,6 +98,50 @@ CREATE TABLE kviq (
 );
 
 
+CREATE TABLE trial_kinematics (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    samples integer not null,
+    path_length text not null,
+    path_efficiency text not null,
+    peak_velocity text not null,
+    peak_velocity_time text not null,
+    corrections text not null,
+    final_error text not null
+);
+
+
+CREATE TABLE trial_bins (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    dominant boolean not null,
+    bin integer not null,
+    trials integer not null,
+    timeouts integer not null,
+    errors integer not null,
+    mean_movement text not null,
+    median_movement text not null,
+    mean_contact text not null,
+    median_contact text not null,
+    mean_response text not null,
+    median_response text not null
+);
+
+
+CREATE TABLE trial_bin_errors (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    dominant boolean not null,
+    bin integer not null,
+    err text not null,
+    count integer not null
+);
+
+
 CREATE TABLE gamepad (
     id integer primary key autoincrement not null,
     participant_id integer not null references participants(id),
@@ -95,3 +151,15 @@ CREATE TABLE gamepad (
     stick_x float not null,
     stick_y float not null
 );
+
+
+CREATE TABLE frame_watchdog (
+    id integer primary key autoincrement not null,
+    participant_id integer not null references participants(id),
+    block_num integer not null,
+    trial_num integer not null,
+    task text not null,
+    stride integer not null,
+    frame_ms float not null,
+    budget_ms float not null
+);
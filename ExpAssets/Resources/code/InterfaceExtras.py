@@ -7,8 +7,8 @@ from klibs.KLGraphics import fill, blit, flip, clear, rgb_to_rgba
 from klibs.KLGraphics import KLDraw as kld
 from klibs.KLGraphics.KLNumpySurface import NumpySurface as NpS
 from klibs.KLCommunication import message
-from klibs.KLEventQueue import flush, pump
-from klibs.KLUserInterface import ui_request, key_pressed, get_clicks, mouse_clicked
+from klibs.KLEventQueue import flush
+from klibs.KLUserInterface import ui_request, key_pressed
 from klibs.KLUtilities import show_mouse_cursor, hide_mouse_cursor, mouse_pos, clip
 from klibs.KLUtilities import line_segment_len as lsl
 from klibs.KLResponseCollectors import Response
@@ -17,11 +17,38 @@ import random
 import time
 import sdl2
 
+from inputs import snapshot
+
 MED_GREY = (128, 128, 128, 255)
 LIGHT_GREY = (192, 192, 192, 255)
 TRANSLUCENT_GREY = (192, 192, 192, 64)
 TRANSLUCENT_BLUE = (0, 0, 128, 128)
 
+# Window events that require the screen to be redrawn
+REDRAW_EVENTS = [
+    sdl2.SDL_WINDOWEVENT_SHOWN,
+    sdl2.SDL_WINDOWEVENT_EXPOSED,
+    sdl2.SDL_WINDOWEVENT_RESTORED,
+    sdl2.SDL_WINDOWEVENT_SIZE_CHANGED,
+]
+
+
+def needs_redraw(queue):
+    """Checks whether an event queue contains any window exposure events.
+
+    Args:
+        queue (:obj:`InputSnapshot` or list): The input snapshot (or list of SDL
+            events) to check.
+
+    Returns:
+        bool: True if the window needs to be redrawn, otherwise False.
+
+    """
+    for e in snapshot(queue).window:
+        if e.window.event in REDRAW_EVENTS:
+            return True
+    return False
+
 
 class Aesthetics(object):
     """The aesthetic attributes to use for drawing an interface item.
@@ -87,8 +114,9 @@ class Button(object):
         if aes.thickness or aes.fill:
             outline = [aes.thickness, aes.color, STROKE_INNER]
             self.button = kld.Rectangle(self.width, self.height, outline, fill=aes.fill)
-        self.button = kld.Rectangle(self.width, self.height)
         self.hover = kld.Rectangle(self.width, self.height, fill=aes.hover)
+        self._static = None
+        self._mouse = None
         
         self.__registration = registration
         self.__location = location if location else P.screen_c
@@ -115,18 +143,33 @@ class Button(object):
         self.x2 = self.midpoint[0] + self.width//2
         self.y2 = self.midpoint[1] + self.height//2
         self.bounds = RectangleBoundary("button", (self.x1, self.y1), (self.x2, self.y2))
-        
+        self._static = None
+
+    def _render_static(self):
+        # Composite the button label and outline into a single cached surface
+        w = max(self.width, self.msg.width)
+        h = max(self.height, self.msg.height)
+        surf = NpS(width=w, height=h)
+        local_mid = (w // 2, h // 2)
+        surf.blit(self.msg, 5, local_mid)
+        if self.button:
+            surf.blit(self.button, 5, local_mid)
+        return surf
         
     def draw(self):
-        blit(self.msg, 5, self.midpoint)
-        if self.button:
-            blit(self.button, 5, self.midpoint)
-        mp = mouse_pos()
+        if self._static is None:
+            self._static = self._render_static()
+        blit(self._static, 5, self.midpoint)
+        # Use the mouse position from the last listen() if available
+        mp = self._mouse if self._mouse is not None else mouse_pos()
         if self.bounds.within(mp):
             blit(self.hover, 5, self.midpoint)
         
     def listen(self, queue):
-        return mouse_clicked(within=self.bounds, queue=queue)
+        q = snapshot(queue)
+        if len(q.mouse_motion) or len(q.mouse_down) or len(q.mouse_up):
+            self._mouse = q.mouse_pos
+        return q.clicked(within=self.bounds)
                 
     @property
     def location(self):
@@ -218,35 +261,49 @@ class LikertType(BoundaryInspector):
         self.x2 = self.midpoint[0] + self.width // 2
         self.y2 = self.midpoint[1] + self.height // 2
 
+        # Precompute the position of each number on the scale
+        self._positions = {}
+        for n, num in enumerate(self.range):
+            x_pos = self.x1 + int(self.circle_size * (n + 0.5)) + int(self.gap * n)
+            y_pos = self.y1 + int(self.circle_size * 0.5)
+            self._positions[num] = (x_pos, y_pos)
+
         for num in self.range:
-            pos = self._num_to_pos(num)
+            pos = self._positions[num]
             bounds = CircleBoundary(str(num), pos, (self.circle_size * 0.6))
             self.add_boundary(bounds)
+        self._static = None
     
     def _num_to_pos(self, num):
-        n = self.range.index(num)
-        x_pos = self.x1 + int(self.circle_size * (n + 0.5)) + int(self.gap * n)
-        y_pos = self.y1 + int(self.circle_size * 0.5)
-        return (x_pos, y_pos)
+        return self._positions[num]
 
-    def _render(self):
+    def _render_static(self):
+        # Composite the circles and numbers of the scale into a single surface
+        surf = NpS(width=self.width, height=self.height)
         for num in self.range:
-            pos = self._num_to_pos(num)
+            x, y = self._positions[num]
+            local_pos = (x - self.x1, y - self.y1)
             if self.circle:
-                blit(self.circle, location=pos, registration=5)
-            blit(self.numbers[num], location=pos, registration=5)
+                surf.blit(self.circle, 5, local_pos)
+            surf.blit(self.numbers[num], 5, local_pos)
+        return surf
+
+    def _render(self):
+        if self._static is None:
+            self._static = self._render_static()
+        blit(self._static, 7, (self.x1, self.y1))
         if self.response != None:
-            pos = self._num_to_pos(self.response)
+            pos = self._positions[self.response]
             blit(self.selected, location=pos, registration=5)
 
     def update(self, queue):
+        q = snapshot(queue)
         self._render()
-        num = self.which_boundary(mouse_pos())
+        num = self.which_boundary(q.mouse_pos)
         if num != None:
-            blit(self.mouseover, 5, self._num_to_pos(int(num)))
-            for e in queue:
-                if e.type == sdl2.SDL_MOUSEBUTTONDOWN:
-                    self.response = int(num)
+            blit(self.mouseover, 5, self._positions[int(num)])
+            if len(q.mouse_down):
+                self.response = int(num)
     
     @property
     def location(self):
@@ -277,30 +334,45 @@ class Slider(object):
 
         _fills = {'line': MED_GREY, 'slider': TRANSLUCENT_BLUE}
         _fills.update(fills) # override default colours if fills provided
+        self._tick_size = (2, int(diameter/2))
         self.line = kld.Rectangle(width, 2, fill=_fills['line'])
-        self.tick = kld.Rectangle(2, int(diameter/2), fill=_fills['line'])
+        self.tick = kld.Rectangle(*self._tick_size, fill=_fills['line'])
         self.button = kld.Ellipse(diameter, fill=_fills['slider'])
+        self._static = None
 
         self.__clicked = False
         self.__dragging = False
         self.__drag_offset = 0
         self.__abs_pos = self.location
 
-    def _draw_ticks(self):
-        if self.ticks == 1:
-            blit(self.tick, 5, self.location)
-        elif self.ticks >= 2:
-            blit(self.tick, 5, (self.xmin, self.location[1]))
-            blit(self.tick, 5, (self.xmax, self.location[1]))
-            if self.ticks > 2:
-                spacing = float(self.width) / (self.ticks-1)
-                for i in range(1, self.ticks-1):
-                    blit(self.tick, 5, (self.xmin+int(spacing*i), self.location[1]))
+    def _tick_offsets(self):
+        # Gets the x offsets of each tick relative to the left edge of the slider
+        if not self.ticks:
+            return []
+        elif self.ticks == 1:
+            return [self.location[0] - self.xmin]
+        offsets = [0, self.xmax - self.xmin]
+        if self.ticks > 2:
+            spacing = float(self.width) / (self.ticks-1)
+            for i in range(1, self.ticks-1):
+                offsets.append(int(spacing*i))
+        return offsets
+
+    def _render_static(self):
+        # Composite the slider line and ticks into a single cached surface, padded
+        # so that ticks at either end aren't clipped
+        pad, height = self._tick_size
+        surf = NpS(width=self.width + pad * 2, height=height)
+        surf.blit(self.line, 5, (pad + self.location[0] - self.xmin, height // 2))
+        for x in self._tick_offsets():
+            surf.blit(self.tick, 5, (pad + x, height // 2))
+        return surf
         
     def draw(self):
-        blit(self.line, 5, self.location)
-        if self.ticks:
-            self._draw_ticks()
+        if self._static is None:
+            self._static = self._render_static()
+        static_loc = (self.xmin - self._tick_size[0], self.location[1])
+        blit(self._static, 4, static_loc)
         if self.__clicked:
             mp = mouse_pos()
             if self.__dragging:
@@ -310,7 +382,7 @@ class Slider(object):
                 blit(self.button, 5, self.__abs_pos)
         
     def listen(self, queue):
-        for e in queue:
+        for e in snapshot(queue).mouse_buttons:
             if e.type == sdl2.SDL_MOUSEBUTTONDOWN:
                 click_pos = (e.button.x, e.button.y)
                 if abs(click_pos[1]-self.location[1]) < self.button.diameter/2:
@@ -344,6 +416,7 @@ class Slider(object):
         self.__location = loc
         self.xmin = loc[0] - self.width//2
         self.xmax = loc[0] + self.width//2
+        self._static = None
 
     @property
     def pos(self):
@@ -367,6 +440,7 @@ class ThoughtProbe(BoundaryInspector):
         BoundaryInspector.__init__(self)
 
         self.q = question
+        self.cpu_time = None
         self.width = self.q.width if width == None else width
         self.origin = origin
         hover_col = TRANSLUCENT_GREY
@@ -403,44 +477,71 @@ class ThoughtProbe(BoundaryInspector):
             y1 = y2
 
 
-    def _render(self):
+    def _render(self, mouseover=None):
 
         blit(self.q, location=self.origin, registration=8)
         for ans in self.order:
             a = self.answers[ans]
             blit(a['text'], location=a['location'], registration=7)
 
-        mouseover = self.which_boundary(mouse_pos())
+        if mouseover == None:
+            mouseover = self.which_boundary(mouse_pos())
         if mouseover != None:
             a = self.answers[mouseover]
             hover_loc = self.boundaries[mouseover].p1
             blit(a['hover'], 7, hover_loc)
 
 
-    def _collect(self):
-        q = pump(True)
-        clicks = get_clicks(released=True, queue=q)
-        for click in clicks:
+    def _collect(self, q=None):
+        q = snapshot(q)
+        for click in q.clicks(released=True):
             response = self.which_boundary(click)
             if response != None:
                 return response
         return None
 
 
-    def collect(self):
+    def collect(self, continuous=False):
+        """Waits for a response, only redrawing the screen when something changes.
+
+        The screen is redrawn whenever the hovered response option changes or the
+        window needs to be redrawn (e.g. after being exposed). Otherwise, the loop
+        sleeps until new input arrives. The CPU time used while collecting the
+        response is stored in the ``cpu_time`` attribute afterwards.
+
+        Args:
+            continuous (bool, optional): If True, the screen will be redrawn on
+                every loop iteration regardless of whether anything has changed.
+                Defaults to False.
 
+        Returns:
+            :obj:`Response`: The selected response and its reaction time.
+
+        """
         show_mouse_cursor()
         response = None
         onset = time.time()
+        cpu_onset = time.process_time()
 
         flush()
+        redraw = True
+        hover = self.which_boundary(mouse_pos())
         while response == None:
-            fill()
-            self._render()
-            flip()
-            response = self._collect()
+            if redraw or continuous:
+                fill()
+                self._render(hover)
+                flip()
+            if not continuous:
+                # Sleep until there's new input (or 50 ms have passed)
+                sdl2.SDL_WaitEventTimeout(None, 50)
+            q = snapshot()
+            response = self._collect(q)
+            new_hover = self.which_boundary(q.mouse_pos)
+            redraw = new_hover != hover or needs_redraw(q)
+            hover = new_hover
 
         rt = time.time() - onset
+        self.cpu_time = time.process_time() - cpu_onset
         hide_mouse_cursor()
         return Response(response, rt)
 
@@ -449,19 +550,17 @@ class RatingScale(ThoughtProbe):
     # Special case of ThoughtProbe where all responses correspond to numbers, so
     # we allow for keypress responses as well as click responses
 
-    def _collect(self):
-        q = pump(True)
+    def _collect(self, q=None):
+        q = snapshot(q)
         # Check for clicks on response options
-        clicks = get_clicks(released=True, queue=q)
-        for click in clicks:
+        for click in q.clicks(released=True):
             response = self.which_boundary(click)
             if response != None:
                 return response
         # Check for keypress events corresponding to rating scale options
-        for event in q:
-            if event.type == sdl2.SDL_KEYDOWN:
-                keyname = sdl2.SDL_GetKeyName(event.key.keysym.sym)
-                response = keyname.decode("utf-8").replace("Keypad ", "")
-                if response in self.order:
-                    return response
+        for event in q.keydown:
+            keyname = sdl2.SDL_GetKeyName(event.key.keysym.sym)
+            response = keyname.decode("utf-8").replace("Keypad ", "")
+            if response in self.order:
+                return response
         return None
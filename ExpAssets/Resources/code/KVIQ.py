@@ -1,18 +1,21 @@
 import re
+from functools import partial
+
+import sdl2
 
 from klibs import P
-from klibs.KLTime import Stopwatch
-from klibs.KLEventQueue import flush, pump
-from klibs.KLUserInterface import (
-    key_pressed, ui_request, show_cursor, hide_cursor, smart_sleep, mouse_clicked,
-)
+from klibs.KLEventQueue import flush
+from klibs.KLUserInterface import ui_request, show_cursor, hide_cursor, smart_sleep
 from klibs.KLUtilities import deg_to_px
 from klibs.KLGraphics import fill, blit, flip, NumpySurface
 from klibs.KLText import add_text_style
 from klibs.KLCommunication import message
 
-from sdl_utils import get_key_state
+from sdl_utils import wait_for_event, EventClock
+from inputs import InputSnapshot
 from InterfaceExtras import RatingScale
+from screens import ScreenCache, compose_screen, render_lock
+from profiling import profiled
 
 
 # KVIQ-10 elements
@@ -151,6 +154,16 @@ visual_ratings = {
     '1': "1 - No image",
 }
 
+intro_screens = [
+    ('imagery_desc', imagery_desc),
+    ('intro_1', intro_1),
+    ('intro_2', intro_2),
+    ('intro_3', intro_3),
+    ('intro_4', intro_4),
+    ('intro_5', intro_5),
+    ('intro_6', intro_6),
+]
+
 kinaesthetic_ratings = {
     '5': "5 - As intense as executing the action",
     '4': "4 - Intense",
@@ -208,25 +221,56 @@ def demo_msg(msgs, extras=None, wait=0.1, spacing=None, width=None, mouse=True):
         blit(e['img'], e['reg'], e['loc'])
     flip()
 
+    wait_for_space(wait, mouse)
+
+
+def demo_screen(msgs, extras=None, spacing=None, width=None):
+    # Composites a demo_msg screen into a single surface for pre-rendering
+    if not extras:
+        extras = []
+    layers = [(render_text(msgs, spacing=spacing, width=width), 5, P.screen_c)]
+    for e in extras:
+        layers.append((e['img'], e['reg'], e['loc']))
+    return compose_screen(layers)
+
+
+def wait_for_space(wait=0.1, mouse=True):
+    """Waits for the space bar to be pressed (or the mouse to be clicked).
+
+    Rather than polling the keyboard in a loop, this sleeps until new input
+    arrives and then checks the new events.
+
+    Args:
+        wait (float, optional): The time (in seconds) to wait before responses
+            are accepted. Defaults to 0.1.
+        mouse (bool, optional): Whether a mouse click can be used instead of the
+            space bar. Defaults to True.
+
+    Returns:
+        int: The SDL timestamp (in ms) of the keypress or click event.
+
+    """
     if wait:
         smart_sleep(wait * 1000)
-    
-    key_released = False
+
+    # NOTE: Repeated keydown events from a held down space bar are ignored, so
+    # the key must be released and pressed again to register a response
+    space = sdl2.SDL_SCANCODE_SPACE
     flush()
     while True:
-        q = pump(True)
-        # Handle keyboard input
-        if not key_released:
-            # Ignore repeated keydown events from held down space bar by requiring key
-            # be 'up' on at least one loop before a response can be registered
-            if get_key_state('space') == 0:
-                key_released = True
-        else:
-            if key_pressed('space', queue=q):
-                break
-        # Handle mouse input
-        if mouse and mouse_clicked(queue=q):
-            break
+        wait_for_event(100)
+        q = InputSnapshot()
+        ui_request(queue=q.keydown)
+        if q.key_pressed(space):
+            return q.keys_down[space].key.timestamp
+        if mouse and len(q.mouse_down):
+            return q.mouse_down[0].button.timestamp
+
+
+def _start_prompt(instructions):
+    # Adds the 'press space to start' prompt to a set of movement instructions
+    instructions[-1] = instructions[-1] + "\n"
+    return instructions + ["Press [space] to begin."]
 
 
 def swap_laterality(txt):
@@ -241,92 +285,129 @@ class KVIQ(object):
 
     def __init__(self, left_handed=False):
         self.left_handed = left_handed
-        self.extras = [] # Extra stimuli for demo_msg
         add_text_style('title', '0.75deg')
 
+        self.rating_cpu_times = []
+        self.clock = EventClock()
+
+        # Pre-render all static KVIQ screens in the background
+        self.screens = ScreenCache()
+        self._add_screens()
+        self.screens.compile()
+
 
+    @profiled("kviq")
     def run(self):
         self._instructions()
         # Runs the full KVIQ and returns responses in a dict
         responses = {}
-        for name, movement in kviq_movements.items():
-            self._update_title(name)
-            responses[name] = self._collect_movement(movement)
+        for name in kviq_movements.keys():
+            responses[name] = self._collect_movement(name)
         return responses
 
 
-    def _update_title(self, movement):
-        loc = (P.screen_c[0], int(P.screen_y * 0.15))
-        title = message(movement, style="title")
-        self.extras = [{'img': title, 'reg': 8, 'loc': loc}] 
-
-
-    def _instructions(self):
-        demo_msg(imagery_desc)
-        demo_msg(intro_1)
-        demo_msg(intro_2)
-        demo_msg(intro_3)
-
-        demo_msg(intro_4)
-        self._collect_rating(kinaesthetic=False, demo=True)
+    def report(self):
+        # Summarizes the screen transition latencies and rating CPU usage
+        lines = [self.screens.report()]
+        if len(self.rating_cpu_times):
+            cpu_ms = 1000 * sum(self.rating_cpu_times) / len(self.rating_cpu_times)
+            lines.append(" - CPU time per rating: {0:.1f} ms".format(cpu_ms))
+        res_ms = self.clock.resolution * 1000
+        lines.append(" - Movement timing resolution: {0:.2f} ms".format(res_ms))
+        return "\n".join(lines)
 
-        demo_msg(intro_5)
-        self._collect_rating(kinaesthetic=True, demo=True)
 
-        demo_msg(intro_6)
+    def _title(self, movement):
+        loc = (P.screen_c[0], int(P.screen_y * 0.15))
+        title = message(movement, style="title")
+        return [{'img': title, 'reg': 8, 'loc': loc}]
 
 
-    def _collect_movement(self, info):
+    def _movement_text(self, info):
         # Generate 1st and 3rd-person movement descriptions
         left_h = self.left_handed
         desc_1st = swap_laterality(info['desc']) if left_h else info['desc']
         desc_3rd = desc_1st
         for word, replacement in info['3rd_sub'].items():
             desc_3rd = desc_3rd.replace(word, replacement)
+        start_pos = info['start_pos']
+        if left_h:
+            start_pos = swap_laterality(start_pos)
+
+        return {
+            'info': [
+                start_pos_prefix + start_pos,
+                movement_prefix + desc_1st + "\n",
+                wait_msg,
+            ],
+            'physical': _start_prompt((physical + desc_1st).split("\n")),
+            'visual': _start_prompt((visual + desc_3rd).split("\n")),
+            'kinaesthetic': _start_prompt((kinaesthetic + desc_1st).split("\n")),
+        }
+
+
+    def _add_screens(self):
+        # Register all static screens in the order they're shown
+        for name, msgs in intro_screens:
+            self.screens.add(name, partial(demo_screen, msgs))
+        msg_w = int(P.screen_x * 0.65)
+        for name, movement in kviq_movements.items():
+            text = self._movement_text(movement)
+            for stage in ['info', 'physical', 'visual', 'kinaesthetic']:
+                builder = partial(self._movement_screen, name, text[stage], msg_w)
+                self.screens.add((name, stage), builder)
+        finished = partial(demo_screen, "Press [space] when finished.")
+        self.screens.add('finished', finished)
+
+
+    def _movement_screen(self, name, msgs, width):
+        return demo_screen(msgs, self._title(name), width=width)
+
 
+    def _instructions(self):
+        for name, msgs in intro_screens:
+            self.screens.show(name)
+            wait_for_space()
+            if name == 'intro_4':
+                self._collect_rating(kinaesthetic=False, demo=True)
+            elif name == 'intro_5':
+                self._collect_rating(kinaesthetic=True, demo=True)
+
+
+    def _collect_movement(self, name):
         # Explain the movement and starting position
-        if left_h:
-            info['start_pos'] = swap_laterality(info['start_pos'])
-        info = [
-            start_pos_prefix + info['start_pos'],
-            movement_prefix + desc_1st + "\n",
-            wait_msg,
-        ]
-        demo_msg(info, self.extras, width=int(P.screen_x * 0.65))
+        self.screens.show((name, 'info'))
+        wait_for_space()
 
         # Perform movement physically first
         dat = {}
-        phys_instructions = (physical + desc_1st).split("\n")
-        dat['physical_time'] = self._wait_for_movement(phys_instructions)
+        dat['physical_time'] = self._wait_for_movement((name, 'physical'))
 
         # Next, visualize in 3rd person
-        visual_instructions = (visual + desc_3rd).split("\n")
-        dat['visual_time'] = self._wait_for_movement(visual_instructions)
+        dat['visual_time'] = self._wait_for_movement((name, 'visual'))
         dat['vividness'] = self._collect_rating()
 
         # Finally, visualize in 1st person
-        kin_instructions = (kinaesthetic + desc_1st).split("\n")
-        dat['kinaesthetic_time'] = self._wait_for_movement(kin_instructions)
+        dat['kinaesthetic_time'] = self._wait_for_movement((name, 'kinaesthetic'))
         dat['intensity'] = self._collect_rating(kinaesthetic=True)
 
         return dat
         
 
-    def _wait_for_movement(self, instructions):
+    def _wait_for_movement(self, screen):
         # Present the initial instructions and wait for input
-        instructions[-1] = instructions[-1] + "\n"
-        instructions += ["Press [space] to begin."]
-        msg_w = int(P.screen_x * 0.65)
-        demo_msg(instructions, self.extras, wait=False, width=msg_w, mouse=False)
+        self.screens.show(screen)
+        start = wait_for_space(wait=False, mouse=False)
 
         # Once started, remove 'press space to start' prompt and wait for second
         # space bar press to end.
-        timer = Stopwatch(start=True)
-        demo_msg("Press [space] when finished.", wait=0.5, mouse=False)
-        timer.pause()
+        self.screens.show('finished')
+        end = wait_for_space(wait=0.5, mouse=False)
 
-        # On second press, return movement duration
-        return timer.elapsed()
+        # On second press, return movement duration (in seconds) using the
+        # timestamps of the keypress events
+        self.clock.sync()
+        return self.clock.to_time(end) - self.clock.to_time(start)
 
 
     def _collect_rating(self, kinaesthetic=False, demo=False):
@@ -338,30 +419,25 @@ class KVIQ(object):
         else:
             prompt_adj = "clear"
             choices = visual_ratings
-        prompt = message(prompt_txt.format(prompt_adj))
 
         # Create the rating prompt for the current imagery type
         scale_loc = (P.screen_c[0], int(P.screen_y * 0.3))
-        scale = RatingScale(
-            choices, prompt, scale_loc, order = ['5', '4', '3', '2', '1']
-        )
+        with render_lock:
+            prompt = message(prompt_txt.format(prompt_adj))
+            scale = RatingScale(
+                choices, prompt, scale_loc, order = ['5', '4', '3', '2', '1']
+            )
 
         # Collect and return the rating
         response = 0
         if demo:
             show_cursor()
-            key_released = False
             while True:
-                q = pump(True)
-                if not key_released:
-                    # Ignore repeated keydown events from held down space bar by
-                    # requring key must be 'up' on at least one loop before response
-                    if get_key_state('space') == 0:
-                        key_released = True
-                else:
-                    if key_pressed('space', queue=q):
-                        break
-                if mouse_clicked(queue=q):
+                # NOTE: Repeated keydown events from a held down space bar are
+                # ignored, so the key must be released and pressed again
+                q = InputSnapshot()
+                ui_request(queue=q.keydown)
+                if q.key_pressed(sdl2.SDL_SCANCODE_SPACE) or q.clicked():
                     break
                 fill()
                 scale._render()
@@ -370,4 +446,5 @@ class KVIQ(object):
         else:
             rating = scale.collect()
             response = rating.value
+            self.rating_cpu_times.append(scale.cpu_time)
         return int(response)
@@ -0,0 +1,211 @@
+"""An append-only binary archive of raw per-frame gamepad input for a session.
+
+Each session's archive consists of three files: a ``.samples`` file of fixed-size
+records (one per frame), a ``.flips`` file of display flip timestamps (one per
+frame from each trial's target onset onwards), and a small ``.idx`` file with one
+record per completed trial giving the block and trial numbers, the offset and
+number of the trial's samples, the timestamp of the trial's target onset, the
+archive's sampling stride for the trial (1 if every frame was recorded, 2 if every
+2nd frame was recorded, etc., or 0 if no frames were recorded), and the offset and
+number of the trial's flip timestamps.
+
+Samples are written directly into a memory-mapped file that grows in large
+steps as needed. A trial's index record is only written once the trial is
+finished, so samples from recycled trials (and any trial in progress when a
+session crashes) are never referenced by the index and are overwritten by the
+next trial. Archives can be read without copying with :func:`read_archive`, and
+their flip timestamps with :func:`read_flips`.
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+
+import numpy as np
+
+SAMPLE = np.dtype([
+    ('time', '<f8'), ('left_x', '<i4'), ('left_y', '<i4'), ('right_x', '<i4'),
+    ('right_y', '<i4'), ('left_trigger', '<i4'), ('right_trigger', '<i4'),
+])
+INDEX = np.dtype([
+    ('block_num', '<u2'), ('trial_num', '<u2'), ('offset', '<u8'),
+    ('count', '<u4'), ('onset', '<f8'), ('stride', '<u2'),
+    ('flip_offset', '<u8'), ('flips', '<u4'),
+])
+FLIP = np.dtype('<f8')
+
+
+def _read_index(path):
+    # Reads an archive's index file, checking that its records are the right size
+    if os.path.getsize(path) % INDEX.itemsize != 0:
+        e = "The index file '{0}' is corrupt or from an older archive format."
+        raise ValueError(e.format(path))
+    return np.fromfile(path, dtype=INDEX)
+
+
+class SampleArchive(object):
+    """Writes raw per-frame input samples to a memory-mapped session archive.
+
+    If the archive already exists (e.g. when resuming a session), new trials are
+    appended after the last indexed trial.
+
+    Args:
+        path (str): The path of the archive, without a file extension.
+        grow (int, optional): The number of samples to grow the file by when it
+            fills up. Defaults to 2 ** 18 (8 MB).
+
+    """
+    def __init__(self, path, grow=2 ** 18):
+        self.path = path
+        self.grow = grow
+        self._samples_path = path + ".samples"
+        self._index_path = path + ".idx"
+        self._flips_path = path + ".flips"
+        self._n = 0
+        self._n_flips = 0
+        self._trial_start = None
+        self._map = None
+
+        if os.path.isfile(self._index_path):
+            index = _read_index(self._index_path)
+            if len(index):
+                self._n = int(index['offset'][-1] + index['count'][-1])
+                self._n_flips = int(index['flip_offset'][-1] + index['flips'][-1])
+        capacity = max(self._n + grow, 0)
+        if os.path.isfile(self._samples_path):
+            size = os.path.getsize(self._samples_path) // SAMPLE.itemsize
+            capacity = max(capacity, size)
+        self._resize(capacity)
+        # Drop any flips written for a trial that was never indexed (e.g. a crash)
+        with open(self._flips_path, "ab") as f:
+            f.truncate(self._n_flips * FLIP.itemsize)
+        self._flips = open(self._flips_path, "ab")
+        self._index = open(self._index_path, "ab")
+
+    def _resize(self, capacity):
+        if self._map is not None:
+            self._map.flush()
+            del self._map
+        with open(self._samples_path, "ab") as f:
+            f.truncate(capacity * SAMPLE.itemsize)
+        self._map = np.memmap(
+            self._samples_path, dtype=SAMPLE, mode="r+", shape=(capacity,)
+        )
+        self._capacity = capacity
+
+    def begin_trial(self):
+        """Starts recording samples for a new trial.
+
+        If the previous trial was never finished (e.g. because it was recycled),
+        its samples are discarded.
+
+        """
+        if self._trial_start is not None:
+            self._n = self._trial_start
+        self._trial_start = self._n
+
+    def append(self, t, left, right, left_trigger, right_trigger):
+        """Appends a single frame's raw input values to the current trial.
+
+        Args:
+            t (float): The timestamp of the sample.
+            left (tuple): The raw (x, y) values of the left stick.
+            right (tuple): The raw (x, y) values of the right stick.
+            left_trigger (int): The raw value of the left trigger.
+            right_trigger (int): The raw value of the right trigger.
+
+        """
+        if self._n >= self._capacity:
+            self._resize(self._capacity + self.grow)
+        self._map[self._n] = (
+            t, left[0], left[1], right[0], right[1], left_trigger, right_trigger
+        )
+        self._n += 1
+
+    def end_trial(self, block_num, trial_num, onset, stride=1, flips=None):
+        """Finishes the current trial, writing its samples, flip timestamps, and
+        index record to disk.
+
+        Args:
+            block_num (int): The block number of the trial.
+            trial_num (int): The trial number of the trial.
+            onset (float): The timestamp of the trial's target onset.
+            stride (int, optional): The interval (in frames) at which samples were
+                recorded for the trial, if not every frame (e.g. if the archive
+                was throttled by the frame watchdog). Defaults to 1.
+            flips (array-like, optional): The timestamps of the trial's display
+                flips from the target onset onwards. Defaults to None.
+
+        """
+        start = self._trial_start
+        self._trial_start = None
+        self._map.flush()
+        flips = np.asarray(flips if flips is not None else [], dtype=FLIP)
+        self._flips.write(flips.tobytes())
+        self._flips.flush()
+        rec = np.array([(
+            block_num, trial_num, start, self._n - start, onset, stride,
+            self._n_flips, len(flips)
+        )], dtype=INDEX)
+        self._n_flips += len(flips)
+        self._index.write(rec.tobytes())
+        self._index.flush()
+
+    def close(self):
+        """Trims any unused space from the end of the archive and closes it.
+
+        """
+        if self._map is None:
+            return
+        if self._trial_start is not None:
+            self._n = self._trial_start
+        self._map.flush()
+        del self._map
+        self._map = None
+        self._index.close()
+        self._flips.close()
+        with open(self._samples_path, "ab") as f:
+            f.truncate(self._n * SAMPLE.itemsize)
+
+
+def read_archive(path):
+    """Opens a session archive for reading without loading it into memory.
+
+    Args:
+        path (str): The path of the archive, with or without a file extension.
+
+    Returns:
+        tuple: A read-only memory-mapped structured array of samples (see
+        ``SAMPLE``) and the array of per-trial index records (see ``INDEX``).
+        The samples for a trial can be accessed (without copying) with
+        ``samples[rec['offset']:rec['offset'] + rec['count']]``.
+
+    """
+    path = os.path.splitext(path)[0]
+    index = _read_index(path + ".idx")
+    n = int(index['offset'][-1] + index['count'][-1]) if len(index) else 0
+    if n == 0:
+        return (np.zeros(0, dtype=SAMPLE), index)
+    samples = np.memmap(path + ".samples", dtype=SAMPLE, mode="r", shape=(n,))
+    return (samples, index)
+
+
+def read_flips(path):
+    """Opens the display flip timestamps of a session archive for reading.
+
+    Args:
+        path (str): The path of the archive, with or without a file extension.
+
+    Returns:
+        :obj:`numpy.ndarray`: A read-only memory-mapped array of flip timestamps.
+        The flips for a trial can be accessed (without copying) with
+        ``flips[rec['flip_offset']:rec['flip_offset'] + rec['flips']]``, the
+        first of which is the trial's target onset.
+
+    """
+    path = os.path.splitext(path)[0]
+    n = os.path.getsize(path + ".flips") // FLIP.itemsize
+    if n == 0:
+        return np.zeros(0, dtype=FLIP)
+    return np.memmap(path + ".flips", dtype=FLIP, mode="r", shape=(n,))
@@ -0,0 +1,318 @@
+__author__ = "Austin Hurst"
+
+import time
+import random
+from math import sqrt
+from collections import OrderedDict
+
+import sdl2
+from sdl2 import gamecontroller as gc
+from klibs import P
+from klibs.KLGraphics import fill, blit
+from klibs.KLCommunication import message
+from klibs.KLUtilities import deg_to_px, angle_between, point_pos, mouse_pos
+from klibs.KLUserInterface import ui_request, get_clicks
+
+from stick import AXIS_MAX, CursorMapper
+from inputs import InputSnapshot
+from screens import SceneLayer
+from gamepad import button_pressed
+
+
+def time_per_frame(draw, frames=500):
+    """Measures the mean per-frame cost of a drawing function.
+
+    The function is called once before timing starts so that any one-time setup
+    (e.g. compositing cached surfaces) isn't included in the per-frame cost.
+
+    Args:
+        draw (callable): A function that draws a single frame, taking no arguments.
+        frames (int, optional): The number of frames to time. Defaults to 500.
+
+    Returns:
+        float: The mean time (in microseconds) taken to draw a frame.
+
+    """
+    draw()
+    start = time.perf_counter()
+    for i in range(frames):
+        draw()
+    elapsed = time.perf_counter() - start
+    fill()
+    return (elapsed / frames) * 1e6
+
+
+def format_results(title, results, units="us/frame"):
+    """Formats a set of benchmark results for printing.
+
+    Args:
+        title (str): The title of the benchmark.
+        results (dict): A dict of benchmark names and their per-frame costs.
+        units (str, optional): The units of the results. Defaults to 'us/frame'.
+
+    Returns:
+        str: The formatted benchmark results.
+
+    """
+    lines = [title + ":"]
+    for name, cost in results.items():
+        lines.append(" - {0}: {1:.1f} {2}".format(name, cost, units))
+    return "\n".join(lines)
+
+
+def widget_benchmarks(frames=500):
+    """Measures the per-frame draw cost of each InterfaceExtras widget.
+
+    Args:
+        frames (int, optional): The number of frames to time for each widget.
+
+    Returns:
+        dict: The mean per-frame draw cost (in microseconds) for each widget.
+
+    """
+    from InterfaceExtras import Aesthetics, Button, LikertType, Slider
+
+    size = deg_to_px(1.0)
+    aes = Aesthetics(thickness=2)
+    likert = LikertType(1, 7, size * 10, size, aes=aes)
+    likert.response = 4
+    slider = Slider(size * 10, ticks=7)
+    slider.pos = 0.5
+    button = Button(message("Done"), size * 3, size, aes=aes)
+
+    results = OrderedDict()
+    results['LikertType'] = time_per_frame(lambda: likert.update([]), frames)
+    results['Slider'] = time_per_frame(slider.draw, frames)
+    results['Button'] = time_per_frame(button.draw, frames)
+    return results
+
+
+def _legacy_cursor_pos(x, y, origin, max_dist, mapping, deadzone=0.2):
+    # The original trig-based stick scaling and cursor mapping, for comparison
+    amplitude = min(1.0, sqrt(x ** 2 + y ** 2) / AXIS_MAX)
+    if amplitude < deadzone:
+        xs, ys = (0, 0)
+    else:
+        angle = angle_between((0, 0), (x, y))
+        amp_new = (amplitude - deadzone) / (1.0 - deadzone)
+        xs, ys = point_pos((0, 0), amp_new, angle, return_int=False)
+    return (
+        origin[0] + int(xs * max_dist * mapping[0]),
+        origin[1] + int(ys * max_dist * mapping[1])
+    )
+
+
+def _stick_samples(n, seed=530453080):
+    # Generates a reproducible set of raw stick samples covering the full range,
+    # including the axes, diagonals, deadzone edges, and extreme values
+    rng = random.Random(seed)
+    lo, hi = (-AXIS_MAX, AXIS_MAX - 1)
+    samples = [(rng.randint(lo, hi), rng.randint(lo, hi)) for i in range(n)]
+    for v in (0, 1, 6553, 6554, 16384, 23170, 23171, 32767, -32768):
+        samples += [(v, 0), (0, v), (v, v), (-v, v), (v, -v)]
+    return samples
+
+
+def stick_benchmarks(max_dist, mapping, samples=100000):
+    """Measures the per-frame cost of mapping raw stick values to cursor positions.
+
+    Args:
+        max_dist (int): The maximum distance (in pixels) of the cursor from origin.
+        mapping (tuple): The x/y axis multipliers to use for the cursor.
+        samples (int, optional): The number of raw stick samples to time.
+
+    Returns:
+        dict: The mean cost per sample (in nanoseconds) of the old and new paths.
+
+    """
+    origin = (int(P.screen_c[0]), int(P.screen_c[1]))
+    mapper = CursorMapper(origin, max_dist)
+    mapper.set_mapping(mapping)
+    raw = _stick_samples(samples)
+
+    results = OrderedDict()
+    start = time.perf_counter()
+    for x, y in raw:
+        _legacy_cursor_pos(x, y, origin, max_dist, mapping)
+    results['trig (old)'] = (time.perf_counter() - start) / len(raw) * 1e9
+    position = mapper.position
+    start = time.perf_counter()
+    for x, y in raw:
+        position(x, y)
+    results['CursorMapper (new)'] = (time.perf_counter() - start) / len(raw) * 1e9
+    return results
+
+
+def _busy_queue(motion=40, axis=40, keys=4, clicks=2, buttons=2, seed=530453080):
+    # Generates a reproducible list of synthetic SDL events resembling a busy
+    # frame's event queue (lots of mouse and controller axis motion)
+    rng = random.Random(seed)
+    queue = []
+    for i in range(motion):
+        e = sdl2.SDL_Event()
+        e.type = sdl2.SDL_MOUSEMOTION
+        e.motion.x, e.motion.y = (rng.randint(0, 1000), rng.randint(0, 1000))
+        queue.append(e)
+    for i in range(axis):
+        e = sdl2.SDL_Event()
+        e.type = sdl2.SDL_CONTROLLERAXISMOTION
+        e.caxis.axis = rng.randint(0, 5)
+        e.caxis.value = rng.randint(-AXIS_MAX, AXIS_MAX - 1)
+        queue.append(e)
+    for i in range(keys):
+        e = sdl2.SDL_Event()
+        e.type = sdl2.SDL_KEYDOWN if i % 2 == 0 else sdl2.SDL_KEYUP
+        e.key.keysym.scancode = sdl2.SDL_SCANCODE_A
+        e.key.keysym.sym = sdl2.SDLK_a
+        queue.append(e)
+    for i in range(clicks):
+        e = sdl2.SDL_Event()
+        e.type = sdl2.SDL_MOUSEBUTTONDOWN if i % 2 == 0 else sdl2.SDL_MOUSEBUTTONUP
+        e.button.x, e.button.y = (rng.randint(0, 1000), rng.randint(0, 1000))
+        queue.append(e)
+    for i in range(buttons):
+        e = sdl2.SDL_Event()
+        e.type = sdl2.SDL_CONTROLLERBUTTONDOWN
+        e.cbutton.button = sdl2.SDL_CONTROLLER_BUTTON_B
+        queue.append(e)
+    rng.shuffle(queue)
+    return queue
+
+
+def _legacy_input_frame(q):
+    # The original per-consumer handling of a frame's events, where each consumer
+    # scans the full raw event queue separately
+    ui_request(queue=q)
+    # wait_for_input()
+    valid = [sdl2.SDL_KEYDOWN, sdl2.SDL_MOUSEBUTTONDOWN, sdl2.SDL_CONTROLLERBUTTONDOWN]
+    for e in q:
+        if e.type in valid:
+            break
+    # gamepad.button_pressed()
+    button = gc.SDL_GameControllerGetButtonFromString("a".encode('utf-8'))
+    for e in q:
+        if e.type in [sdl2.SDL_JOYBUTTONDOWN, sdl2.SDL_CONTROLLERBUTTONDOWN]:
+            if e.cbutton.button == button:
+                break
+    # LikertType.update()
+    mouse_pos()
+    for e in q:
+        if e.type == sdl2.SDL_MOUSEBUTTONDOWN:
+            pass
+    # Slider.listen()
+    for e in q:
+        if e.type == sdl2.SDL_MOUSEBUTTONDOWN:
+            pass
+        elif e.type == sdl2.SDL_MOUSEBUTTONUP:
+            pass
+    # RatingScale._collect()
+    get_clicks(released=True, queue=q)
+    for e in q:
+        if e.type == sdl2.SDL_KEYDOWN:
+            sdl2.SDL_GetKeyName(e.key.keysym.sym)
+    # ThoughtProbe.collect()
+    mouse_pos()
+    for e in q:
+        if e.type == sdl2.SDL_WINDOWEVENT:
+            pass
+
+
+def _snapshot_input_frame(q):
+    # The same handling using a shared per-frame input snapshot
+    snap = InputSnapshot(q)
+    ui_request(queue=snap.keydown)
+    snap.any_input
+    button_pressed(snap, "a")
+    snap.mouse_pos
+    len(snap.mouse_down)
+    for e in snap.mouse_buttons:
+        pass
+    snap.clicks(released=True)
+    for e in snap.keydown:
+        sdl2.SDL_GetKeyName(e.key.keysym.sym)
+    snap.mouse_pos
+    for e in snap.window:
+        pass
+
+
+def input_benchmarks(frames=2000):
+    """Measures the per-frame cost of handling a busy event queue.
+
+    The same synthetic queue of ~90 events (mostly mouse and controller axis
+    motion) is handled both by scanning the raw queue separately for each input
+    consumer (the old approach) and by categorizing it once into a shared
+    :obj:`InputSnapshot`.
+
+    Args:
+        frames (int, optional): The number of frames to time for each approach.
+
+    Returns:
+        dict: The mean per-frame input handling cost (in microseconds) for each
+        approach.
+
+    """
+    q = _busy_queue()
+    results = OrderedDict()
+    for name, handle in [('per-consumer (old)', _legacy_input_frame),
+                         ('InputSnapshot (new)', _snapshot_input_frame)]:
+        handle(q)
+        start = time.perf_counter()
+        for i in range(frames):
+            handle(q)
+        results[name] = (time.perf_counter() - start) / frames * 1e6
+    return results
+
+
+def scene_benchmarks(fixation, target, cursor, frames=500):
+    """Measures the per-frame draw cost of the trial display with and without
+    compositing its static stimuli into a cached scene layer.
+
+    Since klibs uploads a new texture for every blit, the number of pixels
+    uploaded per frame is also reported for each approach.
+
+    Args:
+        fixation: The fixation cross stimulus.
+        target: The target stimulus.
+        cursor: The cursor stimulus.
+        frames (int, optional): The number of frames to time for each approach.
+
+    Returns:
+        tuple: The mean per-frame draw cost (in microseconds) for each approach,
+        and the number of pixels uploaded per frame for each approach.
+
+    """
+    origin = P.screen_c
+    target_loc = (origin[0] + deg_to_px(5.0), origin[1] - deg_to_px(3.0))
+    cursor_loc = (origin[0] + deg_to_px(1.0), origin[1] - deg_to_px(1.0))
+    combined = SceneLayer([(fixation, 5, origin), (target, 5, target_loc)])
+    scene = SceneLayer([(fixation, 5, origin)])
+
+    def separate():
+        fill()
+        blit(fixation, 5, origin)
+        blit(target, 5, target_loc)
+        blit(cursor, 5, cursor_loc)
+
+    def layered_combined():
+        fill()
+        combined.draw()
+        blit(cursor, 5, cursor_loc)
+
+    def layered():
+        fill()
+        scene.draw()
+        blit(target, 5, target_loc)
+        blit(cursor, 5, cursor_loc)
+
+    def px(img):
+        return img.surface_width * img.surface_height
+
+    results = OrderedDict()
+    results['per-stimulus blits'] = time_per_frame(separate, frames)
+    results['SceneLayer incl. target'] = time_per_frame(layered_combined, frames)
+    results['SceneLayer + target blit'] = time_per_frame(layered, frames)
+    uploads = OrderedDict()
+    uploads['per-stimulus blits'] = px(fixation) + px(target) + px(cursor)
+    uploads['SceneLayer incl. target'] = combined.area + px(cursor)
+    uploads['SceneLayer + target blit'] = scene.area + px(target) + px(cursor)
+    return (results, uploads)
@@ -7,12 +7,12 @@ from sdl2 import error
 from sdl2 import (
     SDL_InitSubSystem, SDL_WasInit, SDL_QuitSubSystem, 
     SDL_INIT_JOYSTICK, SDL_INIT_GAMECONTROLLER, SDL_FALSE, SDL_TRUE,
-    SDL_JOYBUTTONDOWN, SDL_JOYBUTTONUP,
-    SDL_CONTROLLERBUTTONDOWN, SDL_CONTROLLERBUTTONUP,
 )
 from sdl2.ext.common import raise_sdl_err
 from sdl2.ext.compat import utf8, stringify, byteify, _is_text
 
+from inputs import snapshot
+
 
 # Define name maps for joystick types and states
 
@@ -240,6 +240,7 @@ class GameController(object):
         self._info = _get_joystick_info(index)
         self._pad = None
         self._stick = None
+        self._instance_id = -1
 
     def initialize(self):
         # First, make sure pad isn't already open
@@ -255,6 +256,7 @@ class GameController(object):
 
         # Get additional info
         self._stick = gc.SDL_GameControllerGetJoystick(self._pad)
+        self._instance_id = jy.SDL_JoystickInstanceID(self._stick)
         naxes = jy.SDL_JoystickNumAxes(self._stick)
         nbuttons = jy.SDL_JoystickNumButtons(self._stick)
         nhats = jy.SDL_JoystickNumHats(self._stick)
@@ -330,17 +332,34 @@ class GameController(object):
     def name(self):
         return self._info["name"]
 
+    @property
+    def instance_id(self):
+        return self._instance_id
+
+    @property
+    def attached(self):
+        if not self._pad:
+            return False
+        return gc.SDL_GameControllerGetAttached(self._pad) == SDL_TRUE
+
+
+
+_button_ids = {}
+
+
+def _button_id(button):
+    # Gets the SDL button ID for a given button name, caching the result
+    if button not in _button_ids:
+        # TODO: Validation of button strings?
+        button_bytes = utf8(button).encode('utf-8')
+        _button_ids[button] = gc.SDL_GameControllerGetButtonFromString(button_bytes)
+    return _button_ids[button]
 
 
 def button_pressed(events, button=None, device=None, on_release=False):
-    button_events = [SDL_JOYBUTTONDOWN, SDL_CONTROLLERBUTTONDOWN]
-    if on_release:
-        button_events = [SDL_JOYBUTTONUP, SDL_CONTROLLERBUTTONUP]
     if button:
         if _is_text(button):
-            # TODO: Validation of button strings?
-            button_bytes = utf8(button).encode('utf-8')
-            button = gc.SDL_GameControllerGetButtonFromString(button_bytes)
+            button = _button_id(button)
         button = int(button)
         # NOTE: Extra buttons added in SDL 2.0.14, should err if requesting newer button
         # with older lib
@@ -348,15 +367,4 @@ def button_pressed(events, button=None, device=None, on_release=False):
             pass
     # TODO: If Joystick/GameController provided, ensure button is valid for device
 
-    pressed = False
-    for e in events:
-        if e.type not in button_events:
-            continue
-        if device != None and e.which != device.instance_id:
-            continue
-        if button == None or e.button == button:
-            pressed = True
-            break
-    
-    return pressed
-
+    return snapshot(events).button_pressed(button, device, on_release)
@@ -1,10 +1,14 @@
+import time
+
 import sdl2
 import sdl2.ext
 
+# NOTE: py360 only imports pyusb once its USB backend is actually used
 import py360
 from py360.constants import *
 
 from gamepad import get_controllers, GameController, _get_joystick_info
+from inputs import snapshot
 
 
 BUTTON_MAP = {
@@ -35,11 +39,23 @@ AXIS_MAP = {
 }
 
 
-def get_all_controllers():
+def _is_virtual(pad):
+    # Whether a controller is a virtual SDL joystick (e.g. a leftover from a
+    # Virtual360Controller whose USB device has since been unplugged)
+    return sdl2.SDL_JoystickIsVirtual(pad._index) == sdl2.SDL_TRUE
+
+
+def get_all_controllers(refresh=False):
     # Try getting SDL2 controllers, fall back to PyUSB if available
-    connected = get_controllers()
+    # NOTE: Virtual joysticks are skipped, since the only ones we create are
+    # for pyusb controllers, which are found on the USB side instead
+    connected = [pad for pad in get_controllers() if not _is_virtual(pad)]
     if not len(connected):
-        connected_usb = py360.get_controllers()
+        try:
+            connected_usb = py360.get_controllers(refresh)
+        except ImportError:
+            # pyusb not installed, so no fallback available
+            return connected
         if len(connected_usb):
             pad = Virtual360Controller(connected_usb[0])
             connected.append(pad)
@@ -68,6 +84,7 @@ class Virtual360Controller(GameController):
     def __init__(self, usb_device):
         self._pad = None
         self._stick = None
+        self._instance_id = -1
         self._index = self._init_virtual()
         self._info = _get_joystick_info(self._index)
 
@@ -88,8 +105,32 @@ class Virtual360Controller(GameController):
         GameController.initialize(self)
 
     def close(self):
-        self.usb_pad.disconnect()
+        if self.usb_pad and self.usb_pad.connected:
+            self.usb_pad.disconnect()
         GameController.close(self)
+        self._detach_virtual()
+
+    def _detach_virtual(self):
+        # Removes the virtual joystick from SDL so that it doesn't linger in the
+        # device list after the USB controller has been closed
+        if self._index is None:
+            return
+        # NOTE: Device indices can shift as other devices come and go, so we find
+        # the virtual joystick's current index by its instance ID (if known)
+        index = self._index
+        if self._instance_id >= 0:
+            for i in range(sdl2.SDL_NumJoysticks()):
+                if sdl2.SDL_JoystickGetDeviceInstanceID(i) == self._instance_id:
+                    index = i
+                    break
+        sdl2.SDL_JoystickDetachVirtual(index)
+        self._index = None
+
+    @property
+    def attached(self):
+        # USB controllers don't produce SDL hot-plug events, so we check whether
+        # the device is still connected on the pyusb side instead
+        return self.usb_pad is not None and self.usb_pad.connected
 
     def update(self):
         self.usb_pad.update()
@@ -107,3 +148,146 @@ class Virtual360Controller(GameController):
                 if axis in [AXIS_LT, AXIS_RT]:
                     value = int(value * 257) - 32768
                 sdl2.SDL_JoystickSetVirtualAxis(self._stick, a, value)
+
+
+
+class ControllerManager(object):
+    """Keeps track of the active game controller, re-attaching it if disconnected.
+
+    Native SDL2 controllers are re-attached using SDL's controller hot-plug events,
+    so the USB bus doesn't need to be re-scanned when a controller is unplugged
+    and plugged back in. Since pyusb-based 360 controllers don't generate hot-plug
+    events, the bus is re-scanned (at most once per `rescan_interval` seconds) to
+    find them again after they've been disconnected.
+
+    Times taken to enumerate controllers and to re-attach after a disconnect are
+    recorded and can be retrieved with :meth:`metrics`.
+
+    Args:
+        rescan_interval (float, optional): The minimum interval (in seconds) between
+            controller re-scans while waiting for a lost controller to reconnect.
+
+    """
+    def __init__(self, rescan_interval=1.0):
+        self.current = None
+        self.rescan_interval = rescan_interval
+        self._lost_at = None
+        self._last_scan = 0
+        self.enumerate_times = []
+        self.reattach_times = []
+
+    def enumerate(self, refresh=False):
+        """Finds all available controllers, timing how long it takes.
+
+        Args:
+            refresh (bool, optional): If True, the USB bus will be re-scanned for
+                fallback controllers instead of using the cached results of the last
+                scan. Defaults to False.
+
+        Returns:
+            list: A list of all available controllers.
+
+        """
+        start = time.perf_counter()
+        connected = get_all_controllers(refresh)
+        self._last_scan = time.perf_counter()
+        self.enumerate_times.append(self._last_scan - start)
+        return connected
+
+    def connect(self):
+        """Attaches the first available controller, if any.
+
+        Returns:
+            :obj:`GameController` or None: The attached controller, or None if no
+            controllers are available.
+
+        """
+        connected = self.enumerate()
+        if len(connected):
+            self._attach(connected[0])
+        return self.current
+
+    def close(self):
+        """Closes the active controller, if any.
+
+        """
+        if self.current:
+            self.current.close()
+            self.current = None
+
+    def _attach(self, pad):
+        pad.initialize()
+        self.current = pad
+        if self._lost_at is not None:
+            self.reattach_times.append(time.perf_counter() - self._lost_at)
+            self._lost_at = None
+
+    def _detach(self):
+        self.current.close()
+        self.current = None
+        self._lost_at = time.perf_counter()
+
+    @property
+    def lost(self):
+        """bool: Whether the active controller has been disconnected.
+
+        """
+        return self._lost_at is not None
+
+    def update(self, queue):
+        """Handles any controller hot-plug events in the given event queue.
+
+        Args:
+            queue (:obj:`InputSnapshot` or list): The input snapshot (or list of
+                SDL events) to check for hot-plug events.
+
+        Returns:
+            bool: True if the active controller was detached or re-attached,
+            otherwise False.
+
+        """
+        changed = False
+        for e in snapshot(queue).device:
+            if e.type == sdl2.SDL_CONTROLLERDEVICEREMOVED:
+                if self.current and e.cdevice.which == self.current.instance_id:
+                    self._detach()
+                    changed = True
+            elif e.type == sdl2.SDL_CONTROLLERDEVICEADDED:
+                # NOTE: For added devices, 'which' is the device index
+                if self.current is None and self.lost:
+                    self._attach(GameController(e.cdevice.which))
+                    changed = True
+
+        # In case any hot-plug events were flushed, check the controller directly
+        if self.current and not self.current.attached:
+            self._detach()
+            changed = True
+
+        # If still waiting on a lost controller, periodically re-scan for it
+        if self.current is None and self.lost:
+            if time.perf_counter() - self._last_scan > self.rescan_interval:
+                connected = self.enumerate(refresh=True)
+                if len(connected):
+                    self._attach(connected[0])
+                    changed = True
+
+        return changed
+
+    def metrics(self):
+        """Gets the enumeration and re-attach timing metrics for the session.
+
+        Returns:
+            dict: The number of enumerations and re-attaches, along with their mean
+            and maximum durations (in milliseconds).
+
+        """
+        out = {}
+        timings = [
+            ('enumerate', self.enumerate_times), ('reattach', self.reattach_times),
+        ]
+        for name, times in timings:
+            out[name + '_count'] = len(times)
+            if len(times):
+                out[name + '_mean_ms'] = 1000 * sum(times) / len(times)
+                out[name + '_max_ms'] = 1000 * max(times)
+        return out
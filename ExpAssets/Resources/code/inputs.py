@@ -0,0 +1,241 @@
+"""A per-frame snapshot of SDL input, categorized once and shared by all consumers.
+
+Previously, each input consumer (``ui_request``, ``wait_for_input``,
+``button_pressed``, and the various ``InterfaceExtras`` widgets) scanned the full
+list of pumped events separately, checking the type of every event each time.
+An :class:`InputSnapshot` pumps the queue and sorts its events by type in a
+single pass, so each consumer only looks at the events it cares about. The
+mouse position and keyboard state are also read at most once per snapshot.
+
+Functions that accept a snapshot also accept a raw list of events (which is
+categorized on the fly) for backwards compatibility.
+
+"""
+
+__author__ = "Austin Hurst"
+
+from ctypes import c_int, byref
+
+import sdl2
+from klibs.KLEventQueue import pump
+
+_KEY_EVENTS = (sdl2.SDL_KEYDOWN, sdl2.SDL_KEYUP)
+_MOUSE_BUTTON_EVENTS = (sdl2.SDL_MOUSEBUTTONDOWN, sdl2.SDL_MOUSEBUTTONUP)
+_PAD_BUTTON_EVENTS = (
+    sdl2.SDL_CONTROLLERBUTTONDOWN, sdl2.SDL_CONTROLLERBUTTONUP,
+    sdl2.SDL_JOYBUTTONDOWN, sdl2.SDL_JOYBUTTONUP,
+)
+_PAD_BUTTON_DOWN = (sdl2.SDL_CONTROLLERBUTTONDOWN, sdl2.SDL_JOYBUTTONDOWN)
+_AXIS_EVENTS = (sdl2.SDL_CONTROLLERAXISMOTION, sdl2.SDL_JOYAXISMOTION)
+_DEVICE_EVENTS = (
+    sdl2.SDL_CONTROLLERDEVICEADDED, sdl2.SDL_CONTROLLERDEVICEREMOVED,
+    sdl2.SDL_CONTROLLERDEVICEREMAPPED,
+)
+
+
+class InputSnapshot(object):
+    """The input events for a single frame, categorized by type.
+
+    Args:
+        queue (list, optional): A list of SDL events to categorize. If not
+            provided, the SDL event queue will be pumped for new events.
+
+    Attributes:
+        events (list): All events in the snapshot, in order.
+        keydown (list): All keydown events (including key repeats).
+        keys_down (dict): The first non-repeat keydown event for each scancode.
+        keys_up (dict): The first keyup event for each scancode.
+        mouse_buttons (list): All mouse button down and up events, in order.
+        mouse_down (list): All mouse button down events.
+        mouse_up (list): All mouse button up events.
+        mouse_motion (list): All mouse motion events.
+        buttons_down (dict): Lists of the buttons pressed on each gamepad or
+            joystick, keyed by instance ID.
+        buttons_up (dict): Lists of the buttons released on each gamepad or
+            joystick, keyed by instance ID.
+        axes (dict): The latest value of each moved axis on each gamepad or
+            joystick, keyed by ``(instance_id, axis)``.
+        device (list): All controller hot-plug events.
+        window (list): All window events.
+
+    """
+    def __init__(self, queue=None):
+        if queue is None:
+            queue = pump(True)
+        self.events = queue
+        self.keydown = []
+        self.keys_down = {}
+        self.keys_up = {}
+        self.mouse_buttons = []
+        self.mouse_down = []
+        self.mouse_up = []
+        self.mouse_motion = []
+        self.buttons_down = {}
+        self.buttons_up = {}
+        self.axes = {}
+        self.device = []
+        self.window = []
+        self._mouse_pos = None
+        self._key_state = None
+
+        for e in queue:
+            t = e.type
+            if t in _KEY_EVENTS:
+                code = e.key.keysym.scancode
+                if t == sdl2.SDL_KEYDOWN:
+                    self.keydown.append(e)
+                    if not e.key.repeat and code not in self.keys_down:
+                        self.keys_down[code] = e
+                elif code not in self.keys_up:
+                    self.keys_up[code] = e
+            elif t == sdl2.SDL_MOUSEMOTION:
+                self.mouse_motion.append(e)
+            elif t in _MOUSE_BUTTON_EVENTS:
+                self.mouse_buttons.append(e)
+                if t == sdl2.SDL_MOUSEBUTTONDOWN:
+                    self.mouse_down.append(e)
+                else:
+                    self.mouse_up.append(e)
+            elif t in _AXIS_EVENTS:
+                # NOTE: Controller and joystick axis events share the same layout
+                self.axes[(e.caxis.which, e.caxis.axis)] = e.caxis.value
+            elif t in _PAD_BUTTON_EVENTS:
+                # NOTE: Controller and joystick button events share the same layout
+                pressed = self.buttons_down if t in _PAD_BUTTON_DOWN else self.buttons_up
+                pressed.setdefault(e.cbutton.which, []).append(e.cbutton.button)
+            elif t in _DEVICE_EVENTS:
+                self.device.append(e)
+            elif t == sdl2.SDL_WINDOWEVENT:
+                self.window.append(e)
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def mouse_pos(self):
+        """tuple: The (x, y) position of the mouse cursor for this frame.
+
+        """
+        if self._mouse_pos is None:
+            # Use the position from the latest mouse event if there is one
+            if len(self.mouse_motion):
+                e = self.mouse_motion[-1].motion
+                self._mouse_pos = (e.x, e.y)
+            else:
+                x, y = c_int(0), c_int(0)
+                sdl2.SDL_GetMouseState(byref(x), byref(y))
+                self._mouse_pos = (x.value, y.value)
+        return self._mouse_pos
+
+    def key_state(self, scancode):
+        """Checks whether a given key is currently held down.
+
+        Args:
+            scancode (int): The SDL scancode of the key to check.
+
+        Returns:
+            bool: True if the key is currently pressed, otherwise False.
+
+        """
+        if self._key_state is None:
+            numkeys = c_int(0)
+            keys = sdl2.SDL_GetKeyboardState(byref(numkeys))
+            self._key_state = (keys, numkeys.value)
+        keys, numkeys = self._key_state
+        return scancode < numkeys and keys[scancode] == 1
+
+    def key_pressed(self, scancode):
+        """Checks whether a given key was pressed (ignoring key repeats).
+
+        Args:
+            scancode (int): The SDL scancode of the key to check.
+
+        Returns:
+            bool: True if the key was pressed, otherwise False.
+
+        """
+        return scancode in self.keys_down
+
+    def clicks(self, released=False):
+        """Gets the locations of all mouse clicks.
+
+        Args:
+            released (bool, optional): If True, mouse button releases will be
+                used instead of presses. Defaults to False.
+
+        Returns:
+            list: The (x, y) locations of each click.
+
+        """
+        events = self.mouse_up if released else self.mouse_down
+        return [(e.button.x, e.button.y) for e in events]
+
+    def clicked(self, within=None, released=False):
+        """Checks whether the mouse was clicked (optionally within a boundary).
+
+        Args:
+            within (:obj:`Boundary`, optional): If provided, only clicks within
+                this boundary are counted.
+            released (bool, optional): If True, mouse button releases will be
+                used instead of presses. Defaults to False.
+
+        Returns:
+            bool: True if the mouse was clicked, otherwise False.
+
+        """
+        if within is None:
+            return len(self.mouse_up if released else self.mouse_down) > 0
+        for loc in self.clicks(released):
+            if within.within(loc):
+                return True
+        return False
+
+    def button_pressed(self, button=None, device=None, on_release=False):
+        """Checks whether a gamepad or joystick button was pressed.
+
+        Args:
+            button (int, optional): The SDL button ID to check for. If not
+                provided, any button will be counted.
+            device (:obj:`GameController`, optional): If provided, only buttons
+                from this device will be counted.
+            on_release (bool, optional): If True, button releases will be used
+                instead of presses. Defaults to False.
+
+        Returns:
+            bool: True if the button was pressed, otherwise False.
+
+        """
+        pressed = self.buttons_up if on_release else self.buttons_down
+        if device is not None:
+            buttons = pressed.get(device.instance_id, [])
+            return len(buttons) > 0 if button is None else button in buttons
+        for buttons in pressed.values():
+            if button is None or button in buttons:
+                return True
+        return False
+
+    @property
+    def any_input(self):
+        """bool: Whether any key, mouse button, or gamepad button was pressed.
+
+        """
+        return bool(self.keydown or self.mouse_down or self.buttons_down)
+
+
+def snapshot(queue=None):
+    """Gets an input snapshot for a given queue, creating one if needed.
+
+    Args:
+        queue (:obj:`InputSnapshot` or list, optional): An existing snapshot or
+            a list of SDL events. If not provided, the event queue is pumped.
+
+    Returns:
+        :obj:`InputSnapshot`: The input snapshot for the queue.
+
+    """
+    if isinstance(queue, InputSnapshot):
+        return queue
+    return InputSnapshot(queue)
@@ -0,0 +1,158 @@
+"""A crash-safe journal of session state, for resuming interrupted sessions.
+
+The journal is an append-only file of JSON records, one per line, written as the
+session progresses: the participant's info when setup starts, the pre-generated
+target schedule, each completed setup stage (e.g. the KVIQ and task demo), and
+the hand sequence for each block. Completed trials aren't journaled, since they
+can be read back from the database when resuming. Each record is written
+with a single unbuffered ``os.write`` call, so it reaches the OS immediately (and
+survives a crash of the experiment) without the cost of syncing to disk between
+trials. The journal is synced to disk at the start of each block.
+
+If the experiment crashes or is quit mid-session, the journal can be loaded with
+:func:`load_journal` to resume the session where it left off. Since any record
+might have been cut off mid-write, incomplete lines are ignored when loading.
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import json
+import glob
+import socket
+from datetime import datetime
+
+from klibs import P
+
+ENV_VAR = "MOTORMAPPING_RESUME"
+
+
+def journal_dir():
+    return os.path.join(P.data_dir, "journal")
+
+
+def new_journal_path(participant_id):
+    """Gets the path for a new session journal, tagged with participant and host.
+
+    """
+    host = socket.gethostname().split(".")[0]
+    stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+    name = "p{0}_{1}_{2}.jsonl".format(participant_id, host, stamp)
+    return os.path.join(journal_dir(), name)
+
+
+def resume_path():
+    """Gets the path of the journal to resume, if resuming a session.
+
+    Sessions are resumed if ``resume_session`` is True in the params file or the
+    ``MOTORMAPPING_RESUME`` environment variable is set. If the environment
+    variable is the path of a journal, that journal is resumed. Otherwise, the
+    most recent unfinished session on this computer is resumed.
+
+    Returns:
+        str: The path of the journal to resume, or None if not resuming.
+
+    """
+    env = os.environ.get(ENV_VAR, "")
+    if os.path.isfile(env):
+        return env
+    if not (getattr(P, "resume_session", False) or env not in ("", "0")):
+        return None
+    host = socket.gethostname().split(".")[0]
+    pattern = os.path.join(journal_dir(), "p*_{0}_*.jsonl".format(host))
+    for path in sorted(glob.glob(pattern), key=os.path.getmtime, reverse=True):
+        if not load_journal(path).complete:
+            return path
+    return None
+
+
+class SessionJournal(object):
+    """An append-only journal of session progress.
+
+    Args:
+        path (str): The path of the journal file (appended to if it exists).
+
+    """
+    def __init__(self, path):
+        self.path = path
+        parent = os.path.dirname(path)
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+        flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT
+        self._fd = os.open(path, flags, 0o644)
+
+    def write(self, kind, **data):
+        """Appends a record to the journal.
+
+        Args:
+            kind (str): The type of record (e.g. 'stage').
+            **data: The data for the record (must be JSON-serializable).
+
+        """
+        data['type'] = kind
+        line = json.dumps(data, separators=(",", ":")) + "\n"
+        os.write(self._fd, line.encode("utf-8"))
+
+    def sync(self):
+        """Forces all journal records to be written to disk.
+
+        """
+        os.fsync(self._fd)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class SessionState(object):
+    """The state of a session as recorded in its journal.
+
+    """
+    def __init__(self, path):
+        self.path = path
+        self.participant_id = None
+        self.condition = None
+        self.handedness = None
+        self.target_angles = None
+        self.target_dists = None
+        self.stages = set()
+        self.blocks = {}
+        self.complete = False
+
+
+def load_journal(path):
+    """Reads the state of a session from its journal.
+
+    Args:
+        path (str): The path of the journal to read.
+
+    Returns:
+        :obj:`SessionState`: The recorded state of the session.
+
+    """
+    state = SessionState(path)
+    with open(path, "rb") as f:
+        lines = f.read().split(b"\n")
+    for line in lines:
+        try:
+            rec = json.loads(line.decode("utf-8"))
+        except ValueError:
+            # Skip empty or partially-written records
+            continue
+        kind = rec.get('type')
+        if kind == "setup":
+            state.participant_id = rec['participant_id']
+            state.condition = rec['condition']
+            state.handedness = rec['handedness']
+        elif kind == "targets":
+            state.target_angles = rec['angles']
+            state.target_dists = rec['dists']
+        elif kind == "stage":
+            state.stages.add(rec['name'])
+        elif kind == "block":
+            state.blocks[rec['block']] = rec
+        elif kind == "end":
+            state.complete = True
+    return state
@@ -0,0 +1,231 @@
+"""Background computation of per-trial kinematic features from cursor trajectories.
+
+"""
+
+__author__ = "Austin Hurst"
+
+import queue
+import threading
+import traceback
+from collections import OrderedDict
+
+import numpy as np
+
+# Columns of the trial_kinematics table (other than the id/trial info columns)
+FEATURES = [
+    'samples', 'path_length', 'path_efficiency', 'peak_velocity',
+    'peak_velocity_time', 'corrections', 'final_error',
+]
+
+
+def trial_features(samples, origin, target, ppd):
+    """Computes kinematic features for a single trial's cursor trajectory.
+
+    Distances are in degrees of visual angle, velocities are in degrees per
+    second, and times are in milliseconds from target onset. If the trajectory
+    has fewer than 2 samples, all features other than the sample count are 'NA'.
+
+    Args:
+        samples (:obj:`np.ndarray`): An array of (time, x, y) cursor samples, with
+            times in ms from target onset and positions in pixels.
+        origin (tuple): The (x, y) pixel coordinates of the cursor's origin.
+        target (tuple): The (x, y) pixel coordinates of the trial's target.
+        ppd (float): The number of pixels per degree of visual angle.
+
+    Returns:
+        :obj:`OrderedDict`: The kinematic features for the trajectory.
+
+    """
+    out = OrderedDict((f, "NA") for f in FEATURES)
+    out['samples'] = len(samples)
+    if len(samples) < 2:
+        return out
+
+    t = samples[:, 0].astype(np.float64)
+    pos = samples[:, 1:3].astype(np.float64) / ppd
+    origin = np.asarray(origin, dtype=np.float64) / ppd
+    target = np.asarray(target, dtype=np.float64) / ppd
+
+    # Include the movement from the origin to the first logged sample
+    steps = np.diff(pos, axis=0, prepend=origin[np.newaxis, :])
+    dists = np.hypot(steps[:, 0], steps[:, 1])
+    path_length = dists.sum()
+    straight = np.hypot(*(pos[-1] - origin))
+
+    # Get cursor speed between samples, ignoring any duplicate timestamps
+    dt = np.diff(t) / 1000.0
+    valid = dt > 0
+    speed = np.zeros(len(dt))
+    speed[valid] = dists[1:][valid] / dt[valid]
+    peak = speed.argmax()
+
+    # Count corrective submovements as extra peaks over 20% of the maximum in the
+    # smoothed speed profile (smoothing avoids counting pixel quantization noise)
+    smoothed = np.convolve(speed, np.ones(5) / 5.0, mode='same')
+    rising = np.diff(smoothed) > 0
+    peaks = rising[:-1] & ~rising[1:]
+    big = smoothed[1:-1] > (smoothed.max() * 0.2)
+    corrections = max(0, int(np.count_nonzero(peaks & big)) - 1)
+
+    out['path_length'] = float(path_length)
+    out['path_efficiency'] = float(straight / path_length) if path_length else "NA"
+    out['peak_velocity'] = float(speed[peak])
+    out['peak_velocity_time'] = float(t[peak + 1])
+    out['corrections'] = corrections
+    out['final_error'] = float(np.hypot(*(pos[-1] - target)))
+    return out
+
+
+class KinematicsWorker(object):
+    """Computes kinematic features for finished trials on a background thread.
+
+    Trajectories are submitted with :meth:`submit` at the end of each trial, and
+    the resulting database rows are collected with :meth:`results` (e.g. during
+    trial cleanup). Database writes are left to the caller, since SQLite
+    connections can't be shared between threads.
+
+    Backpressure: the job queue holds at most `maxsize` trials. If it's full when
+    a trial is submitted, the trial is held in an overflow list on the main thread
+    and re-queued on later calls to :meth:`results`, so submitting never blocks.
+
+    Crash handling: if computing the features for a trial raises an exception, the
+    error is recorded in :attr:`failures` and the worker moves on to the next
+    trial. If the worker thread itself dies, it is restarted on the next submit
+    (up to `max_restarts` times), after which features are computed on the main
+    thread instead.
+
+    Args:
+        origin (tuple): The (x, y) pixel coordinates of the cursor's origin.
+        ppd (float): The number of pixels per degree of visual angle.
+        maxsize (int, optional): The maximum number of queued trials. Defaults
+            to 16.
+        max_restarts (int, optional): The maximum number of times to restart the
+            worker thread if it dies. Defaults to 3.
+
+    """
+    def __init__(self, origin, ppd, maxsize=16, max_restarts=3):
+        self.origin = origin
+        self.ppd = ppd
+        self.max_restarts = max_restarts
+        self.restarts = 0
+        self.failures = []
+        self._jobs = queue.Queue(maxsize)
+        self._done = queue.Queue()
+        self._overflow = []
+        self._thread = None
+        self._start()
+
+    def _start(self):
+        self._thread = threading.Thread(target=self._work, daemon=True)
+        self._thread.start()
+
+    def _process(self, job):
+        info, samples, target = job
+        try:
+            arr = np.asarray(samples, dtype=np.float64).reshape(-1, 3)
+            features = trial_features(arr, self.origin, target, self.ppd)
+        except Exception:
+            self.failures.append((info, traceback.format_exc()))
+            return
+        row = OrderedDict(info)
+        row.update(features)
+        self._done.put(row)
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            self._process(job)
+
+    @property
+    def alive(self):
+        """bool: Whether features are currently being computed in the background.
+
+        """
+        return self._thread is not None and self._thread.is_alive()
+
+    def _check_worker(self):
+        if not self.alive and self._thread is not None:
+            if self.restarts < self.max_restarts:
+                self.restarts += 1
+                self._start()
+            else:
+                self._thread = None
+
+    def _enqueue(self, job):
+        if not self.alive:
+            self._process(job)
+            return
+        try:
+            self._jobs.put_nowait(job)
+        except queue.Full:
+            self._overflow.append(job)
+
+    def submit(self, info, samples, target):
+        """Queues a finished trial's trajectory for feature computation.
+
+        Args:
+            info (dict): The trial info columns for the row (e.g. participant ID,
+                block number, and trial number).
+            samples (list): The trial's (time, x, y) cursor samples.
+            target (tuple): The (x, y) pixel coordinates of the trial's target.
+
+        """
+        self._check_worker()
+        self._enqueue((info, samples, target))
+
+    def results(self):
+        """Retrieves the rows for all trials whose features are ready.
+
+        Returns:
+            list: A list of rows (dicts) for the trial_kinematics table.
+
+        """
+        self._check_worker()
+        overflow, self._overflow = self._overflow, []
+        for job in overflow:
+            self._enqueue(job)
+        rows = []
+        while True:
+            try:
+                rows.append(self._done.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def close(self, timeout=5.0):
+        """Finishes all pending trials and stops the worker thread.
+
+        Any trials the worker hasn't started on after `timeout` seconds are
+        computed on the main thread.
+
+        Returns:
+            list: A list of rows for all remaining trials.
+
+        """
+        rows = self.results()
+        if self.alive:
+            while self._overflow:
+                self._jobs.put(self._overflow.pop(0))
+            self._jobs.put(None)
+            self._thread.join(timeout)
+        self._thread = None
+
+        # Compute anything the worker didn't get to on this thread
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                self._process(job)
+        for job in self._overflow:
+            self._process(job)
+        self._overflow = []
+        while True:
+            try:
+                rows.append(self._done.get_nowait())
+            except queue.Empty:
+                break
+        return rows
@@ -0,0 +1,151 @@
+"""A low-overhead debug overlay showing the live state of the gamepad.
+
+Rendering a multi-line message every frame can take longer than the rest of the
+trial loop combined, so :class:`GamepadOverlay` only reads the gamepad and
+updates its contents at a low, configurable rate, and redraws its cached
+surfaces on all other frames. In text mode, each line is rendered separately and
+only re-rendered when its text changes. In graphical mode, the sticks, triggers,
+and d-pad are drawn from pre-rendered shapes instead of text.
+
+"""
+
+__author__ = "Austin Hurst"
+
+from klibs import P, STROKE_INNER
+from klibs.KLTime import precise_time
+from klibs.KLGraphics import blit
+from klibs.KLGraphics import KLDraw as kld
+from klibs.KLCommunication import message
+from klibs.KLUtilities import deg_to_px
+
+from stick import AXIS_MAX, TRIGGER_MAX
+
+LINES = [
+    "Left Stick: ({0}, {1})",
+    "Right Stick: ({0}, {1})",
+    "Left Trigger: {0}",
+    "Right Trigger: {0}",
+    "D-Pad: ({0}, {1})",
+]
+
+GREY = (128, 128, 128, 255)
+WHITE = (255, 255, 255, 255)
+TRIGGER_LEVELS = 20
+
+
+class GamepadOverlay(object):
+    """Draws the current stick, trigger, and d-pad state to the bottom-left of the
+    screen.
+
+    Args:
+        rate (float, optional): The maximum number of times per second to update
+            the overlay's contents. Defaults to 5.
+        graphical (bool, optional): Whether to draw the gamepad state as shapes
+            instead of text. Defaults to False.
+
+    """
+    def __init__(self, rate=5, graphical=False):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.graphical = graphical
+        self.updates = 0
+        self.renders = 0
+        self._last_update = None
+        self._lines = [(None, None)] * len(LINES)
+        self._state = None
+        if graphical:
+            self._init_shapes()
+
+    def _init_shapes(self):
+        self.box_size = deg_to_px(1.5)
+        self.bar_w = deg_to_px(0.3)
+        pad = deg_to_px(0.3)
+        self.box = kld.Rectangle(self.box_size, stroke=[1, GREY, STROKE_INNER])
+        self.dot = kld.Ellipse(deg_to_px(0.2), fill=WHITE)
+        # Pre-render trigger bars at a fixed set of fill levels
+        self.bars = [None]
+        for i in range(1, TRIGGER_LEVELS + 1):
+            h = max(1, int(round(self.box_size * i / float(TRIGGER_LEVELS))))
+            self.bars.append(kld.Rectangle(self.bar_w, h, fill=WHITE))
+        outline = [1, GREY, STROKE_INNER]
+        self.bar_outline = kld.Rectangle(self.bar_w, self.box_size, stroke=outline)
+
+        # Lay out the overlay from the bottom-left corner of the screen
+        bottom = P.screen_y - pad - self.box_size // 2
+        x = pad + self.box_size // 2
+        self.left_loc = (x, bottom)
+        self.right_loc = (x + self.box_size + pad, bottom)
+        lt_x = self.right_loc[0] + self.box_size // 2 + pad + self.bar_w // 2
+        self.lt_loc = (lt_x, bottom)
+        self.rt_loc = (lt_x + self.bar_w + pad, bottom)
+        dpad_x = self.rt_loc[0] + self.bar_w // 2 + pad + self.box_size // 2
+        self.dpad_loc = (dpad_x, bottom)
+
+    def update(self, gamepad, now=None):
+        """Reads the latest gamepad state, if the overlay is due for an update.
+
+        Args:
+            gamepad (:obj:`GameController`): The gamepad to read from.
+            now (float, optional): The current time. Defaults to the current time.
+
+        Returns:
+            bool: True if the overlay was updated, otherwise False.
+
+        """
+        if now is None:
+            now = precise_time()
+        if self._last_update is not None:
+            if now - self._last_update < self.interval:
+                return False
+        self._last_update = now
+        self.updates += 1
+        self._state = (
+            gamepad.left_stick(), gamepad.right_stick(), gamepad.left_trigger(),
+            gamepad.right_trigger(), gamepad.dpad(),
+        )
+        if not self.graphical:
+            self._update_text()
+        return True
+
+    def _update_text(self):
+        ls, rs, lt, rt, dpad = self._state
+        values = [ls, rs, (lt,), (rt,), dpad]
+        for i, (fmt, vals) in enumerate(zip(LINES, values)):
+            txt = fmt.format(*vals)
+            if txt != self._lines[i][0]:
+                # Only re-render lines whose text has changed
+                self._lines[i] = (txt, message(txt, style='debug'))
+                self.renders += 1
+
+    def _stick_pos(self, loc, x, y):
+        half = self.box_size / 2.0
+        return (loc[0] + int(x / AXIS_MAX * half), loc[1] + int(y / AXIS_MAX * half))
+
+    def _draw_bar(self, loc, value):
+        blit(self.bar_outline, 5, loc)
+        level = int(round(max(0, value) / float(TRIGGER_MAX) * TRIGGER_LEVELS))
+        if level > 0:
+            bar = self.bars[min(level, TRIGGER_LEVELS)]
+            blit(bar, 2, (loc[0], loc[1] + self.box_size // 2))
+
+    def draw(self):
+        """Draws the overlay using the most recent gamepad state.
+
+        """
+        if self._state is None:
+            return
+        if self.graphical:
+            ls, rs, lt, rt, dpad = self._state
+            for loc, (x, y) in [(self.left_loc, ls), (self.right_loc, rs)]:
+                blit(self.box, 5, loc)
+                blit(self.dot, 5, self._stick_pos(loc, x, y))
+            self._draw_bar(self.lt_loc, lt)
+            self._draw_bar(self.rt_loc, rt)
+            dpad_x, dpad_y = (dpad[0] * AXIS_MAX, dpad[1] * AXIS_MAX)
+            blit(self.box, 5, self.dpad_loc)
+            blit(self.dot, 5, self._stick_pos(self.dpad_loc, dpad_x, dpad_y))
+        else:
+            # Stack the lines upwards from the bottom of the screen
+            y = P.screen_y
+            for txt, surf in reversed(self._lines):
+                blit(surf, 1, (0, y))
+                y -= surf.height
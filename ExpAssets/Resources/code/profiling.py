@@ -0,0 +1,174 @@
+"""Optional per-phase profiling of the experiment for diagnosing slow stations.
+
+Profiling is enabled by setting ``profile = True`` in the project's params file or
+by setting the ``MOTORMAPPING_PROFILE`` environment variable (e.g. to 1). When
+enabled, each method decorated with :func:`profiled` is run under cProfile, with
+separate profiles kept for each named section (e.g. setup, the KVIQ, each block,
+and the trials of each phase). At the end of the session, the profile for each
+section and a merged summary are written to ``profiles`` in the data folder.
+
+When disabled, the only overhead is a single attribute check per decorated call.
+
+"""
+
+__author__ = "Austin Hurst"
+
+import io
+import os
+import atexit
+import socket
+import pstats
+import cProfile
+from datetime import datetime
+from functools import wraps
+from collections import OrderedDict
+
+from klibs import P
+
+ENV_VAR = "MOTORMAPPING_PROFILE"
+
+
+def _profiling_requested():
+    env = os.environ.get(ENV_VAR, "")
+    if env and env.lower() not in ("0", "false", "no"):
+        return True
+    return bool(getattr(P, "profile", False))
+
+
+class SessionProfiler(object):
+    """Collects separate cProfile profiles for each section of a session.
+
+    Sections can be nested (e.g. the KVIQ runs during setup): while a nested
+    section is being profiled, its parent's profiler is paused so that the time
+    is only counted once.
+
+    """
+    def __init__(self):
+        self._enabled = None
+        self.profiles = OrderedDict()
+        self._stack = []
+        self._saved = False
+
+    @property
+    def enabled(self):
+        """bool: Whether profiling has been enabled for the session.
+
+        """
+        if self._enabled is None:
+            self._enabled = _profiling_requested()
+            if self._enabled:
+                atexit.register(self.save)
+        return self._enabled
+
+    def start(self, name):
+        """Starts (or resumes) profiling a named section of the session.
+
+        Args:
+            name (str): The name of the section to profile.
+
+        """
+        if self._stack:
+            self._stack[-1].disable()
+        if name not in self.profiles:
+            self.profiles[name] = cProfile.Profile()
+        prof = self.profiles[name]
+        self._stack.append(prof)
+        prof.enable()
+
+    def stop(self):
+        """Stops profiling the current section, resuming its parent (if any).
+
+        """
+        self._stack.pop().disable()
+        if self._stack:
+            self._stack[-1].enable()
+
+    def _tag(self):
+        pid = getattr(P, "participant_id", None)
+        host = socket.gethostname().split(".")[0]
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M")
+        return "p{0}_{1}_{2}".format(pid, host, stamp)
+
+    def summary(self):
+        """Summarizes the time spent in each section and the slowest functions.
+
+        Returns:
+            str: A human-readable summary of all recorded profiles.
+
+        """
+        out = io.StringIO()
+        out.write("Time per section:\n")
+        merged = None
+        for name, prof in self.profiles.items():
+            stats = pstats.Stats(prof, stream=out)
+            out.write(" - {0}: {1:.3f} s\n".format(name, stats.total_tt))
+            if merged is None:
+                merged = stats
+            else:
+                merged.add(stats)
+        if merged is not None:
+            out.write("\nAll sections (sorted by cumulative time):\n")
+            merged.sort_stats("cumulative").print_stats(50)
+        return out.getvalue()
+
+    def save(self, outdir=None):
+        """Writes each section's profile and a merged summary to disk.
+
+        Profiles are saved in a format readable by :mod:`pstats` (or tools like
+        SnakeViz), and are tagged with the participant ID and hostname. This is
+        only done once per session, and does nothing if profiling is disabled.
+
+        Args:
+            outdir (str, optional): The folder in which to save the profiles.
+                Defaults to a ``profiles`` subfolder of the project data folder.
+
+        Returns:
+            str: The path of the summary file, or None if nothing was saved.
+
+        """
+        if self._saved or not self.profiles:
+            return None
+        while self._stack:
+            self.stop()
+        if not outdir:
+            outdir = os.path.join(P.data_dir, "profiles")
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+
+        tag = self._tag()
+        for name, prof in self.profiles.items():
+            prof.dump_stats(os.path.join(outdir, "{0}_{1}.prof".format(tag, name)))
+        summary_path = os.path.join(outdir, "{0}_summary.txt".format(tag))
+        with io.open(summary_path, "w", encoding="utf-8") as f:
+            f.write(self.summary())
+        self._saved = True
+        return summary_path
+
+
+def profiled(section):
+    """Decorates a method so that it's profiled when profiling is enabled.
+
+    The section name is formatted with the method's ``self`` and the klibs
+    params object, so ``"block_{P.block_number}"`` gives each block its own
+    profile and ``"trials_{self.phase}"`` pools the trials for each phase.
+
+    Args:
+        section (str): A format string for the name of the section to profile.
+
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not profiler.enabled:
+                return func(self, *args, **kwargs)
+            profiler.start(section.format(self=self, P=P))
+            try:
+                return func(self, *args, **kwargs)
+            finally:
+                profiler.stop()
+        return wrapper
+    return decorator
+
+
+# Global session profiler
+profiler = SessionProfiler()
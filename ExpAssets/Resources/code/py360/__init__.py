@@ -1,3 +1,11 @@
 from .constants import *
 from .parsing import parse_buttons
-from .controller import get_controllers, Controller360
+
+
+def __getattr__(name):
+    # Defer importing pyusb until the USB backend is actually needed, since it's
+    # only used as a fallback on systems without native 360 controller support
+    if name in ('get_controllers', 'Controller360'):
+        from . import controller
+        return getattr(controller, name)
+    raise AttributeError("module 'py360' has no attribute '{0}'".format(name))
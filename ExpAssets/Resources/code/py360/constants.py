@@ -11,6 +11,7 @@ PACKET_STRUCT = '<HBBhhhh'
 VALID_IDS = {
     '1118:654': "Xbox 360 Wired Controller",
 }
+VALID_USB_IDS = [tuple(int(i) for i in usb_id.split(':')) for usb_id in VALID_IDS]
 
 # Controller buttons
 BUTTON_UP = 0
@@ -1,4 +1,5 @@
 import os
+import errno
 
 import usb
 import usb.backend.libusb1
@@ -15,14 +16,23 @@ except ImportError:
 
 
 
-def get_controllers():
-    gamepads = []
-    devices = usb.core.find(find_all=True)
-    for d in devices:
-        usb_id = '{0}:{1}'.format(d.idVendor, d.idProduct)
-        if usb_id in VALID_IDS.keys():
-            gamepads.append(d)
-    return gamepads
+# Cached results of the last USB bus scan
+_found = None
+
+
+def get_controllers(refresh=False):
+    # Only scan the bus if we haven't already (or if explicitly asked to), and let
+    # libusb filter by vendor/product ID instead of checking every device ourselves
+    global _found
+    if _found is None or refresh:
+        gamepads = []
+        for vendor_id, product_id in VALID_USB_IDS:
+            devices = usb.core.find(
+                find_all=True, idVendor=vendor_id, idProduct=product_id
+            )
+            gamepads += list(devices)
+        _found = gamepads
+    return list(_found)
 
 
 
@@ -35,6 +45,7 @@ class Controller360(object):
         
         self._data = []
         self._events = []
+        self.connected = True
         self._last_data = InputPacket(0, 0, 0, 0, 0, 0, 0)
 
         usb.util.claim_interface(self._dev, 0)
@@ -65,7 +76,9 @@ class Controller360(object):
             try:
                 data = self._pad_in.read(32, timeout=5)
                 break
-            except usb.core.USBError:
+            except usb.core.USBError as e:
+                if e.errno == errno.ENODEV:
+                    self.connected = False
                 break
         if data is not None:
             new = bytearray(data)
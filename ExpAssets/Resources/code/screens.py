@@ -0,0 +1,283 @@
+__author__ = "Austin Hurst"
+
+import threading
+from collections import OrderedDict
+
+from klibs import P
+from klibs.KLTime import precise_time
+from klibs.KLGraphics import fill, blit, flip, NumpySurface
+
+from timing import startup
+
+# Text rendering via SDL_ttf isn't thread-safe, so any code that renders text while
+# the screen compiler is running should hold this lock while it does.
+render_lock = threading.RLock()
+
+
+def compose_screen(layers):
+    """Composites a set of text and stimulus layers into a single full-screen surface.
+
+    Each layer is given as a ``(img, registration, location)`` tuple, in the same
+    format as the arguments for :func:`klibs.KLGraphics.blit`. Layers are drawn in
+    order, so later layers will appear on top of earlier ones.
+
+    Args:
+        layers (list): A list of ``(img, registration, location)`` layer tuples.
+
+    Returns:
+        :obj:`NumpySurface`: A transparent screen-sized surface containing all layers.
+
+    """
+    surf = NumpySurface(width=P.screen_x, height=P.screen_y)
+    for img, reg, loc in layers:
+        surf.blit(img, reg, loc)
+    return surf
+
+
+def _layer_bounds(img, reg, loc):
+    # Gets the top-left corner and size of a layer given its registration
+    w = getattr(img, 'surface_width', None) or img.width
+    h = getattr(img, 'surface_height', None) or img.height
+    x_off = {7: 0, 4: 0, 1: 0, 8: w / 2.0, 5: w / 2.0, 2: w / 2.0}.get(reg, w)
+    y_off = {7: 0, 8: 0, 9: 0, 4: h / 2.0, 5: h / 2.0, 6: h / 2.0}.get(reg, h)
+    x1, y1 = (int(loc[0] - x_off), int(loc[1] - y_off))
+    return (x1, y1, x1 + int(w) + 1, y1 + int(h) + 1)
+
+
+class SceneLayer(object):
+    """A set of static stimulus layers that are composited once and then drawn
+    with a single blit.
+
+    Layers are given as ``(img, registration, location)`` tuples (the same format
+    as for :func:`compose_screen`) and are composited into a single surface
+    the first time the scene is drawn after it changes. The composite is cropped
+    to the area covered by its layers, so drawing the scene only uploads the
+    pixels that are actually used instead of a full screen of transparency.
+
+    Note that klibs uploads a new texture for every blit, so the composite is
+    re-uploaded each time the scene is drawn. This saves time when the layers
+    overlap or are close together, but layers that are far apart (e.g. a small
+    target several degrees from fixation) should be blitted separately, since
+    the bounding box of the composite will be mostly empty pixels.
+
+    Args:
+        layers (list, optional): A list of ``(img, registration, location)``
+            layer tuples to initialize the scene with.
+
+    """
+    def __init__(self, layers=None):
+        self._layers = []
+        self._rendered = None
+        self._origin = None
+        self.composites = 0
+        if layers:
+            self.set(layers)
+
+    def set(self, layers):
+        """Replaces all layers in the scene.
+
+        Args:
+            layers (list): A list of ``(img, registration, location)`` tuples.
+
+        """
+        self._layers = list(layers)
+        self._rendered = None
+
+    def add(self, img, registration, location):
+        """Adds a layer to the top of the scene.
+
+        Args:
+            img: The stimulus to add (e.g. a Drawbject or NumpySurface).
+            registration (int): The registration point of the stimulus.
+            location (tuple): The (x, y) screen location of the stimulus.
+
+        """
+        self._layers.append((img, registration, location))
+        self._rendered = None
+
+    def _composite(self):
+        bounds = [_layer_bounds(*layer) for layer in self._layers]
+        x1 = min(b[0] for b in bounds)
+        y1 = min(b[1] for b in bounds)
+        x2 = max(b[2] for b in bounds)
+        y2 = max(b[3] for b in bounds)
+        surf = NumpySurface(width=x2 - x1, height=y2 - y1)
+        for img, reg, loc in self._layers:
+            surf.blit(img, reg, (loc[0] - x1, loc[1] - y1))
+        self._rendered = surf.render()
+        self._origin = (x1, y1)
+        self.composites += 1
+
+    @property
+    def area(self):
+        """int: The number of pixels uploaded each time the scene is drawn.
+
+        """
+        if not len(self._layers):
+            return 0
+        if self._rendered is None:
+            self._composite()
+        return self._rendered.shape[0] * self._rendered.shape[1]
+
+    def draw(self):
+        """Draws the scene to the screen, compositing it first if it's changed.
+
+        """
+        if not len(self._layers):
+            return
+        if self._rendered is None:
+            self._composite()
+        blit(self._rendered, 7, self._origin)
+
+
+class _Screen(object):
+
+    def __init__(self, builder):
+        self.builder = builder
+        self.surface = None
+        self.error = None
+        self.ready = threading.Event()
+
+
+class ScreenCache(object):
+    """A cache of static screens that are compiled in the background.
+
+    Screens are registered with a unique key and a function that builds the screen
+    (e.g. using :func:`compose_screen`). Once all screens have been added, calling
+    :meth:`compile` renders them in order on a worker thread so they're ready to
+    blit by the time they're needed. If a screen is requested before the worker
+    has rendered it, it is rendered on demand instead.
+
+    Timing info for each screen transition is recorded so that the latencies with
+    and without pre-rendering can be compared (see :meth:`report`).
+
+    Args:
+        enabled (bool, optional): Whether background compilation should be enabled.
+            If False, all screens will be rendered on demand. Defaults to
+            ``P.prerender_screens``.
+
+    """
+    def __init__(self, enabled=None):
+        self.enabled = P.prerender_screens if enabled is None else enabled
+        self._screens = OrderedDict()
+        self._current = None
+        self._thread = None
+        self._created = precise_time()
+        self.first_screen = None
+        self.transitions = []
+        self.on_demand = 0
+
+    def add(self, key, builder):
+        """Registers a screen to be compiled.
+
+        Args:
+            key: A unique hashable key with which to identify the screen.
+            builder (callable): A function that takes no arguments and returns the
+                rendered screen.
+
+        """
+        if key in self._screens:
+            raise ValueError("A screen with the key '{0}' already exists.".format(key))
+        self._screens[key] = _Screen(builder)
+
+    def compile(self):
+        """Starts rendering all registered screens on a background thread.
+
+        If background compilation is disabled, this does nothing.
+
+        """
+        if not self.enabled or self._thread:
+            return
+        self._thread = threading.Thread(target=self._compile, daemon=True)
+        self._thread.start()
+
+    def _compile(self):
+        for key, screen in list(self._screens.items()):
+            with render_lock:
+                if screen.ready.is_set():
+                    continue
+                self._current = key
+                try:
+                    screen.surface = screen.builder()
+                except Exception as e:
+                    # Keep the error so get() can raise it instead of waiting forever
+                    screen.error = e
+                screen.ready.set()
+        self._current = None
+
+    def join(self, timeout=None):
+        """Waits for the background compilation thread to finish (if running).
+
+        """
+        if self._thread:
+            self._thread.join(timeout)
+
+    def get(self, key):
+        """Retrieves a rendered screen, rendering it on demand if not ready yet.
+
+        If the screen's builder raised an exception on the background thread, the
+        same exception is raised here.
+
+        Args:
+            key: The key of the screen to retrieve.
+
+        Returns:
+            :obj:`NumpySurface`: The rendered screen.
+
+        """
+        screen = self._screens[key]
+        if not screen.ready.is_set():
+            if self._current == key:
+                # If the worker is rendering this screen right now, wait for it
+                screen.ready.wait()
+            else:
+                with render_lock:
+                    if not screen.ready.is_set():
+                        screen.surface = screen.builder()
+                        screen.ready.set()
+                        self.on_demand += 1
+        if screen.error is not None:
+            raise screen.error
+        return screen.surface
+
+    def show(self, key):
+        """Draws a rendered screen to the display, rendering it first if needed.
+
+        Args:
+            key: The key of the screen to show.
+
+        """
+        start = precise_time()
+        surf = self.get(key)
+        fill()
+        blit(surf, 5, P.screen_c)
+        flip()
+        end = precise_time()
+        if self.first_screen is None:
+            self.first_screen = end - self._created
+            startup.mark("first screen")
+        self.transitions.append((key, end - start))
+
+    def report(self):
+        """Summarizes the screen transition latencies recorded so far.
+
+        Returns:
+            str: A human-readable summary of the recorded screen timings.
+
+        """
+        mode = "pre-rendered" if self.enabled else "on demand"
+        lines = ["Screen timing ({0}, {1} rendered on demand):".format(
+            mode, self.on_demand
+        )]
+        if self.first_screen is not None:
+            lines.append(
+                " - time to first screen: {0:.1f} ms".format(self.first_screen * 1000)
+            )
+        if len(self.transitions):
+            latencies = [t * 1000 for key, t in self.transitions]
+            lines.append(
+                " - transitions: n = {0}, mean = {1:.2f} ms, max = {2:.2f} ms".format(
+                    len(latencies), sum(latencies) / len(latencies), max(latencies)
+                )
+            )
+        return "\n".join(lines)
@@ -1,36 +1,82 @@
 # Functions that should be added to PySDL eventually
-from ctypes import c_int, byref
 import sdl2
 
+from klibs.KLTime import precise_time
 
-def get_key_state(key):
-    """Checks the current state (pressed or released) of a given keyboard key.
 
-    This function checks whether a given key on the keyboard is currently
-    pressed or released. Although keypress handling in SDL is usually done by
-    checking for keydown and keyup events in the event queue, there are cases
-    where it's imporant to check what the state of a key is *right now* instead
-    of waiting for an event. 
+def wait_for_event(timeout=50):
+    """Sleeps until there are new events in the SDL event queue.
+
+    Unlike polling the queue in a loop, this lets the process sleep (using
+    essentially no CPU) until input arrives. Events are left in the queue, so
+    they can be retrieved afterwards as usual (e.g. with ``pump(True)``).
 
     Args:
-        key (int or str): The name (or SDL scancode) of the key to check.
+        timeout (int, optional): The maximum time (in ms) to wait for an event.
+            Defaults to 50.
 
     Returns:
-        int: 1 if the key is currently pressed, otherwise 0.
+        bool: True if there are new events in the queue, otherwise False.
+
+    """
+    return sdl2.SDL_WaitEventTimeout(None, int(timeout)) == 1
+
+
+class EventClock(object):
+    """Converts SDL event timestamps to the experiment clock.
+
+    SDL stamps each input event with the time (in ms since SDL was initialized)
+    that it was added to the queue, which is more precise than the time the
+    event is pumped from the queue. To convert these timestamps to the
+    experiment clock (``precise_time``), the offset between the two clocks
+    is estimated by reading both clocks in quick succession several times and
+    using the reading that took the least time.
+
+    Since SDL event timestamps have millisecond resolution, the resolution of
+    converted timestamps is 1 ms plus the uncertainty of the clock offset.
+
+    Args:
+        samples (int, optional): The number of clock readings to use when
+            estimating the offset. Defaults to 20.
 
     """
-    # If key given as string, get the corresponding scancode
-    if isinstance(key, str):
-        scancode = sdl2.SDL_GetScancodeFromName(key.encode("utf-8"))
-        if scancode == sdl2.SDL_SCANCODE_UNKNOWN:
-            e = "'{0}' is not a valid name for an SDL scancode."
-            raise ValueError(e.format(key))
-    else:
-        scancode = key
-    # Check for and return the current key state
-    sdl2.SDL_PumpEvents()
-    numkeys = c_int(0)
-    keys = sdl2.SDL_GetKeyboardState(byref(numkeys))
-    if scancode <= numkeys.value:
-        return keys[scancode]
-    return 0
+    def __init__(self, samples=20):
+        self.samples = samples
+        self.offset = None
+        self.uncertainty = None
+        self.sync()
+
+    def sync(self):
+        """Re-estimates the offset between the SDL and experiment clocks.
+
+        """
+        best = None
+        for i in range(self.samples):
+            t0 = precise_time()
+            ticks = sdl2.SDL_GetTicks()
+            t1 = precise_time()
+            if best is None or (t1 - t0) < best[0]:
+                best = (t1 - t0, (t0 + t1) / 2.0, ticks)
+        span, midpoint, ticks = best
+        # SDL ticks are truncated to the ms, so the true time is ~0.5 ms later
+        self.offset = midpoint - (ticks + 0.5) / 1000.0
+        self.uncertainty = span / 2.0
+
+    def to_time(self, timestamp):
+        """Converts an SDL event timestamp to the experiment clock.
+
+        Args:
+            timestamp (int): The timestamp of an SDL event (e.g. ``e.key.timestamp``).
+
+        Returns:
+            float: The time of the event (in seconds) on the experiment clock.
+
+        """
+        return timestamp / 1000.0 + self.offset
+
+    @property
+    def resolution(self):
+        """float: The resolution (in seconds) of converted event timestamps.
+
+        """
+        return 0.001 + self.uncertainty
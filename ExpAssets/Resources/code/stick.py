@@ -0,0 +1,100 @@
+__author__ = "Austin Hurst"
+
+from math import sqrt
+from ctypes import c_int, byref
+
+# Define constants for working with gamepad data
+AXIS_MAX = 32768
+TRIGGER_MAX = 32767
+
+
+class CursorMapper(object):
+    """Maps raw joystick axis values directly to cursor coordinates on the screen.
+
+    Stick amplitudes within the deadzone are treated as zero, and amplitudes
+    outside it are rescaled so that the edge of the deadzone maps to 0 and the
+    maximum stick amplitude maps to 1 (capping amplitudes over AXIS_MAX). The
+    current input mapping and the maximum cursor distance are applied in the same
+    step, without any trig or intermediate coordinate tuples. Since it's called
+    at least once per frame, everything that doesn't change between frames is
+    precomputed.
+
+    Args:
+        origin (tuple): The (x, y) screen coordinates of the cursor's origin.
+        max_dist (int): The distance (in pixels) of the cursor from the origin when
+            the stick is fully extended.
+        deadzone (float, optional): The proportion of the stick's range to treat
+            as zero. Defaults to 0.2.
+
+    """
+    def __init__(self, origin, max_dist, deadzone=0.2):
+        self.origin = (int(origin[0]), int(origin[1]))
+        self.max_dist = max_dist
+        self.deadzone = deadzone
+        self._range = 1.0 - deadzone
+        self._mod_x = 1
+        self._mod_y = 1
+
+    def set_mapping(self, mapping):
+        """Sets the x/y axis multipliers (e.g. from ``P.input_mappings``) to use.
+
+        """
+        self._mod_x, self._mod_y = mapping
+
+    def magnitude(self, x, y):
+        """Gets the rescaled amplitude (0 to 1) of a given set of raw axis values.
+
+        """
+        amplitude = sqrt(x * x + y * y) / AXIS_MAX
+        if amplitude < self.deadzone:
+            return 0.0
+        return (min(1.0, amplitude) - self.deadzone) / self._range
+
+    def position(self, x, y):
+        """Gets the screen coordinates of the cursor for a given set of axis values.
+
+        Args:
+            x (int): The raw x-axis value of the stick.
+            y (int): The raw y-axis value of the stick.
+
+        Returns:
+            tuple: The (x, y) pixel coordinates of the cursor.
+
+        """
+        dist = sqrt(x * x + y * y)
+        amplitude = dist / AXIS_MAX
+        if amplitude < self.deadzone:
+            return self.origin
+        if amplitude > 1.0:
+            amplitude = 1.0
+        amp_new = (amplitude - self.deadzone) / self._range
+        return (
+            self.origin[0] + int(amp_new * (x / dist) * self.max_dist * self._mod_x),
+            self.origin[1] + int(amp_new * (y / dist) * self.max_dist * self._mod_y),
+        )
+
+
+class MouseState(object):
+    """Reads the current mouse position and button state into reusable buffers.
+
+    """
+    def __init__(self):
+        # NOTE: SDL is only imported here so that the stick mapping functions can
+        # be used (and tested) without SDL2 installed
+        from sdl2 import SDL_GetMouseState
+        self._get_state = SDL_GetMouseState
+        self._x = c_int(0)
+        self._y = c_int(0)
+        self._x_ref = byref(self._x)
+        self._y_ref = byref(self._y)
+        self.x = 0
+        self.y = 0
+        self.buttons = 0
+
+    def update(self):
+        """Updates the stored position and button state of the mouse.
+
+        """
+        self.buttons = self._get_state(self._x_ref, self._y_ref)
+        self.x = self._x.value
+        self.y = self._y.value
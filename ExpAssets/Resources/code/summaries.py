@@ -0,0 +1,178 @@
+"""Per-participant summaries of task performance in bins of consecutive trials.
+
+Each row of the ``trial_bins`` table summarizes the trials for a given participant,
+block, and hand (dominant or non-dominant) within a bin of ``BIN_SIZE`` trials
+(e.g. trials 1-20 of a block are bin 1). Errors are further counted by code in the
+``trial_bin_errors`` table. Since trials with errors are recycled by the task
+(and so never reach the ``trials`` table), errors are counted from the
+``trial_errors`` table, along with any trials that have a recorded error code.
+
+During a session, bins are summarized and written as soon as they're complete
+(see :class:`BinSummarizer`). Summaries for existing data can be (re)built with
+``tools/rebuild_summaries.py``.
+
+"""
+
+__author__ = "Austin Hurst"
+
+from collections import OrderedDict
+
+BIN_SIZE = 20
+RT_COLS = ['movement_rt', 'contact_rt', 'response_rt']
+
+
+def as_float(value):
+    """Converts a trial data value to a float, returning None if it's missing.
+
+    """
+    if value is None or value == "NA":
+        return None
+    return float(value)
+
+
+def is_dominant(value):
+    """Converts a stored 'dominant' value to an int (1 for dominant, 0 for not).
+
+    """
+    if isinstance(value, str):
+        return int(value.lower() in ("1", "true"))
+    return int(bool(value))
+
+
+def trial_bin(trial_num):
+    """Gets the (1-based) bin number for a given trial number.
+
+    """
+    return (int(trial_num) - 1) // BIN_SIZE + 1
+
+
+def _median(values):
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def summarize_bin(participant_id, block_num, dominant, bin_num, trials, errors=None):
+    """Summarizes the trials for a given participant, block, hand, and bin.
+
+    Args:
+        participant_id (int): The database ID of the participant.
+        block_num (int): The block number of the trials.
+        dominant (int): 1 if the trials were for the dominant hand, otherwise 0.
+        bin_num (int): The bin number of the trials.
+        trials (list): A list of trial data dicts, each with values for the
+            'movement_rt', 'contact_rt', 'response_rt', and 'err' columns.
+        errors (list, optional): The error codes of any recycled trials within
+            the bin.
+
+    Returns:
+        tuple: The row for the ``trial_bins`` table, and a list of rows for the
+        ``trial_bin_errors`` table.
+
+    """
+    row = OrderedDict([
+        ('participant_id', participant_id),
+        ('block_num', block_num),
+        ('dominant', dominant),
+        ('bin', bin_num),
+        ('trials', len(trials)),
+        ('timeouts', 0),
+        ('errors', 0),
+    ])
+    err_counts = OrderedDict()
+    for err in errors or []:
+        err_counts[err] = err_counts.get(err, 0) + 1
+    for t in trials:
+        if t['err'] != "NA":
+            err_counts[t['err']] = err_counts.get(t['err'], 0) + 1
+        elif as_float(t['response_rt']) is None:
+            row['timeouts'] += 1
+    row['errors'] = sum(err_counts.values())
+
+    for col in RT_COLS:
+        rts = [as_float(t[col]) for t in trials]
+        rts = [rt for rt in rts if rt is not None]
+        name = col.replace("_rt", "")
+        row['mean_' + name] = sum(rts) / len(rts) if len(rts) else "NA"
+        row['median_' + name] = _median(rts) if len(rts) else "NA"
+
+    err_rows = []
+    for err, count in err_counts.items():
+        err_rows.append(OrderedDict([
+            ('participant_id', participant_id),
+            ('block_num', block_num),
+            ('dominant', dominant),
+            ('bin', bin_num),
+            ('err', err),
+            ('count', count),
+        ]))
+    return (row, err_rows)
+
+
+class BinSummarizer(object):
+    """Summarizes a participant's trials in bins as they're completed.
+
+    Args:
+        participant_id (int): The database ID of the participant.
+
+    """
+    def __init__(self, participant_id):
+        self.participant_id = participant_id
+        self._block = None
+        self._trials = {}
+        self._errors = {}
+
+    def _set_block(self, block_num):
+        if block_num != self._block:
+            self._block = block_num
+            self._trials = {}
+            self._errors = {}
+
+    def add_error(self, block_num, dominant, err):
+        """Counts an error for a recycled trial towards the current bin.
+
+        Args:
+            block_num (int): The block number of the recycled trial.
+            dominant (bool): Whether the trial was for the dominant hand.
+            err (str): The error code for the trial (e.g. 'too_soon').
+
+        """
+        self._set_block(block_num)
+        self._errors.setdefault(is_dominant(dominant), []).append(err)
+
+    def add(self, trial, block_trials):
+        """Adds a completed trial, returning the summaries for any finished bins.
+
+        A bin is finished once its last trial has been added, or once the last
+        trial of the block has been added (for blocks with partial bins).
+
+        Args:
+            trial (dict): The trial's data, as written to the trials table.
+            block_trials (int): The total number of trials in the current block.
+
+        Returns:
+            tuple: A list of rows for the ``trial_bins`` table and a list of rows
+            for the ``trial_bin_errors`` table.
+
+        """
+        self._set_block(trial['block_num'])
+        dominant = is_dominant(trial['dominant'])
+        self._trials.setdefault(dominant, []).append(trial)
+
+        rows, err_rows = ([], [])
+        trial_num = int(trial['trial_num'])
+        if trial_num % BIN_SIZE == 0 or trial_num == block_trials:
+            bin_num = trial_bin(trial_num)
+            hands = set(self._trials.keys()) | set(self._errors.keys())
+            for hand in sorted(hands, reverse=True):
+                row, errs = summarize_bin(
+                    self.participant_id, self._block, hand, bin_num,
+                    self._trials.get(hand, []), self._errors.get(hand, [])
+                )
+                rows.append(row)
+                err_rows += errs
+            self._trials = {}
+            self._errors = {}
+        return (rows, err_rows)
@@ -0,0 +1,156 @@
+"""Non-blocking live telemetry for monitoring a session from another process.
+
+Frames are sent as fixed-size binary datagrams over a local UNIX socket. If no
+reader is listening (or the reader isn't keeping up), frames are simply dropped
+so that publishing never blocks the trial loop. See ``tools/telemetry_reader.py``
+for a simple reader.
+
+"""
+
+__author__ = "Austin Hurst"
+
+import time
+import errno
+import socket
+import struct
+
+# Frame layout: timestamp, block, trial, phase, cursor x/y, triggers (in units of
+# 1/1000), number of errors so far in the block, and code of the most recent error
+FRAME = struct.Struct("<dHHBhhhhHB")
+
+PHASES = ["practice", "training", "test"]
+ERRORS = [
+    "NA", "too_soon", "too_slow", "start_triggers", "stick_mi", "stick_cc",
+    "wrong_hand", "wrong_hand_nd", "controller",
+]
+
+
+def decode(data):
+    """Decodes a telemetry frame into a dict.
+
+    Args:
+        data (bytes): The raw frame data.
+
+    Returns:
+        dict: The decoded frame.
+
+    """
+    t, block, trial, phase, x, y, lt, rt, n_err, err = FRAME.unpack(data)
+    return {
+        'time': t, 'block': block, 'trial': trial, 'phase': PHASES[phase],
+        'cursor': (x, y), 'triggers': (lt / 1000.0, rt / 1000.0),
+        'errors': n_err, 'last_error': ERRORS[err],
+    }
+
+
+class TelemetryPublisher(object):
+    """Publishes compact per-frame telemetry to a local reader without blocking.
+
+    If the reader isn't running, the publisher retries connecting at most once
+    per `retry_interval` seconds, dropping all frames in the meantime. The time
+    spent in :meth:`publish` is tracked so that its per-frame overhead can be
+    checked with :meth:`overhead`.
+
+    Args:
+        path (str): The path of the reader's UNIX socket.
+        retry_interval (float, optional): The minimum interval (in seconds) between
+            attempts to connect to the reader. Defaults to 1.0.
+
+    """
+    def __init__(self, path, retry_interval=1.0):
+        self.path = path
+        self.retry_interval = retry_interval
+        self.sent = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_error = 0
+        self._sock = None
+        self._connected = False
+        self._last_attempt = 0
+        self._buf = bytearray(FRAME.size)
+        self._calls = 0
+        self._time = 0.0
+        if hasattr(socket, "AF_UNIX"):
+            self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            self._sock.setblocking(False)
+
+    def _connect(self, now):
+        self._last_attempt = now
+        try:
+            self._sock.connect(self.path)
+            self._connected = True
+        except OSError:
+            self._connected = False
+
+    def start_block(self):
+        """Resets the error count and most recent error for a new block.
+
+        """
+        self.errors = 0
+        self.last_error = 0
+
+    def log_error(self, err):
+        """Records a trial error, to be included in all subsequent frames.
+
+        Args:
+            err (str): The name of the error (e.g. 'too_soon').
+
+        """
+        self.errors += 1
+        self.last_error = ERRORS.index(err) if err in ERRORS else 0
+
+    def publish(self, block, trial, phase, cursor, triggers):
+        """Sends a telemetry frame to the reader, dropping it if it can't be sent.
+
+        Args:
+            block (int): The current block number.
+            trial (int): The current trial number.
+            phase (str): The current phase of the experiment.
+            cursor (tuple): The current (x, y) pixel coordinates of the cursor.
+            triggers (tuple): The current (left, right) trigger values, from 0 to 1.
+
+        """
+        start = time.perf_counter()
+        self._calls += 1
+        if not self._sock:
+            return
+        if not self._connected:
+            if start - self._last_attempt > self.retry_interval:
+                self._connect(start)
+            if not self._connected:
+                self.dropped += 1
+                self._time += time.perf_counter() - start
+                return
+        FRAME.pack_into(
+            self._buf, 0, start, block, trial, PHASES.index(phase),
+            cursor[0], cursor[1], int(triggers[0] * 1000), int(triggers[1] * 1000),
+            self.errors, self.last_error
+        )
+        try:
+            self._sock.send(self._buf)
+            self.sent += 1
+        except OSError as e:
+            self.dropped += 1
+            if e.errno != errno.EAGAIN:
+                # Reader has gone away, so try reconnecting later
+                self._connected = False
+        self._time += time.perf_counter() - start
+
+    def overhead(self):
+        """Gets the mean time spent per call to :meth:`publish`.
+
+        Returns:
+            float: The mean per-frame publishing overhead (in microseconds).
+
+        """
+        if not self._calls:
+            return 0.0
+        return (self._time / self._calls) * 1e6
+
+    def close(self):
+        """Closes the publisher's socket.
+
+        """
+        if self._sock:
+            self._sock.close()
+            self._sock = None
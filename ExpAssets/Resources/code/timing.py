@@ -0,0 +1,343 @@
+__author__ = "Austin Hurst"
+
+import time
+from array import array
+from contextlib import contextmanager
+from collections import OrderedDict
+
+
+class StartupTimer(object):
+    """A simple timer for breaking down how long each stage of startup takes.
+
+    Times are measured relative to when the timer was created, which should be
+    as early as possible during launch (i.e. before the experiment's imports).
+
+    """
+    def __init__(self):
+        self._origin = time.perf_counter()
+        self.stages = OrderedDict()
+        self.marks = OrderedDict()
+
+    @contextmanager
+    def stage(self, name):
+        """Times a stage of startup, adding to the stage's total if it already exists.
+
+        Args:
+            name (str): The name of the startup stage being timed.
+
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def mark(self, name):
+        """Records the time elapsed since launch for a given event.
+
+        Only the first mark for a given name is recorded, so this can be safely
+        called from code that runs more than once.
+
+        Args:
+            name (str): The name of the event to mark.
+
+        """
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self._origin
+
+    def report(self):
+        """Summarizes the recorded startup stages and events.
+
+        Returns:
+            str: A human-readable summary of the startup timings.
+
+        """
+        lines = ["Startup timing:"]
+        for name, elapsed in self.stages.items():
+            lines.append(" - {0}: {1:.1f} ms".format(name, elapsed * 1000))
+        for name, elapsed in self.marks.items():
+            lines.append(" - launch to {0}: {1:.1f} ms".format(name, elapsed * 1000))
+        return "\n".join(lines)
+
+
+class FrameClock(object):
+    """Predicts display flip times so that stimulus onsets can be locked to frames.
+
+    After each flip, the timestamp of the flip should be passed to :meth:`flipped`.
+    These timestamps are stored in a preallocated per-trial array and used to keep
+    a running estimate of the display's refresh interval, which is then used to
+    predict when upcoming flips will happen.
+
+    An onset scheduled with :meth:`schedule` is snapped to the nearest frame after
+    the first flip of the trial, and :meth:`due` returns True once the next flip is
+    predicted to be that frame. The difference between the actual and scheduled
+    onset times (e.g. due to dropped frames) is recorded by :meth:`mark_onset`.
+
+    Args:
+        refresh_rate (float): The nominal refresh rate of the display (in Hz).
+        max_frames (int, optional): The maximum number of flip timestamps to store
+            per trial. Defaults to 20000.
+
+    """
+    def __init__(self, refresh_rate, max_frames=20000):
+        self.interval = 1.0 / refresh_rate
+        self._times = array('d', [0.0]) * max_frames
+        self.frames = 0
+        self.scheduled = None
+        self.onset = None
+        self.onset_frame = None
+        self._last = None
+
+    def reset(self):
+        """Clears all recorded flips and any scheduled onset for a new trial.
+
+        """
+        self.frames = 0
+        self.scheduled = None
+        self.onset = None
+        self.onset_frame = None
+        self._last = None
+
+    def flipped(self, t):
+        """Records the timestamp of a display flip.
+
+        Args:
+            t (float): The time at which the flip completed.
+
+        Returns:
+            float: The timestamp of the flip.
+
+        """
+        if self._last is not None:
+            # Update the refresh estimate, ignoring dropped or doubled frames
+            diff = t - self._last
+            if 0.5 * self.interval < diff < 1.5 * self.interval:
+                self.interval += (diff - self.interval) * 0.05
+        if self.frames < len(self._times):
+            self._times[self.frames] = t
+        self.frames += 1
+        self._last = t
+        return t
+
+    def schedule(self, delay):
+        """Schedules an onset for the frame nearest a given delay after the first flip.
+
+        Args:
+            delay (float): The delay (in seconds) of the onset from the first flip
+                of the trial.
+
+        """
+        frame = int(round(delay / self.interval))
+        self.scheduled = self._times[0] + frame * self.interval
+
+    def due(self):
+        """Checks whether the scheduled onset should be drawn for the next flip.
+
+        Returns:
+            bool: True if the next flip is predicted to be the one closest to the
+            scheduled onset (or the onset has already happened), otherwise False.
+
+        """
+        if self.onset is not None:
+            return True
+        return self._last + self.interval * 1.5 > self.scheduled
+
+    def mark_onset(self):
+        """Marks the most recent flip as the onset of the scheduled stimulus.
+
+        Returns:
+            float: The timestamp of the onset flip.
+
+        """
+        self.onset = self._last
+        self.onset_frame = self.frames - 1
+        return self.onset
+
+    @property
+    def onset_error(self):
+        """float: The actual onset time minus the scheduled onset time (in seconds).
+
+        """
+        if self.onset is None:
+            return None
+        return self.onset - self.scheduled
+
+    def frame_times(self, start=0):
+        """Gets the timestamps of the recorded flips for the current trial.
+
+        Args:
+            start (int, optional): The index of the first flip to get (e.g.
+                :attr:`onset_frame`). Defaults to 0.
+
+        Returns:
+            :obj:`array.array`: An array of flip timestamps, in order.
+
+        """
+        return self._times[start:min(self.frames, len(self._times))]
+
+
+
+class FrameWatchdog(object):
+    """Sheds optional per-frame work when frames take longer than the frame budget.
+
+    Optional tasks (e.g. a debug overlay) are registered with a priority, and
+    each frame the watchdog is asked whether each task is due with :meth:`due`.
+    The time from the start of each frame's work (:meth:`begin_frame`) to just
+    before the flip (:meth:`end_frame`) is compared to a fraction of the refresh
+    interval measured by a :obj:`FrameClock`. If several frames in a row go over
+    budget, the lowest-priority task that can still be degraded is shed: its
+    update rate is halved each time (i.e. it runs every 2nd, 4th, 8th frame,
+    etc.) until it reaches the most degraded rate allowed for its priority
+    level, at which point the next task is degraded instead.
+
+    Each degradation is recorded in :attr:`events` along with the block and
+    trial it happened in. Degradations last for the rest of the session, since
+    slow frames are usually due to the computer rather than the trial.
+
+    Args:
+        clock (:obj:`FrameClock`): The frame clock measuring the refresh interval.
+        budget (float, optional): The fraction of the refresh interval that
+            per-frame work can take before optional work is shed. Defaults to 0.8.
+        levels (dict, optional): The most degraded update interval (in frames)
+            allowed for each priority level, where 0 means tasks of that priority
+            can be turned off completely. Priorities not in the dict can be
+            turned off. Defaults to None.
+        patience (int, optional): The number of consecutive over-budget frames
+            needed before shedding work. Defaults to 3.
+
+    """
+    def __init__(self, clock, budget=0.8, levels=None, patience=3):
+        self.clock = clock
+        self.budget = budget
+        self.levels = levels if levels else {}
+        self.patience = patience
+        self.strides = OrderedDict()
+        self.events = []
+        self.frames = 0
+        self.over = 0
+        self._priorities = {}
+        self._start = None
+
+    def add(self, name, priority):
+        """Registers an optional per-frame task.
+
+        Args:
+            name (str): The name of the task.
+            priority (int): The priority of the task. Tasks with lower priorities
+                are shed first.
+
+        """
+        self._priorities[name] = priority
+        self.strides[name] = 1
+
+    def due(self, name):
+        """Checks whether an optional task should be run on the current frame.
+
+        Args:
+            name (str): The name of the task.
+
+        Returns:
+            bool: True if the task should be run this frame, otherwise False.
+
+        """
+        stride = self.strides[name]
+        return stride > 0 and self.frames % stride == 0
+
+    def active(self, name):
+        """Checks whether an optional task has been turned off by the watchdog.
+
+        Args:
+            name (str): The name of the task.
+
+        Returns:
+            bool: False if the task has been turned off, otherwise True.
+
+        """
+        return self.strides[name] > 0
+
+    def begin_frame(self, t):
+        """Marks the start of a frame's work.
+
+        Args:
+            t (float): The current time.
+
+        """
+        self._start = t
+
+    def end_frame(self, t, block=None, trial=None):
+        """Marks the end of a frame's work (i.e. just before the flip).
+
+        Args:
+            t (float): The current time.
+            block (int, optional): The current block number, for logging.
+            trial (int, optional): The current trial number, for logging.
+
+        Returns:
+            float: The time (in seconds) taken by the frame's work.
+
+        """
+        cost = t - self._start
+        self.frames += 1
+        if cost > self.clock.interval * self.budget:
+            self.over += 1
+            if self.over >= self.patience:
+                self.over = 0
+                self._shed(cost, block, trial)
+        else:
+            self.over = 0
+        return cost
+
+    def _shed(self, cost, block, trial):
+        # Degrades the lowest-priority task that hasn't hit its limit yet
+        order = sorted(self.strides.keys(), key=lambda n: self._priorities[n])
+        for name in order:
+            stride = self.strides[name]
+            limit = self.levels.get(self._priorities[name], 0)
+            if stride == 0 or stride == limit:
+                continue
+            stride *= 2
+            if limit and stride > limit:
+                stride = limit
+            elif not limit and stride > 8:
+                # Turn the task off once it's been reduced to every 8th frame
+                stride = 0
+            self.strides[name] = stride
+            self.events.append(OrderedDict([
+                ('block_num', block), ('trial_num', trial), ('task', name),
+                ('stride', stride), ('frame_ms', cost * 1000),
+                ('budget_ms', self.clock.interval * self.budget * 1000),
+            ]))
+            return
+
+    def pop_events(self):
+        """Retrieves and clears all degradation events recorded so far.
+
+        Returns:
+            list: A list of dicts, one for each degradation event.
+
+        """
+        events, self.events = (self.events, [])
+        return events
+
+    def report(self):
+        """Summarizes the current update rates of all optional tasks.
+
+        Returns:
+            str: A human-readable summary of the task update rates.
+
+        """
+        lines = ["Frame watchdog:"]
+        for name, stride in self.strides.items():
+            if stride == 0:
+                rate = "off"
+            elif stride == 1:
+                rate = "every frame"
+            else:
+                rate = "every {0} frames".format(stride)
+            lines.append(" - {0}: {1}".format(name, rate))
+        return "\n".join(lines)
+
+
+# Global startup timer, created when this module is first imported
+startup = StartupTimer()
@@ -2,31 +2,50 @@
 
 __author__ = "Austin Hurst"
 
-from math import sqrt
+# Import the startup timer first so that it can time the remaining imports
+from timing import startup
+
+import os
+import socket
 from copy import copy
+from functools import partial
 from random import randrange, choice, shuffle
-from ctypes import c_int, byref
 
-import sdl2
 import numpy as np
 import klibs
 from klibs import P
 from klibs.KLExceptions import TrialException
 from klibs.KLGraphics import fill, flip, blit
 from klibs.KLGraphics import KLDraw as kld
-from klibs.KLEventQueue import flush, pump
+from klibs.KLEventQueue import flush
 from klibs.KLUtilities import angle_between, point_pos, deg_to_px, px_to_deg
 from klibs.KLUtilities import line_segment_len as linear_dist
 from klibs.KLTime import CountDown, precise_time
 from klibs.KLText import add_text_style
-from klibs.KLCommunication import message
+from klibs.KLCommunication import message, collect_demographics
 from klibs.KLUserInterface import (
     any_key, mouse_pos, ui_request, hide_cursor, smart_sleep,
 )
 
-from KVIQ import KVIQ
+from timing import FrameClock, FrameWatchdog
+from screens import ScreenCache, SceneLayer, compose_screen, render_lock
+from benchmark import format_results, widget_benchmarks
+from benchmark import stick_benchmarks, input_benchmarks
+from benchmark import scene_benchmarks
+from telemetry import TelemetryPublisher
+from profiling import profiler, profiled
+from kinematics import KinematicsWorker
+from summaries import BinSummarizer
+from archive import SampleArchive
+from inputs import InputSnapshot
+from sdl_utils import wait_for_event
+from journal import SessionJournal, load_journal, new_journal_path, resume_path
 from gamepad import gamepad_init, button_pressed
-from gamepad_usb import get_all_controllers
+from gamepad_usb import ControllerManager
+from stick import AXIS_MAX, TRIGGER_MAX, CursorMapper, MouseState
+from overlay import GamepadOverlay
+
+startup.mark("imports loaded")
 
 # Define colours for use in the experiment
 WHITE = (255, 255, 255)
@@ -35,26 +54,52 @@ MIDGREY = (128, 128, 128)
 TRANSLUCENT_RED = (255, 0, 0, 96)
 TRANSLUCENT_BLUE = (0, 0, 255, 96)
 
-# Define constants for working with gamepad data
-AXIS_MAX = 32768
-TRIGGER_MAX = 32767
-
 
 class MotorMapping(klibs.Experiment):
 
+    @profiled("setup")
     def setup(self):
 
+        # If resuming an interrupted session, load its state from the journal.
+        # Otherwise, collect demographics for a new participant (this is done
+        # here instead of by klibs so that resuming doesn't create a new one)
+        self.resume = None
+        journal = resume_path()
+        if journal:
+            self.resume = load_journal(journal)
+            print("Resuming session from '{0}'".format(journal))
+            P.participant_id = self.resume.participant_id
+            P.condition = self.resume.condition
+            P.demographics_collected = True
+        else:
+            collect_demographics(P.development_mode or not P.collect_demographics)
+            journal = new_journal_path(P.participant_id)
+        self.journal = SessionJournal(journal)
+
         # Prior to starting the task, run through the KVIQ
-        self.handedness = self.db.select(
-            'participants', columns=['handedness'], where={'id': P.participant_id}
-        )[0][0]
-        if P.run_kviq:
-            kviq = KVIQ(self.handedness == "l")
+        with startup.stage("database"):
+            self.handedness = self.db.select(
+                'participants', columns=['handedness'], where={'id': P.participant_id}
+            )[0][0]
+        if not self.resume:
+            self.journal.write(
+                "setup", participant_id=P.participant_id, condition=P.condition,
+                handedness=self.handedness,
+            )
+        if P.run_kviq and not self._completed("kviq"):
+            # Only import the KVIQ and its UI dependencies if actually running it
+            with startup.stage("imports"):
+                from KVIQ import KVIQ
+            with startup.stage("fonts"):
+                kviq = KVIQ(self.handedness == "l")
             responses = kviq.run()
+            if P.development_mode:
+                print(kviq.report())
             for movement, dat in responses.items():
                 dat['participant_id'] = P.participant_id
                 dat['movement'] = movement
                 self.db.insert(dat, table='kviq') 
+            self.journal.write("stage", name="kviq")
 
         # Initialize stimulus sizes and layout
         screen_h_deg = (P.screen_y / 2.0) / deg_to_px(1.0)
@@ -75,17 +120,22 @@ class MotorMapping(klibs.Experiment):
         self.fixation = kld.FixationCross(
             fixation_size, fixation_thickness, rotation=45, fill=WHITE
         )
-        if P.development_mode and P.show_gamepad_debug:
-            add_text_style('debug', '0.3deg')
+        if P.show_gamepad_debug:
+            with startup.stage("fonts"):
+                add_text_style('debug', '0.3deg')
+            self.pad_overlay = GamepadOverlay(
+                P.debug_overlay_rate, graphical=P.debug_overlay_graphical
+            )
 
         # Initialize gamepad (if present)
-        self.gamepad = None
-        gamepad_init()
-        controllers = get_all_controllers()
-        if len(controllers):
-            self.gamepad = controllers[0]
-            self.gamepad.initialize()
+        self.controllers = ControllerManager()
+        with startup.stage("controllers"):
+            gamepad_init()
+            self.controllers.connect()
+        if self.gamepad:
             print(self.gamepad._info)
+        self.stick = CursorMapper(P.screen_c, self.cursor_dist_max)
+        self.mouse = MouseState()
 
         # Define error messages for the task
         dominant = "left" if self.handedness == "l" else "right"
@@ -119,10 +169,48 @@ class MotorMapping(klibs.Experiment):
                 "cursor is blue."
             ),
             "continue": "Press any button to continue.",
+            "disconnected": (
+                "Controller disconnected!\n"
+                "Please reconnect the gamepad to continue the task."
+            ),
         }
         self.errs = {}
-        for key, txt in err_txt.items():
-            self.errs[key] = message(txt, align="center")
+        with startup.stage("fonts"):
+            for key, txt in err_txt.items():
+                self.errs[key] = message(txt, align="center")
+
+        # Pre-render all static instruction screens in the background
+        self.screens = ScreenCache()
+        self._add_screens()
+        self.screens.compile()
+
+        # If enabled, run rendering/input benchmarks before starting the task
+        # (holding the render lock, since the benchmarks render text while the
+        # screen compiler is still running)
+        if P.development_mode and P.run_benchmarks:
+            with render_lock:
+                self.run_benchmarks()
+
+        # Summarize task performance in bins of trials as the session runs
+        self.summaries = BinSummarizer(P.participant_id)
+
+        # Compute kinematic features for each trial in the background
+        self.kinematics = KinematicsWorker(P.screen_c, deg_to_px(1.0))
+
+        # Initialize the raw per-frame input archive for the session (if enabled)
+        self.archive = None
+        if P.raw_archive:
+            raw_dir = os.path.join(P.data_dir, "raw")
+            if not os.path.isdir(raw_dir):
+                os.makedirs(raw_dir)
+            host = socket.gethostname().split(".")[0]
+            name = "p{0}_{1}".format(P.participant_id, host)
+            self.archive = SampleArchive(os.path.join(raw_dir, name))
+
+        # Initialize live telemetry for experimenter monitoring (if enabled)
+        self.telemetry = None
+        if P.telemetry:
+            self.telemetry = TelemetryPublisher(P.telemetry_socket)
 
         # Insert practice block
         self.insert_practice_block(1, trial_counts=P.practice_trials)
@@ -139,66 +227,72 @@ class MotorMapping(klibs.Experiment):
             self.target_angles.append(angles)
             self.target_dists.append(dists)
         self.random_target = False
+        if self.resume and self.resume.target_angles:
+            # Use the exact target schedule from the interrupted session
+            self.target_angles = [np.array(a) for a in self.resume.target_angles]
+            self.target_dists = [np.array(d) for d in self.resume.target_dists]
+        else:
+            self.journal.write(
+                "targets", angles=[a.tolist() for a in self.target_angles],
+                dists=[d.tolist() for d in self.target_dists],
+            )
+
+        # If resuming, skip ahead to the first unfinished block and trial
+        self._skip_trials = 0
+        if self.resume:
+            self.skip_completed_trials()
+
+        # Initialize frame clock for frame-locked target onsets
+        self.frames = FrameClock(P.refresh_rate)
+
+        # Initialize the watchdog for shedding optional per-frame work if slow
+        self.watchdog = None
+        if P.frame_watchdog:
+            self.watchdog = FrameWatchdog(self.frames, P.frame_budget, P.shed_levels)
+            # Only register tasks that are enabled, so none of the shedding steps
+            # are wasted on tasks that aren't running
+            if P.show_gamepad_debug:
+                self.watchdog.add('debug_overlay', priority=1)
+            if self.telemetry:
+                self.watchdog.add('telemetry', priority=2)
+            if self.archive:
+                self.watchdog.add('raw_archive', priority=3)
 
         # Run a visual demo explaining the task
-        self.task_demo()
+        if not self._completed("demo"):
+            self.task_demo()
+            self.journal.write("stage", name="demo")
+        self.screens.join()
+        print(startup.report())
 
 
+    @profiled("block_{P.block_number}")
     def block(self):
         # Hide mouse cursor if not already hidden
         hide_cursor()
 
-        # Define block messages
-        dominant = "left" if self.handedness == "l" else "right"
-        nondominant = "right" if self.handedness == "l" else "left"
-        next_msg = "Press any button to start."
-        block_msgs = {
-            "PP": (
-                "For this next set of trials, please respond to targets physically by\n"
-                f"using the gamepad's {dominant} stick to move the cursor over them."
-            ),
-            "MI": (
-                "For this next set of trials, please respond to targets using *motor "
-                "imagery*,\nimagining what it would feel like to move the cursor over "
-                "each target\n(without actually moving), then physically pressing the "
-                f"{nondominant} trigger when finished.\n\nPlease keep your thumb "
-                f"resting on the {dominant} stick."
-            ),
-            "CC": (
-                "For this next set of trials, please respond to targets by simply "
-                f"pressing\nthe {nondominant} trigger as quickly as possible, without "
-                "moving the cursor."
-            ),
-            "test": (
-                "The colour of the cursor will change randomly between trials, so be "
-                "ready to\nrespond with either stick. Press any button when you are "
-                "ready to begin!"
-            ),
-        }
-
         # Handle different phases of the experiment
         block_sequence = ["practice", "training", "test"]
         self.phase = block_sequence[P.block_number - 1]
         if self.phase == "practice":
             self.joystick_map = P.training_mapping
             self.trial_type = "PP"
-            block_msg = "This is a practice block.\n\n" + block_msgs["PP"]
-            block_msg = block_msg.replace("next", "first")
         elif self.phase == "training":
             self.joystick_map = P.training_mapping
             self.trial_type = P.condition
-            block_msg = block_msgs[self.trial_type]
-            if self.trial_type == "PP":
-                block_msg = block_msg.replace("please", "please continue to")
         elif self.phase == "test":
             self.joystick_map = P.test_mapping
             self.trial_type = "PP"
-            block_msg = block_msgs["test"]
-            self.test_phase_instructions()
+            if not self._skip_trials:
+                self.test_phase_instructions()
 
         # Generate sequence of hands to use for each trial
         self.dominant_hand = []
-        if self.phase == "test":
+        resumed = self.resume.blocks.get(P.block_number) if self.resume else None
+        if resumed and self._skip_trials:
+            # If resuming partway through a block, use the same hand sequence
+            self.dominant_hand = resumed['dominant_hand']
+        elif self.phase == "test":
             # Ensure there are 2 trials w/ each hand in every group of 4 trials
             subseq = [True, True, False, False]
             while len(self.dominant_hand) < P.trials_per_block:
@@ -206,28 +300,31 @@ class MotorMapping(klibs.Experiment):
                 self.dominant_hand += subseq
         else:
             self.dominant_hand = [True] * P.trials_per_block
+        self.journal.write(
+            "block", block=P.block_number, dominant_hand=self.dominant_hand
+        )
+        self.journal.sync()
+        if self.telemetry:
+            self.telemetry.start_block()
 
         # Show block start message
-        msg = message(block_msg, align="center")
-        msg2 = message("Press any button to start.")
-        self.show_feedback(msg, duration=2.0, location=self.msg_loc)
-        fill()
-        blit(msg, 5, self.msg_loc)
-        blit(msg2, 5, self.lower_middle)
-        flip()
+        msg = self.screens.get(('block', self.phase))
+        self.show_feedback(msg, duration=2.0)
+        self.screens.show(('block_start', self.phase))
         wait_for_input(self.gamepad)
 
 
     def trial_prep(self):
 
+        # If resuming partway through a block, continue the trial numbering
+        if self._skip_trials:
+            P.trial_number += self._skip_trials
+            self._skip_trials = 0
+
         # Every 20 trials during training or test block, do block break
         if not P.practicing and P.trial_number > 1:
             if (P.trial_number - 1) % int(P.trials_per_block / 4) == 0:
-                self.show_demo_text(
-                    ["Take a short break!",
-                     "Whenever you're ready, press any button to resume the task."],
-                    stim_set=[], msg_y=int(0.45 * P.screen_y)
-                )
+                self.show_screen('break')
 
         # Generate/retrieve trial factors
         block_idx = P.block_number - 1
@@ -257,6 +354,7 @@ class MotorMapping(klibs.Experiment):
         hide_cursor()
 
 
+    @profiled("trials_{self.phase}")
     def trial(self):
 
         # Initialize trial response data
@@ -269,7 +367,7 @@ class MotorMapping(klibs.Experiment):
         resp_trigger = "NA"
 
         # Get joystick mapping for the trial
-        mod_x, mod_y = P.input_mappings[self.joystick_map]
+        self.stick.set_mapping(P.input_mappings[self.joystick_map])
 
         # Initialize trial stimuli
         cursor = self.cursor if self.dominant else self.cursor_nd
@@ -278,25 +376,50 @@ class MotorMapping(klibs.Experiment):
         blit(cursor, 5, P.screen_c)
         flip()
 
+        # Schedule the target to appear on the frame closest to its onset time
+        self.frames.reset()
+        self.frames.flipped(precise_time())
+        self.frames.schedule(self.target_onset / 1000.0)
+        if self.archive:
+            self.archive.begin_trial()
+
         target_on = None
         first_loop = True
         over_target = False
         while self.evm.before('timeout'):
-            q = pump(True)
-            ui_request(queue=q)
+            if self.watchdog:
+                self.watchdog.begin_frame(precise_time())
+            q = InputSnapshot()
+            ui_request(queue=q.keydown)
+
+            # If the gamepad was unplugged (or replaced), recycle the trial once
+            # a controller is available again
+            if self.controllers.update(q):
+                if self.telemetry:
+                    self.telemetry.log_error("controller")
+                self.wait_for_controller()
+                raise TrialException("Controller changed, recycling trial!")
 
             # Get latest joystick/trigger data from gamepad
             if self.gamepad:
                 self.gamepad.update()
+            else:
+                self.mouse.update()
 
             # Filter, standardize, and possibly invert the axis & trigger data
             lt, rt = self.get_triggers()
-            jx, jy = self.get_stick_position(self.left_hand)
+            raw_x, raw_y = self.get_stick_raw(self.left_hand)
             input_time = precise_time()
-            cursor_pos = (
-                P.screen_c[0] + int(jx * self.cursor_dist_max * mod_x),
-                P.screen_c[1] + int(jy * self.cursor_dist_max * mod_y)
-            )
+            cursor_pos = self.stick.position(raw_x, raw_y)
+            if self.archive and self._due('raw_archive'):
+                self.archive.append(
+                    input_time, self.get_stick_raw(True), self.get_stick_raw(False),
+                    int(round(lt * TRIGGER_MAX)), int(round(rt * TRIGGER_MAX))
+                )
+            if self.telemetry and self._due('telemetry'):
+                self.telemetry.publish(
+                    P.block_number, P.trial_number, self.phase, cursor_pos, (lt, rt)
+                )
 
             # Handle input based on trial type and trials phase
             triggers_released = lt < 0.2 and rt < 0.2
@@ -315,8 +438,8 @@ class MotorMapping(klibs.Experiment):
             # Check other joystick for movement if in test block
             other_stick_movement = 0.0
             if self.phase == "test":
-                jx2, jy2 = self.get_stick_position(not self.left_hand)
-                dist_raw = linear_dist((jx2, jy2), (0, 0))
+                raw_x2, raw_y2 = self.get_stick_raw(not self.left_hand)
+                dist_raw = self.stick.magnitude(raw_x2, raw_y2)
                 other_stick_movement = dist_raw * self.cursor_dist_max
 
             # Detect/handle different types of trial error
@@ -340,6 +463,9 @@ class MotorMapping(klibs.Experiment):
 
             # If the participant did something wrong, show them a feedback message
             if err != "NA":
+                self.log_trial_error(err, target_on is not None)
+                if self.telemetry:
+                    self.telemetry.log_error(err)
                 self.show_feedback(self.errs[err], duration=2.0)
                 fill()
                 blit(self.errs[err], 5, P.screen_c)
@@ -367,18 +493,25 @@ class MotorMapping(klibs.Experiment):
                 last_y = cursor_pos[1]
             
             # Actually draw stimuli to the screen
+            show_target = self.frames.due()
             fill()
             blit(self.fixation, 5, P.screen_c)
-            if self.evm.after('target_on'):
+            if show_target:
+                # NOTE: The target is blitted separately, since compositing it with
+                # the fixation would upload a mostly-empty texture every frame
+                # (see scene_benchmarks)
                 blit(self.target, 5, self.target_loc)
             blit(cursor, 5, cursor_pos)
-            if P.development_mode and P.show_gamepad_debug:
-                self.show_gamepad_debug()
+            if P.show_gamepad_debug:
+                self.show_gamepad_debug(update=self._due('debug_overlay'))
+            if self.watchdog:
+                self.watchdog.end_frame(precise_time(), P.block_number, P.trial_number)
             flip()
+            self.frames.flipped(precise_time())
 
             # Get timestamp for when target drawn to the screen
-            if not target_on and self.evm.after('target_on'):
-                target_on = precise_time()
+            if show_target and not target_on:
+                target_on = self.frames.mark_onset()
                 
             # Check if the cursor is currently over the target
             dist_to_target = linear_dist(cursor_pos, self.target_loc)
@@ -413,6 +546,8 @@ class MotorMapping(klibs.Experiment):
             else:
                 self.show_feedback(feedback, duration=1.5)
         elif err == "NA":
+            if self.telemetry:
+                self.telemetry.log_error("too_slow")
             feedback = self.errs['too_slow']
             self.show_feedback(feedback, duration=2.5)
 
@@ -429,14 +564,32 @@ class MotorMapping(klibs.Experiment):
                     'stick_y': stick_y,
                 })
             self.db.insert(rows, table='gamepad')
+            trial_info = {
+                'participant_id': P.participant_id,
+                'block_num': P.block_number,
+                'trial_num': P.trial_number,
+            }
+            self.kinematics.submit(trial_info, axis_data, self.target_loc)
+            if self.archive:
+                # Record how often samples were archived, in case it was throttled
+                # NOTE: Watchdog degradations are permanent, so the stride at the
+                # end of the trial is the largest used during it
+                stride = self.watchdog.strides['raw_archive'] if self.watchdog else 1
+                flips = None
+                if target_on:
+                    flips = self.frames.frame_times(self.frames.onset_frame)
+                self.archive.end_trial(
+                    P.block_number, P.trial_number, target_on, stride, flips
+                )
 
-        return {
+        trial_data = {
             "block_num": P.block_number,
             "trial_num": P.trial_number,
             "trial_type": self.trial_type,
             "mapping": self.joystick_map,
             "dominant": self.dominant,
             "target_onset": self.target_onset if target_on else "NA",
+            "onset_err": "NA" if not target_on else self.frames.onset_error * 1000,
             "target_dist": px_to_deg(self.target_dist),
             "target_angle": self.target_angle,
             "movement_rt": "NA" if movement_rt is None else movement_rt * 1000,
@@ -449,51 +602,202 @@ class MotorMapping(klibs.Experiment):
             "target_y": self.target_loc[1],
         }
 
+        # Write summaries for any bins of trials completed by this trial
+        block_trials = P.practice_trials if P.practicing else P.trials_per_block
+        rows, err_rows = self.summaries.add(trial_data, block_trials)
+        if len(rows):
+            self.db.insert(rows, table='trial_bins')
+        if len(err_rows):
+            self.db.insert(err_rows, table='trial_bin_errors')
+
+        return trial_data
+
 
     def trial_clean_up(self):
-        pass
+        # Write kinematic features for any trials that have been processed
+        for row in self.kinematics.results():
+            self.db.insert(row, table='trial_kinematics')
+
+        # Log any optional per-frame work shed by the frame watchdog
+        if self.watchdog:
+            self.log_watchdog_events()
 
 
     def clean_up(self):
         
-        end_txt = (
-            "You're all done, thanks for participating!\nPress any button to exit."
-        )
-        end_msg = message(end_txt, align='center')
+        self.screens.show('end')
+        wait_for_input(self.gamepad)
+        if P.development_mode:
+            print(self.screens.report())
+
+        for row in self.kinematics.close():
+            self.db.insert(row, table='trial_kinematics')
+        if self.kinematics.failures:
+            print("Kinematics failed for {0} trials:".format(
+                len(self.kinematics.failures)
+            ))
+            for info, tb in self.kinematics.failures:
+                print(info)
+                print(tb)
+
+        if self.archive:
+            self.archive.close()
+        if self.watchdog:
+            self.log_watchdog_events()
+            if P.development_mode:
+                print(self.watchdog.report())
+        self.journal.write("end")
+        self.journal.close()
+        self.controllers.close()
+        if P.development_mode:
+            print(self.controllers.metrics())
+        if self.telemetry:
+            overhead = self.telemetry.overhead()
+            print("Telemetry overhead: {0:.2f} us/frame".format(overhead))
+            self.telemetry.close()
+        if profiler.enabled:
+            print("Profiles saved to '{0}'".format(profiler.save()))
+
+
+    def show_demo_text(self, msgs, stim_set, duration=1.0, wait=True, msg_y=None):
+        with render_lock:
+            layers = self.demo_layers(msgs, stim_set, msg_y)
         fill()
-        blit(end_msg, 5, P.screen_c)
+        SceneLayer(layers).draw()
         flip()
-        wait_for_input(self.gamepad)
+        smart_sleep(duration * 1000)
+        if wait:
+            wait_for_input(self.gamepad)
 
-        if self.gamepad:
-            self.gamepad.close()
+
+    def show_screen(self, key, duration=1.0, wait=True):
+        # Same as show_demo_text, but for screens pre-rendered in setup
+        self.screens.show(key)
+        smart_sleep(duration * 1000)
+        if wait:
+            wait_for_input(self.gamepad)
 
 
-    def show_demo_text(self, msgs, stim_set, duration=1.0, wait=True, msg_y=None):
+    def demo_screen(self, msgs, stim_set, msg_y=None):
+        return compose_screen(self.demo_layers(msgs, stim_set, msg_y))
+
+
+    def demo_layers(self, msgs, stim_set, msg_y=None):
         msg_x = int(P.screen_x / 2)
         msg_y = int(P.screen_y * 0.25) if msg_y is None else msg_y
         half_space = deg_to_px(0.5)
 
-        fill()
+        layers = []
         if not isinstance(msgs, list):
             msgs = [msgs]
         for msg in msgs:
             txt = message(msg, align="center")
-            blit(txt, 8, (msg_x, msg_y))
+            layers.append((txt, 8, (msg_x, msg_y)))
             msg_y += txt.height + half_space
     
         for stim, locs in stim_set:
             if not isinstance(locs, list):
                 locs = [locs]
             for loc in locs:
-                blit(stim, 5, loc)
-        flip()
-        smart_sleep(duration * 1000)
-        if wait:
-            wait_for_input(self.gamepad)
+                layers.append((stim, 5, loc))
+        return layers
+
+
+    def block_message(self, phase):
+        # Define block messages
+        dominant = "left" if self.handedness == "l" else "right"
+        nondominant = "right" if self.handedness == "l" else "left"
+        block_msgs = {
+            "PP": (
+                "For this next set of trials, please respond to targets physically by\n"
+                f"using the gamepad's {dominant} stick to move the cursor over them."
+            ),
+            "MI": (
+                "For this next set of trials, please respond to targets using *motor "
+                "imagery*,\nimagining what it would feel like to move the cursor over "
+                "each target\n(without actually moving), then physically pressing the "
+                f"{nondominant} trigger when finished.\n\nPlease keep your thumb "
+                f"resting on the {dominant} stick."
+            ),
+            "CC": (
+                "For this next set of trials, please respond to targets by simply "
+                f"pressing\nthe {nondominant} trigger as quickly as possible, without "
+                "moving the cursor."
+            ),
+            "test": (
+                "The colour of the cursor will change randomly between trials, so be "
+                "ready to\nrespond with either stick. Press any button when you are "
+                "ready to begin!"
+            ),
+        }
+
+        # Get the message for the given phase of the experiment
+        if phase == "practice":
+            block_msg = "This is a practice block.\n\n" + block_msgs["PP"]
+            block_msg = block_msg.replace("next", "first")
+        elif phase == "training":
+            block_msg = block_msgs[P.condition]
+            if P.condition == "PP":
+                block_msg = block_msg.replace("please", "please continue to")
+        elif phase == "test":
+            block_msg = block_msgs["test"]
+        return block_msg
+
+
+    def _block_screen(self, phase, start_prompt=False):
+        msg = message(self.block_message(phase), align="center")
+        layers = [(msg, 5, self.msg_loc)]
+        if start_prompt:
+            msg2 = message("Press any button to start.")
+            layers.append((msg2, 5, self.lower_middle))
+        return compose_screen(layers)
+
+
+    def _add_screens(self):
+        # Register all static screens for the task, in the order they're shown
+        self.demo_screens = []
+        for i, (msgs, stim_set) in enumerate(self.task_demo_pages()):
+            self.screens.add(('demo', i), partial(self.demo_screen, msgs, stim_set))
+            self.demo_screens.append(('demo', i))
+        self.test_demo_screens = []
+        break_msgs = [
+            "Take a short break!",
+            "Whenever you're ready, press any button to resume the task.",
+        ]
+        break_screen = partial(
+            self.demo_screen, break_msgs, [], msg_y=int(0.45 * P.screen_y)
+        )
+        for phase in ["practice", "training", "test"]:
+            if phase == "test":
+                for i, (msgs, stim_set) in enumerate(self.test_phase_pages()):
+                    builder = partial(self.demo_screen, msgs, stim_set)
+                    self.screens.add(('test_demo', i), builder)
+                    self.test_demo_screens.append(('test_demo', i))
+            self.screens.add(('block', phase), partial(self._block_screen, phase))
+            builder = partial(self._block_screen, phase, start_prompt=True)
+            self.screens.add(('block_start', phase), builder)
+            if phase == "training":
+                self.screens.add('break', break_screen)
+        end_txt = (
+            "You're all done, thanks for participating!\nPress any button to exit."
+        )
+        end_screen = lambda: compose_screen(
+            [(message(end_txt, align='center'), 5, P.screen_c)]
+        )
+        self.screens.add('end', end_screen)
 
 
     def task_demo(self):
+        for key in self.demo_screens:
+            self.show_screen(key)
+
+
+    def test_phase_instructions(self):
+        for key in self.test_demo_screens:
+            self.show_screen(key)
+
+
+    def task_demo_pages(self):
         # Initialize task stimuli for the demo
         target_dist = (2 * self.target_dist_min + self.target_dist_max) / 3
         target_loc = vector_to_pos(P.screen_c, target_dist, 250)
@@ -505,129 +809,236 @@ class MotorMapping(klibs.Experiment):
         dominant = "left" if self.handedness == "l" else "right"
         nondominant = "right" if self.handedness == "l" else "left"
         
-        # Actually run through demo
-        self.show_demo_text(
+        # Define the text and stimulus layout for each page of the demo
+        pages = []
+        pages.append((
             "Welcome to the experiment! This tutorial will help explain the task.",
             [(self.fixation, P.screen_c), (self.cursor, P.screen_c)]
-        )
-        self.show_demo_text(
+        ))
+        pages.append((
             ("On each trial of the task, a small white target will appear at a random "
              "distance\nfrom the fixation cross at the middle of the screen."),
             [(self.fixation, P.screen_c), (self.target, target_loc),
              (self.cursor, P.screen_c)]
-        )
-        self.show_demo_text(
+        ))
+        pages.append((
             ("Your job will be to quickly move the red cursor over top of the target "
              f"when it appears,\nusing the {dominant} stick on the gamepad."),
             [(self.fixation, P.screen_c), (self.target, target_loc),
              (self.cursor, (target_loc[0] + 4, target_loc[1] + 6))]
-        )
-        self.show_demo_text(
+        ))
+        pages.append((
             ("Once you have moved the cursor over the target, please squeeze the "
              f"{nondominant} trigger on the \nback of the gamepad to end the trial. "
              "You will be shown your reaction time."),
             [(feedback, P.screen_c)]
-        )
+        ))
         wrong_direction = (
             P.screen_c[0] + self.cursor_size * 2, P.screen_c[1] + self.cursor_size
         )
-        self.show_demo_text(
+        pages.append((
             ("To make the task more challenging, 'left' and 'right' on the controller "
              "have been reversed.\nThis means moving the joystick *left* will move "
              "the cursor to the *right* (and vice versa).\nThis may take a while to "
              "get used to."),
             [(self.fixation, P.screen_c), (self.target, target_loc),
              (self.cursor, wrong_direction)]
-        )
+        ))
         target_dist = (self.target_dist_min + self.target_dist_max) / 2
         target_loc = vector_to_pos(P.screen_c, target_dist, 165)
         if P.condition == "MI":
             feedback = message("{:.3f}".format(3.347))
-            self.show_demo_text(
+            pages.append((
                 ("In some parts of the study, you will be asked to perform this task "
                 "using motor imagery,\ni.e. imagine what it would *look and feel like* "
                 "to move the cursor over the target."),
                 [(self.fixation, P.screen_c), (self.target, target_loc),
                 (self.cursor, P.screen_c)]
-            )
-            self.show_demo_text(
+            ))
+            pages.append((
                 ("When the target appears on an imagery trial, try to mentally "
                  "simulate performing\nthe thumb movement required to move the cursor "
                  "over the target (without actually moving)."),
                 [(self.fixation, P.screen_c), (self.target, target_loc),
                  (self.cursor, P.screen_c)]
-            )
-            self.show_demo_text(
+            ))
+            pages.append((
                 ("Once you have imagined the movement and are over the target (in your "
                  f"mind's eye),\nplease physically squeeze the {nondominant} trigger "
                   "to end the trial."),
                 [(feedback, P.screen_c)]
-            )
+            ))
         if P.condition == "CC":
-            self.show_demo_text(
+            pages.append((
                 ("In some parts of the study, instead of moving the cursor to the "
                  f"target, you will be\nasked to simply squeeze the {nondominant} "
                  "trigger as soon as the target appears."),
                 [(self.fixation, P.screen_c), (self.target, target_loc),
                 (self.cursor, P.screen_c)]
-            )
-            self.show_demo_text(
+            ))
+            pages.append((
                 ("As usual, pressing the trigger will end the trial and display your "
                  "reaction time.\nPlease try to respond as quickly as possible."),
                 [(feedback, P.screen_c)]
-            )
+            ))
 
+        return pages
 
-    def test_phase_instructions(self):
+
+    def test_phase_pages(self):
         # Initialize task stimuli for the demo
         target_dist = (2 * self.target_dist_min + self.target_dist_max) / 3
         target_loc = vector_to_pos(P.screen_c, target_dist, 250)
         dominant = "left" if self.handedness == "l" else "right"
         nondominant = "right" if self.handedness == "l" else "left"
 
-        self.show_demo_text(
+        pages = []
+        pages.append((
             ("For this next set of trials, please respond to targets physically using "
              "the\njoysticks on the gamepad. During this block, the cursor will "
              "alternate\nbetween red and blue."),
             [(self.fixation, P.screen_c), (self.cursor, P.screen_c)]
-        )
-        self.show_demo_text(
+        ))
+        pages.append((
             (f"When the cursor is *red*, please use the {dominant} stick to move the "
              f"cursor to\nthe target and squeeze the {nondominant} trigger to end "
              "the trial (same as before)."),
             [(self.fixation, P.screen_c), (self.target, target_loc),
              (self.cursor, P.screen_c)]
-        )
-        self.show_demo_text(
+        ))
+        pages.append((
             (f"When the cursor is *blue*, please use the *{nondominant}* stick to "
              f"control the cursor\n(with your other hand) and squeeze the *{dominant}* "
              "trigger to end the trial."),
             [(self.fixation, P.screen_c), (self.target, target_loc),
              (self.cursor_nd, P.screen_c)]
+        ))
+
+        return pages
+
+
+    def run_benchmarks(self):
+        # Measures and prints the per-frame costs of various parts of the task
+        print(format_results("Widget draw cost", widget_benchmarks()))
+        scene_costs, uploads = scene_benchmarks(self.fixation, self.target, self.cursor)
+        print(format_results("Trial display draw cost", scene_costs))
+        print(format_results("Trial display texture uploads", uploads, units="px"))
+        print(format_results("Busy event queue handling cost", input_benchmarks()))
+        mapping = P.input_mappings[P.training_mapping]
+        stick_costs = stick_benchmarks(self.cursor_dist_max, mapping)
+        print(format_results("Stick to cursor cost", stick_costs, units="ns/frame"))
+
+
+    def _completed(self, stage):
+        # Whether a setup stage was completed before resuming the session
+        return self.resume is not None and stage in self.resume.stages
+
+
+    def skip_completed_trials(self):
+        # Gets the numbers of the trials already completed in each block
+        done = {}
+        rows = self.db.select(
+            'trials', columns=['block_num', 'trial_num'],
+            where={'participant_id': P.participant_id}
         )
+        for block_num, trial_num in rows:
+            done[block_num] = max(done.get(block_num, 0), int(trial_num))
+        if not done:
+            return
+        block_num = max(done.keys())
+        trials_done = done[block_num]
+        block_len = P.practice_trials if block_num == 1 else P.trials_per_block
+        if trials_done >= block_len:
+            block_num, trials_done = (block_num + 1, 0)
+
+        self._seek_trial(block_num, trials_done)
+        if trials_done:
+            self._skip_trials = trials_done
+        print("Resuming at block {0}, trial {1}".format(block_num, trials_done + 1))
+
+
+    def _seek_trial(self, block_num, trials_done):
+        # klibs has no public way of starting partway through a session, so this
+        # moves its block and trial iterators directly. These track their
+        # positions with 'i' (as of klibs 0.7.7), so we make sure they still
+        # work that way and refuse to resume otherwise (instead of silently
+        # re-running completed trials).
+        blocks = getattr(self.blocks, 'blocks', [])
+        positions = [getattr(self.blocks, 'i', None)]
+        positions += [getattr(block, 'i', None) for block in blocks]
+        if not (len(blocks) and all(isinstance(i, int) for i in positions)):
+            e = "Unable to resume: unsupported klibs version ({0})."
+            raise RuntimeError(e.format(getattr(klibs, '__version__', "unknown")))
+        self.blocks.i = block_num - 1
+        if trials_done:
+            blocks[block_num - 1].i = trials_done
+
+
+    @property
+    def gamepad(self):
+        # The currently-attached gamepad (None if not using a gamepad)
+        return self.controllers.current
+
+
+    def wait_for_controller(self):
+        # If the controller was lost, wait until it (or another) is reconnected
+        if self.controllers.lost:
+            fill()
+            blit(self.errs['disconnected'], 5, P.screen_c)
+            flip()
+            while self.controllers.lost:
+                # Sleep until new input arrives (or briefly, so that pyusb
+                # controllers can still be re-scanned) instead of spinning
+                wait_for_event(50)
+                q = InputSnapshot()
+                ui_request(queue=q.keydown)
+                self.controllers.update(q)
+        self.show_feedback(self.errs['continue'], duration=0.5)
+        wait_for_input(self.gamepad)
+
+
+    def _due(self, task):
+        # Whether an optional per-frame task should run on the current frame
+        return self.watchdog is None or self.watchdog.due(task)
+
+
+    def log_trial_error(self, err, target_shown):
+        # Records an error for a trial that's about to be recycled, since
+        # recycled trials never get written to the trials table
+        self.db.insert({
+            'participant_id': P.participant_id,
+            'block_num': P.block_number,
+            'trial_num': P.trial_number,
+            'dominant': self.dominant,
+            'err': err,
+            'target_shown': target_shown,
+        }, table='trial_errors')
+        self.summaries.add_error(P.block_number, self.dominant, err)
+
+
+    def log_watchdog_events(self):
+        # Writes any degradations of optional per-frame work to the database
+        for event in self.watchdog.pop_events():
+            msg = "Frame over budget ({frame_ms:.1f} > {budget_ms:.1f} ms) in block "
+            msg += "{block_num}, trial {trial_num}: "
+            if event['stride'] == 0:
+                msg += "turned off {task}"
+            else:
+                msg += "reduced {task} to every {stride} frames"
+            print(msg.format(**event))
+            event['participant_id'] = P.participant_id
+            self.db.insert(event, table='frame_watchdog')
 
 
-    def show_gamepad_debug(self):
+    def show_gamepad_debug(self, update=True):
         if not self.gamepad:
             return
-
-        # Get latest axis info
-        rs_x, rs_y = self.gamepad.right_stick()
-        ls_x, ls_y = self.gamepad.left_stick()
-        lt = self.gamepad.left_trigger()
-        rt = self.gamepad.right_trigger()
-        dpad_x, dpad_y = self.gamepad.dpad()
-
-        # Blit axis state info to the bottom-right of the screen
-        info_txt = "\n".join([
-            "Left Stick: ({0}, {1})",
-            "Right Stick: ({2}, {3})",
-            "Left Trigger: {4}",
-            "Right Trigger: {5}",
-            "D-Pad: ({6}, {7})",
-        ]).format(ls_x, ls_y, rs_x, rs_y, lt, rt, dpad_x, dpad_y)
-        pad_info = message(info_txt, style='debug')
-        blit(pad_info, 1, (0, P.screen_y))
+        if self.watchdog and not self.watchdog.active('debug_overlay'):
+            return
+        # Refresh the overlay (at most at its update rate), then draw it
+        if update:
+            self.pad_overlay.update(self.gamepad)
+        self.pad_overlay.draw()
 
 
     def show_feedback(self, msg, duration=1.0, location=None):
@@ -643,20 +1054,17 @@ class MotorMapping(klibs.Experiment):
             flip()
         
     
-    def get_stick_position(self, left=False):
+    def get_stick_raw(self, left=False):
         if self.gamepad:
             if left:
-                raw_x, raw_y = self.gamepad.left_stick()
-            else:
-                raw_x, raw_y = self.gamepad.right_stick()
-        else:
-            # If no gamepad, approximate joystick with mouse movement
-            mouse_x, mouse_y = mouse_pos()
-            scale_factor = AXIS_MAX / self.cursor_dist_max
-            raw_x = int((mouse_x - P.screen_c[0]) * scale_factor)
-            raw_y = int((mouse_y - P.screen_c[1]) * scale_factor)
+                return self.gamepad.left_stick()
+            return self.gamepad.right_stick()
 
-        return joystick_scaled(raw_x, raw_y)
+        # If no gamepad, approximate joystick with mouse movement
+        scale_factor = AXIS_MAX / self.cursor_dist_max
+        raw_x = int((self.mouse.x - P.screen_c[0]) * scale_factor)
+        raw_y = int((self.mouse.y - P.screen_c[1]) * scale_factor)
+        return (raw_x, raw_y)
 
     
     def get_triggers(self):
@@ -666,8 +1074,7 @@ class MotorMapping(klibs.Experiment):
         else:
             # If no gamepad, emulate trigger press with mouse click
             raw_lt, raw_rt = (0, 0)
-            mouse_x, mouse_y = c_int(0), c_int(0)
-            if sdl2.SDL_GetMouseState(byref(mouse_x), byref(mouse_y)) != 0:
+            if self.mouse.buttons != 0:
                 # Ignore mouse button down for first 100 ms to ignore start-trial click
                 if self.evm.trial_time_ms > 100:
                     raw_lt, raw_rt = (32767, 32767)
@@ -676,40 +1083,16 @@ class MotorMapping(klibs.Experiment):
 
 
 
-def joystick_scaled(x, y, deadzone = 0.2):
-
-    # Check whether the current stick x/y exceeds the specified deadzone
-    amplitude = min(1.0, sqrt(x ** 2 + y ** 2) / AXIS_MAX)
-    if amplitude < deadzone:
-        return (0, 0)
-
-    # Smooth/standardize output coordinates to be on a circle, by capping
-    # maximum amplitude at AXIS_MAX and converting stick angle/amplitude
-    # to coordinates.
-    angle = angle_between((0, 0), (x, y))
-    amp_new = (amplitude - deadzone) / (1.0 - deadzone)
-    xs, ys = point_pos((0, 0), amp_new, angle, return_int=False)
-
-    return (xs, ys)
-
-    
 def wait_for_input(gamepad=None):
-    valid_input = [
-        sdl2.SDL_KEYDOWN,
-        sdl2.SDL_MOUSEBUTTONDOWN,
-        sdl2.SDL_CONTROLLERBUTTONDOWN,
-    ]
+    # Waits for any key, mouse button, or gamepad button to be pressed
     flush()
     user_input = False
     while not user_input:
         if gamepad:
             gamepad.update()
-        q = pump(True)
-        ui_request(queue=q)
-        for event in q:
-            if event.type in valid_input:
-                user_input = True
-                break
+        q = InputSnapshot()
+        ui_request(queue=q.keydown)
+        user_input = q.any_input
 
 
 def vector_angle(p1, p2):
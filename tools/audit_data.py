@@ -0,0 +1,347 @@
+"""Audits a MotorMapping database for common data-quality problems.
+
+The ``trials`` and ``gamepad`` tables are scanned in fixed-size chunks, and each
+check is done with vectorized NumPy operations over the whole chunk:
+
+- ``sample_gap``: gaps between consecutive cursor samples within a trial longer
+  than ``--gap-ms``. Since cursor samples are only logged when the cursor moves,
+  the default threshold is well above the refresh interval.
+- ``out_of_range``: cursor samples further from the origin than the cursor's
+  maximum distance (8 degrees), using each participant's screen geometry as
+  estimated from their target locations.
+- ``rt_order``: trials where ``movement_rt <= contact_rt <= response_rt``
+  doesn't hold.
+- ``no_samples``: physical (PP) trials with a response and no error, but no
+  cursor samples in the ``gamepad`` table.
+
+With ``--raw``, the per-frame raw input archives (see ``raw_archive`` in the
+params file) are also checked for gaps between frames and for ``frozen_stick``:
+runs of at least ``--frozen-frames`` frames where neither stick's raw values
+changed at all while the triggers did.
+
+Usage:
+    python tools/audit_data.py [--db path/to/MotorMapping.db] [--raw] [-o flags.txt]
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import io
+import sys
+import glob
+import time
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from dbutils import EXP_ASSETS, connect, default_db_path
+from trajectory_heatmap import estimate_geometry
+
+sys.path.insert(0, os.path.join(EXP_ASSETS, "Resources", "code"))
+from archive import read_archive
+
+CURSOR_DIST_MAX = 8.0  # degrees
+CHECKS = [
+    'sample_gap', 'out_of_range', 'rt_order', 'no_samples', 'raw_gap', 'frozen_stick'
+]
+
+
+def trial_keys(pid, block, trial):
+    """Packs participant, block, and trial numbers into single int64 trial keys.
+
+    """
+    pid = np.asarray(pid, dtype=np.int64)
+    block = np.asarray(block, dtype=np.int64)
+    trial = np.asarray(trial, dtype=np.int64)
+    return (pid << 24) | (block << 16) | trial
+
+
+def unpack_keys(keys):
+    """Unpacks trial keys into participant, block, and trial number arrays.
+
+    """
+    return (keys >> 24, (keys >> 16) & 0xFF, keys & 0xFFFF)
+
+
+class AuditResults(object):
+    """Collects the flagged trials and counts for each check.
+
+    """
+    def __init__(self):
+        self.keys = OrderedDict((c, []) for c in CHECKS)
+        self.counts = OrderedDict((c, []) for c in CHECKS)
+        self.raw = []
+
+    def flag(self, check, keys, counts=None):
+        """Records flagged trials (and the number of flagged rows in each).
+
+        """
+        keys = np.asarray(keys, dtype=np.int64)
+        if not len(keys):
+            return
+        if counts is None:
+            counts = np.ones(len(keys), dtype=np.int64)
+        self.keys[check].append(keys)
+        self.counts[check].append(np.asarray(counts, dtype=np.int64))
+
+    def flagged(self, check):
+        """Gets the flagged trial keys and their flagged row counts for a check.
+
+        Trials flagged in more than one chunk are combined.
+
+        """
+        if not len(self.keys[check]):
+            return (np.zeros(0, np.int64), np.zeros(0, np.int64))
+        keys = np.concatenate(self.keys[check])
+        counts = np.concatenate(self.counts[check])
+        uniq, idx = np.unique(keys, return_inverse=True)
+        return (uniq, np.bincount(idx.reshape(-1), weights=counts).astype(np.int64))
+
+
+def _rt(values):
+    arr = np.asarray(values, dtype=object)
+    arr[(arr == "NA") | (arr == None)] = np.nan
+    return arr.astype(np.float64)
+
+
+def audit_trials(db, results, chunk_size=200000):
+    """Checks RT ordering in the trials table.
+
+    Returns:
+        tuple: The number of trials scanned, and the keys of responded PP
+        trials without errors (which should all have cursor samples).
+
+    """
+    cur = db.execute(
+        "SELECT participant_id, block_num, trial_num, trial_type, movement_rt, "
+        "contact_rt, response_rt, err FROM trials"
+    )
+    total = 0
+    expected = []
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        cols = list(zip(*rows))
+        keys = trial_keys(cols[0], cols[1], cols[2])
+        movement, contact, response = (_rt(cols[4]), _rt(cols[5]), _rt(cols[6]))
+        with np.errstate(invalid='ignore'):
+            bad = (movement > contact) | (contact > response) | (movement > response)
+        results.flag('rt_order', keys[bad])
+
+        ok = np.asarray(cols[7], dtype=object) == "NA"
+        pp = np.asarray(cols[3], dtype=object) == "PP"
+        expected.append(keys[ok & pp & ~np.isnan(response)])
+        total += len(rows)
+    expected = np.concatenate(expected) if expected else np.zeros(0, np.int64)
+    return (total, expected)
+
+
+def audit_samples(db, results, gap_ms=250, chunk_size=500000):
+    """Checks cursor samples for gaps and out-of-range positions.
+
+    Samples are read in storage order (where each trial's samples are stored
+    together), carrying the last sample of each chunk over to the next so that
+    gaps spanning chunk boundaries aren't missed.
+
+    Returns:
+        tuple: The number of samples scanned, and the keys of all trials with
+        at least one sample.
+
+    """
+    ids, geometry = estimate_geometry(db)
+    cur = db.execute(
+        "SELECT participant_id, block_num, trial_num, time, stick_x, stick_y "
+        "FROM gamepad ORDER BY id"
+    )
+    total = 0
+    sampled = []
+    carry = None
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        arr = np.asarray(rows, dtype=np.float64)
+        keys = trial_keys(arr[:, 0], arr[:, 1], arr[:, 2])
+        t = arr[:, 3]
+        sampled.append(np.unique(keys))
+
+        # Check for long gaps between consecutive samples in the same trial
+        if carry is not None:
+            prev_keys = np.concatenate([[carry[0]], keys[:-1]])
+            prev_t = np.concatenate([[carry[1]], t[:-1]])
+        else:
+            prev_keys = np.concatenate([[-1], keys[:-1]])
+            prev_t = np.concatenate([[0.0], t[:-1]])
+        gap = (keys == prev_keys) & ((t - prev_t) > gap_ms)
+        if gap.any():
+            uniq, n = np.unique(keys[gap], return_counts=True)
+            results.flag('sample_gap', uniq, n)
+        carry = (keys[-1], t[-1])
+
+        # Check for samples beyond the cursor's maximum distance from origin
+        pid = arr[:, 0].astype(np.int64)
+        idx = np.clip(np.searchsorted(ids, pid), 0, max(len(ids) - 1, 0))
+        known = (ids[idx] == pid) if len(ids) else np.zeros(len(pid), bool)
+        geo = geometry[idx] if len(ids) else np.ones((len(pid), 3))
+        dist = np.hypot(arr[:, 4] - geo[:, 0], arr[:, 5] - geo[:, 1])
+        # Allow 1 px of slack for rounding of cursor positions
+        outside = known & (dist > CURSOR_DIST_MAX * geo[:, 2] + 1.0)
+        if outside.any():
+            uniq, n = np.unique(keys[outside], return_counts=True)
+            results.flag('out_of_range', uniq, n)
+        total += len(rows)
+
+    sampled = np.unique(np.concatenate(sampled)) if sampled else np.zeros(0, np.int64)
+    return (total, sampled)
+
+
+def audit_raw(raw_dir, results, gap_ms=50, frozen_frames=30):
+    """Checks the raw per-frame input archives for frame gaps and frozen sticks.
+
+    Returns:
+        int: The number of raw frames scanned.
+
+    """
+    total = 0
+    for path in sorted(glob.glob(os.path.join(raw_dir, "*.idx"))):
+        samples, index = read_archive(path)
+        if not len(index):
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        # Map each indexed sample to its trial
+        trial = np.repeat(np.arange(len(index)), index['count'].astype(np.int64))
+        sel = np.concatenate([
+            np.arange(o, o + c) for o, c in zip(index['offset'], index['count'])
+        ]).astype(np.int64)
+        s = samples[sel]
+        n = len(s)
+        total += n
+        flags = OrderedDict()
+
+        # Check for long gaps between frames within a trial, allowing for trials
+        # where the archive only recorded every Nth frame
+        same = np.zeros(n, dtype=bool)
+        same[1:] = trial[1:] == trial[:-1]
+        dt = np.zeros(n)
+        dt[1:] = np.diff(s['time']) * 1000
+        stride = np.maximum(index['stride'], 1).astype(np.float64)[trial]
+        flags['raw_gap'] = same & (dt > gap_ms * stride)
+
+        # Find runs of frames where neither stick changed at all
+        sticks = np.stack([s['left_x'], s['left_y'], s['right_x'], s['right_y']], 1)
+        triggers = np.stack([s['left_trigger'], s['right_trigger']], 1)
+        still = np.zeros(n, dtype=bool)
+        still[1:] = same[1:] & (sticks[1:] == sticks[:-1]).all(axis=1)
+        moved = np.zeros(n, dtype=np.int64)
+        moved[1:] = (same[1:] & (triggers[1:] != triggers[:-1]).any(axis=1))
+        edges = np.diff(np.concatenate([[0], still.astype(np.int8), [0]]))
+        starts, ends = (np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))
+        changes = np.concatenate([[0], np.cumsum(moved)])
+        long_run = (ends - starts) >= frozen_frames
+        trig_changed = (changes[ends] - changes[starts]) > 0
+        frozen = np.zeros(n, dtype=bool)
+        for a, b in zip(starts[long_run & trig_changed], ends[long_run & trig_changed]):
+            frozen[a:b] = True
+        flags['frozen_stick'] = frozen
+
+        for check, mask in flags.items():
+            if not mask.any():
+                continue
+            bad, counts = np.unique(trial[mask], return_counts=True)
+            for i, c in zip(bad, counts):
+                rec = index[i]
+                results.raw.append(
+                    (check, name, int(rec['block_num']), int(rec['trial_num']), int(c))
+                )
+    return total
+
+
+def summarize(results, n_trials, n_samples, n_raw):
+    """Builds the compact report table of flagged trials for each check.
+
+    """
+    lines = []
+    header = "{0:<14}{1:>10}{2:>12}{3:>14}".format(
+        "check", "trials", "rows", "participants"
+    )
+    lines.append(header)
+    lines.append("-" * len(header))
+    for check in CHECKS[:4]:
+        keys, counts = results.flagged(check)
+        pids = np.unique(unpack_keys(keys)[0]) if len(keys) else []
+        lines.append("{0:<14}{1:>10}{2:>12}{3:>14}".format(
+            check, len(keys), int(counts.sum()), len(pids)
+        ))
+    if n_raw:
+        for check in CHECKS[4:]:
+            recs = [r for r in results.raw if r[0] == check]
+            files = set(r[1] for r in recs)
+            lines.append("{0:<14}{1:>10}{2:>12}{3:>14}".format(
+                check, len(recs), sum(r[4] for r in recs), len(files)
+            ))
+    lines.append("")
+    lines.append("Scanned {0} trials and {1} cursor samples{2}.".format(
+        n_trials, n_samples, " ({0} raw frames)".format(n_raw) if n_raw else ""
+    ))
+    return "\n".join(lines)
+
+
+def write_flags(path, results):
+    """Writes every flagged trial to a tab-separated text file.
+
+    """
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write("check\tsource\tparticipant_id\tblock_num\ttrial_num\trows\n")
+        for check in CHECKS[:4]:
+            keys, counts = results.flagged(check)
+            pid, block, trial = unpack_keys(keys)
+            for row in zip(pid, block, trial, counts):
+                f.write("{0}\tdb\t{1}\t{2}\t{3}\t{4}\n".format(check, *row))
+        for check, name, block, trial, n in results.raw:
+            row = [check, name, "NA", block, trial, n]
+            f.write("\t".join(str(v) for v in row) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--db', default=default_db_path(),
+        help="database to audit (default: the project database)")
+    parser.add_argument('-o', '--output', default=None,
+        help="tab-separated file to write all flagged trials to")
+    parser.add_argument('--gap-ms', type=float, default=250,
+        help="max gap between cursor samples within a trial (default: 250)")
+    raw_dir = os.path.join(EXP_ASSETS, "Data", "raw")
+    parser.add_argument('--raw', nargs='?', const=raw_dir, default=None,
+        help="also audit the raw input archives in the given folder "
+        "(default: ExpAssets/Data/raw)")
+    parser.add_argument('--raw-gap-ms', type=float, default=50,
+        help="max gap between raw input frames (default: 50)")
+    parser.add_argument('--frozen-frames', type=int, default=30,
+        help="min run of unchanged raw stick frames to flag (default: 30)")
+    parser.add_argument('--chunk-size', type=int, default=500000,
+        help="number of rows to load at a time (default: 500000)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = AuditResults()
+    db = connect(args.db)
+    n_trials, expected = audit_trials(db, results, args.chunk_size)
+    n_samples, sampled = audit_samples(db, results, args.gap_ms, args.chunk_size)
+    db.close()
+    results.flag('no_samples', expected[~np.isin(expected, sampled)])
+    n_raw = 0
+    if args.raw:
+        n_raw = audit_raw(args.raw, results, args.raw_gap_ms, args.frozen_frames)
+
+    print(summarize(results, n_trials, n_samples, n_raw))
+    print("Audit took {0:.2f} s.".format(time.perf_counter() - start))
+    if args.output:
+        write_flags(args.output, results)
+        print("Flagged trials written to '{0}'.".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Checks that the task's stick-to-cursor mapping matches the original trig-based one.
+
+The cursor used to be positioned by converting each raw stick sample to an angle
+and amplitude and back again (using klibs' ``angle_between`` and ``point_pos``).
+``CursorMapper`` (in ``ExpAssets/Resources/code/stick.py``) now does the same
+rescaling directly without any trig. This script compares the cursor positions
+from both for a large, reproducible set of random raw stick samples (plus a fixed
+set of edge cases along the axes, diagonals, and deadzone boundary) for every
+input mapping in the params file and a range of maximum cursor distances.
+
+It doesn't need klibs, SDL2, or a display, and exits with a non-zero status if
+any positions differ.
+
+Usage:
+    python tools/check_stick_mapping.py [--samples 20000]
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import sys
+import math
+import random
+import argparse
+
+from dbutils import EXP_ASSETS
+
+sys.path.insert(0, os.path.join(EXP_ASSETS, "Resources", "code"))
+from stick import AXIS_MAX, CursorMapper
+
+PARAMS_PATH = os.path.join(EXP_ASSETS, "Config", "MotorMapping_params.py")
+
+# Maximum cursor distances (8 degrees in px) for a range of screen setups
+MAX_DISTS = [160, 257, 317, 400, 533, 641]
+ORIGINS = [(640, 400), (960, 540), (1280, 720)]
+
+
+def _angle_between(origin, p2):
+    # Copied from klibs.KLUtilities.angle_between (without rotation)
+    angle = math.degrees(math.atan2(p2[1] - origin[1], p2[0] - origin[0]))
+    return -angle % 360
+
+
+def _point_pos(origin, amplitude, angle):
+    # Copied from klibs.KLUtilities.point_pos (without rotation, as floats)
+    theta = math.radians(angle * -1)
+    return (origin[0] + amplitude * math.cos(theta),
+            origin[1] + amplitude * math.sin(theta))
+
+
+def legacy_cursor_pos(x, y, origin, max_dist, mapping, deadzone=0.2):
+    """Gets the cursor position for a raw stick sample using the original
+    trig-based stick scaling and cursor mapping.
+
+    """
+    amplitude = min(1.0, math.sqrt(x ** 2 + y ** 2) / AXIS_MAX)
+    if amplitude < deadzone:
+        xs, ys = (0, 0)
+    else:
+        angle = _angle_between((0, 0), (x, y))
+        amp_new = (amplitude - deadzone) / (1.0 - deadzone)
+        xs, ys = _point_pos((0, 0), amp_new, angle)
+    return (
+        origin[0] + int(xs * max_dist * mapping[0]),
+        origin[1] + int(ys * max_dist * mapping[1])
+    )
+
+
+def stick_samples(n, seed=530453080):
+    """Generates a reproducible set of raw stick samples covering the full range,
+    including the axes, diagonals, deadzone edges, and extreme values.
+
+    """
+    rng = random.Random(seed)
+    lo, hi = (-AXIS_MAX, AXIS_MAX - 1)
+    samples = [(rng.randint(lo, hi), rng.randint(lo, hi)) for i in range(n)]
+    for v in (0, 1, 6553, 6554, 16384, 23170, 23171, 32767, -32768):
+        samples += [(v, 0), (0, v), (v, v), (-v, v), (v, -v)]
+    return samples
+
+
+def load_mappings():
+    """Loads the input mappings from the project's params file.
+
+    """
+    params = {}
+    with open(PARAMS_PATH, "r") as f:
+        exec(f.read(), params)
+    return params['input_mappings']
+
+
+def check(samples, mappings):
+    """Compares the legacy and current cursor positions for each stick sample.
+
+    Returns:
+        tuple: The number of comparisons made, and a list of
+        ``(mapping, max_dist, raw_x, raw_y, legacy, new)`` tuples for any samples
+        where the cursor positions differ.
+
+    """
+    n = 0
+    mismatches = []
+    for origin in ORIGINS:
+        for max_dist in MAX_DISTS:
+            mapper = CursorMapper(origin, max_dist)
+            for name, mapping in mappings.items():
+                mapper.set_mapping(mapping)
+                for x, y in samples:
+                    legacy = legacy_cursor_pos(x, y, origin, max_dist, mapping)
+                    new = mapper.position(x, y)
+                    if legacy != new:
+                        mismatches.append((name, max_dist, x, y, legacy, new))
+                n += len(samples)
+    return (n, mismatches)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--samples', type=int, default=20000,
+        help="number of random stick samples to check (default: 20000)")
+    args = parser.parse_args()
+
+    samples = stick_samples(args.samples)
+    n, mismatches = check(samples, load_mappings())
+    if mismatches:
+        print("Cursor positions differ for {0} of {1} samples:".format(
+            len(mismatches), n
+        ))
+        for m in mismatches[:10]:
+            print(" - {0} (max dist {1}) {2}, {3}: {4} vs {5}".format(*m))
+        sys.exit(1)
+    print("Cursor positions identical for all {0} samples.".format(n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Shared helpers for the offline tools that work with MotorMapping databases."""
+
+__author__ = "Austin Hurst"
+
+import os
+import sqlite3
+
+PROJECT_NAME = "MotorMapping"
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXP_ASSETS = os.path.join(PROJECT_ROOT, "ExpAssets")
+
+
+def default_db_path():
+    """Gets the path of the project's main klibs database.
+
+    """
+    return os.path.join(EXP_ASSETS, PROJECT_NAME + ".db")
+
+
+def schema_path():
+    """Gets the path of the project's database schema file.
+
+    """
+    return os.path.join(EXP_ASSETS, "Config", PROJECT_NAME + "_schema.sql")
+
+
+def connect(path, create=False):
+    """Opens a connection to an experiment database.
+
+    Args:
+        path (str): The path of the database file to open.
+        create (bool, optional): If True, a new database will be created using the
+            project's schema if the file doesn't already exist. Defaults to False.
+
+    Returns:
+        :obj:`sqlite3.Connection`: A connection to the database.
+
+    """
+    exists = os.path.isfile(path)
+    if not (exists or create):
+        raise IOError("No database found at '{0}'.".format(path))
+    db = sqlite3.connect(path)
+    if not exists:
+        with open(schema_path(), "r") as f:
+            db.executescript(f.read())
+        db.commit()
+    return db
+
+
+def table_columns(db, table, schema="main"):
+    """Gets the names of the columns for a given table in a database.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+        table (str): The name of the table.
+        schema (str, optional): The name of the attached database containing the
+            table. Defaults to the main database.
+
+    Returns:
+        list: The names of all columns in the table, in order.
+
+    """
+    rows = db.execute("PRAGMA {0}.table_info({1})".format(schema, table)).fetchall()
+    return [row[1] for row in rows]
@@ -0,0 +1,227 @@
+"""Merges MotorMapping databases from multiple lab computers into one.
+
+Participant IDs from different stations collide, so each source's participants are
+given new IDs in the merged database and all of their trials, KVIQ responses, and
+gamepad samples are remapped to match. Participants are deduplicated by userhash,
+so merging the same database twice won't duplicate data. Note that this means no
+data is merged for participants who are already in the merged database: if a
+newer copy of a source has more trials for a participant than were merged before,
+a warning is printed and that participant's data should be merged by hand.
+Databases created with older versions of the schema can be merged too: required
+columns they're missing (e.g. ``onset_err`` in the trials table) are set to 'NA'.
+
+All copying is done in SQLite with ``INSERT ... SELECT`` on an attached source
+database, with each source merged in a single transaction. Completed sources are
+recorded in a ``merge_log`` table in the merged database, so an interrupted merge
+can be resumed by re-running the same command.
+
+Usage:
+    python tools/merge_dbs.py merged.db station1.db station2.db ...
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import sys
+import time
+import argparse
+
+from dbutils import connect, table_columns
+
+# Tables with per-participant data to copy (other than the participants table)
+DATA_TABLES = [
+    'trials', 'trial_errors', 'kviq', 'trial_kinematics', 'trial_bins',
+    'trial_bin_errors', 'gamepad', 'frame_watchdog',
+]
+
+
+def _quoted(cols, prefix=""):
+    return ", ".join('{0}"{1}"'.format(prefix, c) for c in cols)
+
+
+def _missing_required(db, table, cols):
+    # Gets any NOT NULL columns (without defaults) in a merged table that aren't
+    # in the given list of source columns, e.g. columns added since the source
+    # database was created
+    info = db.execute("PRAGMA main.table_info({0})".format(table)).fetchall()
+    return [
+        name for cid, name, ctype, notnull, default, pk in info
+        if notnull and default is None and not pk
+        and name not in cols and name != 'participant_id'
+    ]
+
+
+def _fingerprint(path):
+    # Identifies a specific version of a source database
+    stat = os.stat(path)
+    return (os.path.abspath(path), stat.st_size, int(stat.st_mtime))
+
+
+def init_merge_log(db):
+    db.execute(
+        "CREATE TABLE IF NOT EXISTS merge_log (source text not null, "
+        "size integer not null, mtime integer not null, participants integer not "
+        "null, skipped integer not null, merged text not null)"
+    )
+
+
+def already_merged(db, source):
+    path, size, mtime = _fingerprint(source)
+    q = "SELECT 1 FROM merge_log WHERE source = ? AND size = ? AND mtime = ?"
+    return db.execute(q, (path, size, mtime)).fetchone() is not None
+
+
+def merge_source(db, source):
+    """Merges all participants and their data from a source database.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The connection to the merged database.
+        source (str): The path of the database to merge into it.
+
+    Returns:
+        dict: The number of participants merged and skipped (as duplicates), the
+        number of rows copied for each data table, and a list of
+        ``(userhash, source_trials, merged_trials)`` tuples for any skipped
+        participants with more trials in the source than in the merged database.
+
+    """
+    counts = {}
+    db.execute("ATTACH DATABASE ? AS src", (source,))
+    try:
+        db.execute("BEGIN")
+        db.execute("DROP TABLE IF EXISTS temp.new_ids")
+        db.execute("DROP TABLE IF EXISTS temp.idmap")
+
+        # Find source participants not already in the merged database
+        db.execute(
+            "CREATE TEMP TABLE new_ids AS SELECT MIN(id) AS old_id, userhash "
+            "FROM src.participants WHERE userhash NOT IN "
+            "(SELECT userhash FROM main.participants) GROUP BY userhash"
+        )
+        total = db.execute("SELECT COUNT(*) FROM src.participants").fetchone()[0]
+
+        # Copy new participants, letting them get new IDs
+        cols = [
+            c for c in table_columns(db, 'participants', 'src')
+            if c != 'id' and c in table_columns(db, 'participants')
+        ]
+        db.execute(
+            "INSERT INTO main.participants ({0}) SELECT {0} FROM src.participants "
+            "WHERE id IN (SELECT old_id FROM temp.new_ids) ORDER BY id"
+            .format(_quoted(cols))
+        )
+
+        # Map the old participant IDs to the new ones
+        db.execute(
+            "CREATE TEMP TABLE idmap (old_id integer primary key, new_id integer)"
+        )
+        db.execute(
+            "INSERT INTO temp.idmap SELECT n.old_id, m.id FROM temp.new_ids AS n "
+            "JOIN main.participants AS m ON m.userhash = n.userhash"
+        )
+        counts['participants'] = db.execute(
+            "SELECT COUNT(*) FROM temp.idmap"
+        ).fetchone()[0]
+        counts['skipped'] = total - counts['participants']
+
+        # Check for skipped participants with trials that were never merged
+        # (e.g. from a newer copy of a database that was merged before)
+        counts['incomplete'] = db.execute(
+            "SELECT p.userhash, s.n, COALESCE(m.n, 0) FROM src.participants AS p "
+            "JOIN (SELECT participant_id, COUNT(*) AS n FROM src.trials "
+            "GROUP BY participant_id) AS s ON s.participant_id = p.id "
+            "JOIN main.participants AS mp ON mp.userhash = p.userhash "
+            "LEFT JOIN (SELECT participant_id, COUNT(*) AS n FROM main.trials "
+            "GROUP BY participant_id) AS m ON m.participant_id = mp.id "
+            "WHERE p.id NOT IN (SELECT old_id FROM temp.idmap) "
+            "AND s.n > COALESCE(m.n, 0)"
+        ).fetchall()
+
+        # Copy all data for the new participants with remapped IDs
+        for table in DATA_TABLES:
+            cols = [
+                c for c in table_columns(db, table, 'src')
+                if c not in ('id', 'participant_id') and c in table_columns(db, table)
+            ]
+            if not cols:
+                # Older databases may be missing newer tables
+                counts[table] = 0
+                continue
+            # Fill any required columns missing from older databases with 'NA'
+            missing = _missing_required(db, table, cols)
+            values = _quoted(cols, "t.") + ", 'NA'" * len(missing)
+            cur = db.execute(
+                "INSERT INTO main.{0} (participant_id, {1}) "
+                "SELECT m.new_id, {2} FROM src.{0} AS t "
+                "JOIN temp.idmap AS m ON t.participant_id = m.old_id ORDER BY t.id"
+                .format(table, _quoted(cols + missing), values)
+            )
+            counts[table] = cur.rowcount
+
+        # Record the source as merged so it can be skipped when resuming
+        path, size, mtime = _fingerprint(source)
+        db.execute(
+            "INSERT INTO merge_log VALUES (?, ?, ?, ?, ?, datetime('now'))",
+            (path, size, mtime, counts['participants'], counts['skipped'])
+        )
+        db.execute("COMMIT")
+    except Exception:
+        db.execute("ROLLBACK")
+        raise
+    finally:
+        db.execute("DROP TABLE IF EXISTS temp.new_ids")
+        db.execute("DROP TABLE IF EXISTS temp.idmap")
+        db.execute("DETACH DATABASE src")
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('output',
+        help="merged database (created from the project schema if missing)")
+    parser.add_argument('sources', nargs='+', help="databases to merge")
+    parser.add_argument('--fast', action='store_true',
+        help="disable fsync while merging (faster, but unsafe on power loss)")
+    args = parser.parse_args()
+
+    db = connect(args.output, create=True)
+    db.isolation_level = None  # we manage transactions ourselves
+    if args.fast:
+        db.execute("PRAGMA synchronous = OFF")
+    db.execute("PRAGMA temp_store = MEMORY")
+    init_merge_log(db)
+
+    for source in args.sources:
+        if os.path.abspath(source) == os.path.abspath(args.output):
+            continue
+        if not os.path.isfile(source):
+            print("Skipping '{0}': file not found.".format(source))
+            continue
+        if already_merged(db, source):
+            print("Skipping '{0}': already merged.".format(source))
+            continue
+        start = time.perf_counter()
+        counts = merge_source(db, source)
+        elapsed = time.perf_counter() - start
+        print(
+            "Merged '{0}' in {1:.1f} s: {2} participants ({3} duplicates skipped), "
+            "{4} trials, {5} kviq, {6} gamepad rows.".format(
+                source, elapsed, counts['participants'], counts['skipped'],
+                counts['trials'], counts['kviq'], counts['gamepad'],
+            )
+        )
+        for userhash, src_n, merged_n in counts['incomplete']:
+            print(
+                " - Warning: participant {0} has {1} trials in '{2}' but only {3} "
+                "in the merged database (not merged).".format(
+                    userhash, src_n, source, merged_n
+                )
+            )
+        sys.stdout.flush()
+
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+"""Rebuilds the binned performance summary tables from existing trial data.
+
+During a session, the ``trial_bins`` and ``trial_bin_errors`` tables are updated
+as each bin of trials is completed. This tool (re)creates them from the full
+``trials`` and ``trial_errors`` tables for historical data, sessions that ended
+early, and databases from other tools (e.g. synthetic or merged databases), so
+that analyses and dashboards only need to query the small summary tables.
+
+All trials are loaded and summarized in a single vectorized pass with NumPy.
+
+Usage:
+    python tools/rebuild_summaries.py [--db path/to/MotorMapping.db] [--missing]
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from dbutils import EXP_ASSETS, connect, default_db_path, table_columns
+
+# Use the same binning and columns as the experiment
+sys.path.insert(0, os.path.join(EXP_ASSETS, "Resources", "code"))
+from summaries import BIN_SIZE, RT_COLS, is_dominant
+
+SUMMARY_TABLES = ['trial_bins', 'trial_bin_errors']
+
+
+def load_trials(db, missing_only=False):
+    """Loads the trial data needed for the summaries into NumPy arrays.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+        missing_only (bool, optional): If True, only trials for participants
+            without any existing summaries will be loaded. Defaults to False.
+
+    Returns:
+        dict: Arrays of participant IDs, block numbers, hands (1 = dominant),
+        bin numbers, RTs (with NaN for missing values), and error codes.
+
+    """
+    q = (
+        "SELECT participant_id, block_num, trial_num, dominant, movement_rt, "
+        "contact_rt, response_rt, err FROM trials"
+    )
+    if missing_only:
+        q += " WHERE participant_id NOT IN (SELECT participant_id FROM trial_bins)"
+    rows = db.execute(q).fetchall()
+
+    cols = list(zip(*rows)) if len(rows) else [[]] * 8
+    out = {
+        'participant_id': np.asarray(cols[0], dtype=np.int64),
+        'block_num': np.asarray(cols[1], dtype=np.int64),
+        'bin': (np.asarray(cols[2], dtype=np.int64) - 1) // BIN_SIZE + 1,
+        'dominant': np.asarray([is_dominant(d) for d in cols[3]], dtype=np.int64),
+        'err': np.asarray(cols[7], dtype=object),
+    }
+    for i, col in enumerate(RT_COLS):
+        vals = np.asarray(cols[4 + i], dtype=object)
+        vals[vals == "NA"] = np.nan
+        out[col] = vals.astype(np.float64)
+    return out
+
+
+def load_errors(db, missing_only=False):
+    """Loads the errors for recycled trials into NumPy arrays.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+        missing_only (bool, optional): If True, only errors for participants
+            without any existing summaries will be loaded. Defaults to False.
+
+    Returns:
+        dict: Arrays of participant IDs, block numbers, hands (1 = dominant),
+        bin numbers, and error codes.
+
+    """
+    rows = []
+    # NOTE: Databases created before the trial_errors table was added won't have it
+    if len(table_columns(db, 'trial_errors')):
+        q = (
+            "SELECT participant_id, block_num, trial_num, dominant, err "
+            "FROM trial_errors"
+        )
+        if missing_only:
+            q += " WHERE participant_id NOT IN (SELECT participant_id FROM trial_bins)"
+        rows = db.execute(q).fetchall()
+
+    cols = list(zip(*rows)) if len(rows) else [[]] * 5
+    return {
+        'participant_id': np.asarray(cols[0], dtype=np.int64),
+        'block_num': np.asarray(cols[1], dtype=np.int64),
+        'bin': (np.asarray(cols[2], dtype=np.int64) - 1) // BIN_SIZE + 1,
+        'dominant': np.asarray([is_dominant(d) for d in cols[3]], dtype=np.int64),
+        'err': np.asarray(cols[4], dtype=object),
+    }
+
+
+def _group_stats(groups, n_groups, values):
+    # Gets the counts, means, and medians of the non-missing values in each group
+    valid = ~np.isnan(values)
+    g = groups[valid]
+    v = values[valid]
+    order = np.lexsort((v, g))
+    g, v = g[order], v[order]
+    counts = np.bincount(g, minlength=n_groups)
+    sums = np.bincount(g, weights=v, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+    has = counts > 0
+    means = np.full(n_groups, np.nan)
+    medians = np.full(n_groups, np.nan)
+    means[has] = sums[has] / counts[has]
+    lo = v[(starts + (counts - 1) // 2)[has]]
+    hi = v[(starts + counts // 2)[has]]
+    medians[has] = (lo + hi) / 2.0
+    return means, medians
+
+
+def summarize(trials, errors=None):
+    """Summarizes all loaded trials by participant, block, hand, and bin.
+
+    Args:
+        trials (dict): The trial data arrays returned by :func:`load_trials`.
+        errors (dict, optional): The recycled trial errors returned by
+            :func:`load_errors`, to be counted along with any trial errors.
+
+    Returns:
+        tuple: A list of rows for the ``trial_bins`` table and a list of rows for
+        the ``trial_bin_errors`` table.
+
+    """
+    key_cols = ['participant_id', 'block_num', 'dominant', 'bin']
+    if errors is None:
+        errors = {k: np.zeros(0, np.int64) for k in key_cols}
+        errors['err'] = np.zeros(0, dtype=object)
+    keys = np.stack([
+        np.concatenate([trials[col], errors[col]]) for col in key_cols
+    ], axis=1)
+    if not len(keys):
+        return ([], [])
+    groups, idx = np.unique(keys, axis=0, return_inverse=True)
+    idx = idx.reshape(-1)
+    n = len(groups)
+    n_trials = len(trials['participant_id'])
+    trial_idx, recycled_idx = (idx[:n_trials], idx[n_trials:])
+
+    # Count errors from both recycled trials and trials with error codes
+    has_err = trials['err'] != "NA"
+    err_idx = np.concatenate([trial_idx[has_err], recycled_idx])
+    err_codes = np.concatenate([trials['err'][has_err], errors['err']])
+
+    timeout = ~has_err & np.isnan(trials['response_rt'])
+    counts = np.bincount(trial_idx, minlength=n)
+    timeouts = np.bincount(trial_idx, weights=timeout, minlength=n).astype(np.int64)
+    n_errors = np.bincount(err_idx, minlength=n).astype(np.int64)
+    stats = [_group_stats(trial_idx, n, trials[col]) for col in RT_COLS]
+
+    def na(x):
+        return "NA" if np.isnan(x) else float(x)
+
+    rows = []
+    for i in range(n):
+        row = [int(x) for x in groups[i]]
+        row += [int(counts[i]), int(timeouts[i]), int(n_errors[i])]
+        for means, medians in stats:
+            row += [na(means[i]), na(medians[i])]
+        rows.append(tuple(row))
+
+    # Count trials by error code within each group
+    err_rows = []
+    if len(err_idx):
+        codes, code_idx = np.unique(err_codes.astype(str), return_inverse=True)
+        pairs = np.stack([err_idx, code_idx.reshape(-1)], axis=1)
+        pairs, pair_counts = np.unique(pairs, axis=0, return_counts=True)
+        for (g, e), count in zip(pairs, pair_counts):
+            err_rows.append(
+                tuple(int(x) for x in groups[g]) + (str(codes[e]), int(count))
+            )
+    return (rows, err_rows)
+
+
+def write_summaries(db, rows, err_rows, participants=None):
+    """Replaces the summaries for the given participants (or all participants).
+
+    """
+    with db:
+        for table in SUMMARY_TABLES:
+            if participants is None:
+                db.execute("DELETE FROM {0}".format(table))
+            else:
+                db.executemany(
+                    "DELETE FROM {0} WHERE participant_id = ?".format(table),
+                    [(int(p),) for p in participants]
+                )
+        db.executemany(
+            "INSERT INTO trial_bins (participant_id, block_num, dominant, bin, "
+            "trials, timeouts, errors, mean_movement, median_movement, "
+            "mean_contact, median_contact, mean_response, median_response) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows
+        )
+        db.executemany(
+            "INSERT INTO trial_bin_errors (participant_id, block_num, dominant, "
+            "bin, err, count) VALUES (?, ?, ?, ?, ?, ?)", err_rows
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--db', default=default_db_path(),
+        help="database to summarize (default: the project database)")
+    parser.add_argument('--missing', action='store_true',
+        help="only summarize participants that don't have summaries yet")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = connect(args.db)
+    trials = load_trials(db, args.missing)
+    errors = load_errors(db, args.missing)
+    rows, err_rows = summarize(trials, errors)
+    participants = None
+    if args.missing:
+        ids = [trials['participant_id'], errors['participant_id']]
+        participants = np.unique(np.concatenate(ids))
+    write_summaries(db, rows, err_rows, participants)
+    db.close()
+    print("Summarized {0} trials into {1} bins in {2:.1f} s.".format(
+        len(trials['participant_id']), len(rows), time.perf_counter() - start
+    ))
+
+
+if __name__ == "__main__":
+    main()
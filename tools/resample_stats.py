@@ -0,0 +1,257 @@
+"""Compares lateral transfer between conditions with bootstrap and permutation tests.
+
+For each participant, the costs of switching to the non-dominant hand in the test
+block (non-dominant minus dominant mean response RT, mean contact RT, and error
+rate) are computed from the ``trial_bins`` summary table. The error rate is the
+proportion of attempts that timed out or were recycled after an error (see the
+``trial_errors`` table), so recycled trials count as attempts. Each pair of
+conditions (PP, MI, CC) is then compared on each outcome, with bootstrap
+confidence intervals for the difference in group means and permutation p-values.
+
+Resamples are generated in vectorized batches that are spread across a pool of
+worker processes. Each batch gets its own seed spawned from a single root seed,
+so results are identical for a given seed regardless of the number of workers.
+
+Usage:
+    python tools/resample_stats.py --db merged.db -n 10000 --seed 1234
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import time
+import argparse
+from itertools import combinations
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from dbutils import connect, default_db_path
+
+CONDITIONS = ['PP', 'MI', 'CC']
+OUTCOMES = ['response_rt', 'contact_rt', 'error_rate']
+TRAINING_BLOCK = 2
+TEST_BLOCK = 3
+
+# Comparison data for worker processes, set by _init_worker
+_comparisons = None
+
+
+def _weighted_mean(values, weights, index, n):
+    # Gets the weighted mean of values in each group, ignoring missing values
+    valid = ~np.isnan(values) & (weights > 0)
+    w = np.where(valid, weights, 0)
+    sums = np.bincount(index, weights=np.where(valid, values, 0) * w, minlength=n)
+    totals = np.bincount(index, weights=w, minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums / totals
+
+
+def load_transfer_costs(db):
+    """Loads each participant's test-block transfer costs and condition.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+
+    Returns:
+        tuple: An array of participant IDs, an array of their conditions, and an
+        (n_participants, n_outcomes) array of non-dominant minus dominant costs.
+        Participants with a missing value for any outcome are excluded.
+
+    """
+    conditions = dict(db.execute(
+        "SELECT participant_id, MIN(trial_type) FROM trials WHERE block_num = ? "
+        "GROUP BY participant_id", (TRAINING_BLOCK,)
+    ).fetchall())
+    rows = db.execute(
+        "SELECT participant_id, dominant, trials, timeouts, errors, mean_response, "
+        "mean_contact FROM trial_bins WHERE block_num = ?", (TEST_BLOCK,)
+    ).fetchall()
+    if not len(rows):
+        return (np.zeros(0, dtype=np.int64), np.zeros(0, dtype=object),
+                np.zeros((0, len(OUTCOMES))))
+
+    cols = list(zip(*rows))
+    pid = np.asarray(cols[0], dtype=np.int64)
+    dominant = np.asarray([str(d).lower() in ("1", "true") for d in cols[1]])
+    trials = np.asarray(cols[2], dtype=np.float64)
+    timeouts = np.asarray(cols[3], dtype=np.float64)
+    errors = np.asarray(cols[4], dtype=np.float64)
+    response = np.asarray(
+        [np.nan if v == "NA" else float(v) for v in cols[5]], dtype=np.float64
+    )
+    contact = np.asarray(
+        [np.nan if v == "NA" else float(v) for v in cols[6]], dtype=np.float64
+    )
+
+    # Aggregate the bins for each participant and hand
+    ids, p_idx = np.unique(pid, return_inverse=True)
+    p_idx = p_idx.reshape(-1)
+    index = p_idx * 2 + dominant
+    n = len(ids) * 2
+    # NOTE: Errors are mostly from recycled trials, which aren't included in the
+    # bins' trial counts, so they're added to the number of attempts
+    ok = trials - timeouts
+    attempts = trials + errors
+    hands = np.stack([
+        _weighted_mean(response, ok, index, n),
+        _weighted_mean(contact, ok, index, n),
+        np.bincount(index, weights=timeouts + errors, minlength=n) /
+            np.bincount(index, weights=attempts, minlength=n),
+    ], axis=1).reshape(len(ids), 2, len(OUTCOMES))
+    costs = hands[:, 0, :] - hands[:, 1, :]
+
+    conds = np.asarray([conditions.get(int(p), "NA") for p in ids], dtype=object)
+    keep = ~np.isnan(costs).any(axis=1) & np.isin(conds, CONDITIONS)
+    return (ids[keep], conds[keep], costs[keep])
+
+
+def _init_worker(comparisons):
+    global _comparisons
+    _comparisons = comparisons
+
+
+def resample_batch(seed, size):
+    """Generates a batch of bootstrap and permutation resamples for all comparisons.
+
+    Args:
+        seed (:obj:`numpy.random.SeedSequence`): The seed for the batch.
+        size (int): The number of resamples in the batch.
+
+    Returns:
+        dict: The bootstrapped differences in group means and the differences
+        under permuted group labels (each a (size, n_outcomes) array) for each
+        comparison.
+
+    """
+    rng = np.random.default_rng(seed)
+    out = OrderedDict()
+    for name, (a, b) in _comparisons.items():
+        na, nb = len(a), len(b)
+        # Bootstrap: resample each group's participants with replacement
+        boot_a = a[rng.integers(0, na, (size, na))].mean(axis=1)
+        boot_b = b[rng.integers(0, nb, (size, nb))].mean(axis=1)
+        # Permutation: randomly reassign participants to the two groups
+        pooled = np.concatenate([a, b])
+        perms = rng.random((size, na + nb)).argsort(axis=1)[:, :na]
+        sum_a = pooled[perms].sum(axis=1)
+        perm_a = sum_a / na
+        perm_b = (pooled.sum(axis=0) - sum_a) / nb
+        out[name] = (boot_a - boot_b, perm_a - perm_b)
+    return out
+
+
+def run_resamples(comparisons, n, batch_size, workers, seed):
+    """Runs all bootstrap and permutation resamples across a process pool.
+
+    Returns:
+        dict: The concatenated bootstrap and permutation differences for each
+        comparison.
+
+    """
+    sizes = [min(batch_size, n - i) for i in range(0, n, batch_size)]
+    seeds = seed.spawn(len(sizes))
+    results = OrderedDict((name, ([], [])) for name in comparisons.keys())
+    if workers > 1:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_worker,
+            initargs=(comparisons,)
+        )
+        with pool:
+            batches = pool.map(resample_batch, seeds, sizes)
+            for batch in batches:
+                for name, (boot, perm) in batch.items():
+                    results[name][0].append(boot)
+                    results[name][1].append(perm)
+    else:
+        _init_worker(comparisons)
+        for s, size in zip(seeds, sizes):
+            for name, (boot, perm) in resample_batch(s, size).items():
+                results[name][0].append(boot)
+                results[name][1].append(perm)
+    return OrderedDict(
+        (name, (np.concatenate(boot), np.concatenate(perm)))
+        for name, (boot, perm) in results.items()
+    )
+
+
+def summarize(comparisons, resamples, ci=95.0):
+    """Computes the observed differences, bootstrap CIs, and permutation p-values.
+
+    Returns:
+        list: A list of (comparison, outcome, diff, ci_low, ci_high, p) tuples.
+
+    """
+    tail = (100.0 - ci) / 2.0
+    out = []
+    for name, (a, b) in comparisons.items():
+        observed = a.mean(axis=0) - b.mean(axis=0)
+        boot, perm = resamples[name]
+        low, high = np.percentile(boot, [tail, 100.0 - tail], axis=0)
+        extreme = (np.abs(perm) >= np.abs(observed) - 1e-12).sum(axis=0)
+        p = (extreme + 1.0) / (len(perm) + 1.0)
+        for i, outcome in enumerate(OUTCOMES):
+            out.append((name, outcome, observed[i], low[i], high[i], p[i]))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--db', default=default_db_path(),
+        help="database to analyze (default: the project database)")
+    parser.add_argument('-n', '--resamples', type=int, default=10000,
+        help="number of bootstrap and permutation resamples (default: 10000)")
+    parser.add_argument('--seed', type=int, default=None,
+        help="random seed for reproducible results (printed if not given)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--batch-size', type=int, default=250,
+        help="resamples per worker task (default: 250)")
+    parser.add_argument('--ci', type=float, default=95.0,
+        help="width of the bootstrap confidence intervals (default: 95)")
+    args = parser.parse_args()
+
+    db = connect(args.db)
+    ids, conds, costs = load_transfer_costs(db)
+    db.close()
+
+    comparisons = OrderedDict()
+    for a, b in combinations(CONDITIONS, 2):
+        if (conds == a).sum() > 1 and (conds == b).sum() > 1:
+            comparisons[a + " - " + b] = (costs[conds == a], costs[conds == b])
+    counts = ", ".join(
+        "{0} = {1}".format(c, int((conds == c).sum())) for c in CONDITIONS
+    )
+    print("Participants: {0}".format(counts))
+    if not comparisons:
+        print("Not enough participants to compare conditions.")
+        return
+
+    seed = np.random.SeedSequence(args.seed)
+    start = time.perf_counter()
+    resamples = run_resamples(
+        comparisons, args.resamples, args.batch_size, args.workers, seed
+    )
+    elapsed = time.perf_counter() - start
+
+    print("\nNon-dominant minus dominant cost, difference between conditions")
+    print("({0} resamples, {1:g}% bootstrap CIs, permutation p-values):\n".format(
+        args.resamples, args.ci
+    ))
+    header = "{0:<9} {1:<12} {2:>10} {3:>22} {4:>8}"
+    print(header.format("", "outcome", "diff", "CI", "p"))
+    for name, outcome, diff, low, high, p in summarize(comparisons, resamples, args.ci):
+        ci = "[{0:.3f}, {1:.3f}]".format(low, high)
+        p = "{0:.4f}".format(p) if p >= 0.0001 else "<0.0001"
+        print("{0:<9} {1:<12} {2:>10.3f} {3:>22} {4:>8}".format(
+            name, outcome, diff, ci, p
+        ))
+    print("\nCompleted in {0:.1f} s with {1} worker(s) (seed: {2}).".format(
+        elapsed, args.workers, seed.entropy
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,473 @@
+"""Generates synthetic MotorMapping participants for load-testing.
+
+Simulates complete sessions (practice, training, and test blocks) for large numbers
+of participants in the PP, MI, and CC conditions and writes them directly into a
+project database with the real schema, so that storage, exports, and analysis can
+be sized for realistic data volumes without running the experiment by hand.
+
+The participant model is deliberately simple, but captures the main features of
+the real data:
+
+- Cursor paths are built from minimum-jerk submovements. Early in training under
+  the ``inverted_x`` mapping, initial movements are often mirrored left-right
+  and followed by a corrective submovement.
+- Performance improves with (physical or imagined) practice, and only part of the
+  dominant hand's learning transfers to the non-dominant hand in the test block.
+- Trials that were recycled after an error are re-run with a random target, as in
+  the task itself, and their errors are written to the ``trial_errors`` table.
+
+Usage:
+    python tools/synth_participants.py -n 5000 --db synthetic.db
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from dbutils import connect
+
+CONDITIONS = ['PP', 'MI', 'CC']
+MAPPING = 'inverted_x'
+FRAME_MS = 1000.0 / 60
+
+# Task structure and target layout (same as the experiment defaults)
+TARGET_SEED = 530453080
+PRACTICE_TRIALS = 10
+TRIALS_PER_BLOCK = 80
+BLOCKS = [(1, 'practice'), (2, 'training'), (3, 'test')]
+TARGET_DIST_MIN = 3.0  # degrees
+TARGET_DIST_MAX = 7.0  # degrees
+CURSOR_SIZE = 1.0  # degrees
+
+# Proportions of each handedness in the simulated sample
+HANDEDNESS = (['r', 'l', 'a'], [0.88, 0.10, 0.02])
+
+# How much training on each trial type counts towards learning the mapping
+# (physical practice = 1.0), and how much learning transfers to the other hand
+TRAINING_EFFICACY = {'PP': 1.0, 'MI': 0.6, 'CC': 0.0}
+TRANSFER = {'PP': 0.5, 'MI': 0.45, 'CC': 0.05}
+
+KVIQ_MOVEMENTS = [
+    'Forward Shoulder Flexion', 'Thumb-Fingers Opposition', 'Forward Trunk Flexion',
+    'Hip Abduction', 'Foot Tapping',
+]
+
+
+def target_schedule():
+    """Generates the fixed target angles and distances (in degrees) for each block.
+
+    """
+    angles, dists = [], []
+    dist_range = TARGET_DIST_MAX - TARGET_DIST_MIN
+    rng = np.random.default_rng(seed=TARGET_SEED)
+    for block in BLOCKS:
+        angles.append(np.floor(rng.random(TRIALS_PER_BLOCK) * 360))
+        dists.append(TARGET_DIST_MIN + rng.random(TRIALS_PER_BLOCK) * dist_range)
+    return angles, dists
+
+
+def vector_xy(amplitude, angle):
+    # Converts angles (clockwise from directly up) and amplitudes to x/y offsets
+    rad = np.radians(angle)
+    return (amplitude * np.sin(rad), -amplitude * np.cos(rad))
+
+
+def min_jerk(tau):
+    # Minimum-jerk position profile for normalized time (0 to 1)
+    tau = np.clip(tau, 0.0, 1.0)
+    return tau ** 3 * (10 - 15 * tau + 6 * tau ** 2)
+
+
+def _na(values, scale=1.0):
+    # Converts an array of floats to DB values, replacing NaNs with "NA"
+    return ["NA" if np.isnan(v) else float(v * scale) for v in values]
+
+
+class SessionModel(object):
+    """Simulates a single participant's session using vectorized NumPy operations.
+
+    Args:
+        rng (:obj:`numpy.random.Generator`): The random generator for the session.
+        condition (str): The participant's training condition (PP, MI, or CC).
+        handedness (str): The participant's handedness (r, l, or a).
+        geometry (dict): The screen centre (``'center'``) and pixels per degree
+            (``'ppd'``) to use for converting positions to pixels.
+
+    """
+    def __init__(self, rng, condition, handedness, geometry):
+        self.rng = rng
+        self.condition = condition
+        self.left_handed = handedness == "l"
+        self.center = geometry['center']
+        self.ppd = geometry['ppd']
+
+        # Individual differences in speed, learning rate, and transfer
+        self.speed = rng.lognormal(0.0, 0.15)
+        self.learn_tau = 25.0 * rng.lognormal(0.0, 0.4)
+        self.transfer = np.clip(TRANSFER[condition] + rng.normal(0, 0.1), 0.0, 1.0)
+
+    def schedule(self, angles, dists):
+        """Builds the per-trial design for the session.
+
+        """
+        rng = self.rng
+        cols = {k: [] for k in ['block', 'trial', 'type', 'dominant', 'angle', 'dist']}
+        for (block_num, phase), a, d in zip(BLOCKS, angles, dists):
+            n = PRACTICE_TRIALS if phase == 'practice' else TRIALS_PER_BLOCK
+            trial_type = self.condition if phase == 'training' else 'PP'
+            if phase == 'test':
+                # 2 trials with each hand in every group of 4 trials
+                groups = np.tile([True, True, False, False], (n // 4, 1))
+                dominant = rng.permuted(groups, axis=1).ravel()
+            else:
+                dominant = np.ones(n, dtype=bool)
+            cols['block'].append(np.full(n, block_num))
+            cols['trial'].append(np.arange(1, n + 1))
+            cols['type'].append(np.full(n, trial_type))
+            cols['dominant'].append(dominant)
+            cols['angle'].append(a[:n].copy())
+            cols['dist'].append(d[:n].copy())
+        design = {k: np.concatenate(v) for k, v in cols.items()}
+
+        # Recycled trials that errored after target onset use a random target.
+        # PP trials can only error after onset in the test block (by moving the
+        # other hand's stick), while MI and CC trials can error in any block
+        n = len(design['trial'])
+        test = design['block'] == BLOCKS[-1][0]
+        recycled = (rng.random(n) < 0.04) & ((design['type'] != 'PP') | test)
+        n_recycled = recycled.sum()
+        design['angle'][recycled] = rng.integers(0, 360, n_recycled)
+        dist_range = TARGET_DIST_MAX - TARGET_DIST_MIN
+        design['dist'][recycled] = TARGET_DIST_MIN + rng.random(n_recycled) * dist_range
+        design['recycled'] = recycled
+        return design
+
+    def naive_prob(self, design):
+        """Gets the probability of a mirrored initial movement on each trial.
+
+        """
+        # Accumulate practice with the dominant hand across trials
+        efficacy = np.array([TRAINING_EFFICACY[t] for t in design['type']])
+        dom_practice = np.where(design['dominant'], efficacy, 0.0)
+        dom_exp = np.cumsum(dom_practice) - dom_practice
+        # Non-dominant experience is transferred learning plus its own practice
+        test = design['block'] == BLOCKS[-1][0]
+        nd_practice = np.where(test & ~design['dominant'], 1.0, 0.0)
+        nd_exp = np.cumsum(nd_practice) - nd_practice
+        trained = dom_exp[test][0] if test.any() else dom_exp[-1]
+        experience = np.where(
+            design['dominant'], dom_exp, self.transfer * trained + nd_exp
+        )
+        return 0.85 * np.exp(-experience / self.learn_tau)
+
+    def simulate(self, angles, dists):
+        """Simulates the full session.
+
+        Returns:
+            tuple: The trial data (as a dict of arrays) and the logged gamepad
+            samples (as an integer array of block, trial, time, x, and y).
+
+        """
+        rng = self.rng
+        design = self.schedule(angles, dists)
+        n = len(design['trial'])
+        p_naive = self.naive_prob(design)
+        naive = rng.random(n) < p_naive
+        dist_deg = design['dist']
+
+        # Generate RTs and movement timing for physical trials
+        movement = 250 + rng.lognormal(np.log(80), 0.4, n) + 150 * p_naive
+        duration = 350 + 40 * dist_deg + 400 * naive + rng.normal(0, 60, n)
+        duration = np.maximum(duration, 150)
+        movement *= self.speed
+        contact = movement + duration * self.speed
+        response = contact + 150 + rng.lognormal(np.log(60), 0.5, n)
+
+        # Mirrored (naive) initial angles versus roughly-correct ones
+        mirrored = (360 - design['angle']) % 360 + rng.normal(0, 15, n)
+        correct = design['angle'] + rng.normal(0, 10 + 20 * p_naive, n)
+        initial = np.where(naive, mirrored, correct) % 360
+
+        # Imagery and control trials have no physical movement
+        pp = design['type'] == 'PP'
+        mi = design['type'] == 'MI'
+        cc = design['type'] == 'CC'
+        response = np.where(mi, response * rng.uniform(0.9, 1.3, n), response)
+        response = np.where(cc, 300 + rng.lognormal(np.log(120), 0.3, n), response)
+        movement[~pp] = np.nan
+        contact[~pp] = np.nan
+        initial[~pp] = np.nan
+
+        # A few trials time out without a response
+        timeout = pp & (rng.random(n) < 0.003)
+        contact[timeout] = np.nan
+        response[timeout] = np.nan
+
+        # Onsets are frame-locked, so errors are small except for dropped frames
+        onset_err = rng.normal(0, 0.2, n)
+        onset_err[rng.random(n) < 0.002] += 1000.0 / 60
+
+        # Get target locations in pixels
+        dx, dy = vector_xy(dist_deg * self.ppd, design['angle'])
+        target_x = (self.center[0] + dx).astype(int)
+        target_y = (self.center[1] + dy).astype(int)
+
+        # Respond with the trigger opposite the hand controlling the cursor
+        left_hand = design['dominant'] == self.left_handed
+        triggers = np.where(left_hand, "right", "left")
+        triggers[np.isnan(response)] = "NA"
+
+        trials = {
+            'block_num': design['block'],
+            'trial_num': design['trial'],
+            'trial_type': design['type'],
+            'dominant': design['dominant'],
+            'target_onset': rng.integers(10, 30, n) * 100,
+            'onset_err': onset_err,
+            'target_dist': dist_deg,
+            'target_angle': design['angle'],
+            'movement_rt': movement,
+            'contact_rt': contact,
+            'response_rt': response,
+            'initial_angle': initial,
+            'resp_trigger': triggers,
+            'target_x': target_x,
+            'target_y': target_y,
+            'recycled': design['recycled'],
+        }
+        moved = pp & ~timeout
+        samples = self.trajectories(trials, naive, moved)
+        return trials, samples
+
+    def trajectories(self, trials, naive, moved):
+        """Generates the logged cursor samples for all trials with movement.
+
+        """
+        rng = self.rng
+        idx = np.nonzero(moved)[0]
+        if not len(idx):
+            return np.zeros((0, 5), dtype=np.int64)
+        start = trials['movement_rt'][idx][:, None]
+        contact = trials['contact_rt'][idx][:, None]
+        end = trials['response_rt'][idx][:, None]
+        amp = trials['target_dist'][idx] * self.ppd
+        is_naive = naive[idx]
+
+        # First submovement heads in the initial direction, then corrects
+        split = np.where(is_naive, rng.uniform(0.4, 0.6, len(idx)), 0.85)[:, None]
+        mid = start + (contact - start) * split
+        amp1 = amp * np.where(is_naive, rng.uniform(0.3, 0.7, len(idx)), 0.95)
+        x1, y1 = vector_xy(amp1, trials['initial_angle'][idx])
+        jitter = rng.normal(0, 0.1 * self.ppd, (2, len(idx)))
+        tx = trials['target_x'][idx] - self.center[0] + jitter[0]
+        ty = trials['target_y'][idx] - self.center[1] + jitter[1]
+
+        # Sample both submovements once per frame from target onset on
+        n_frames = int(np.nanmax(end) / FRAME_MS) + 2
+        t = np.arange(n_frames)[None, :] * FRAME_MS
+        s1 = min_jerk((t - start) / (mid - start))
+        s2 = min_jerk((t - mid) / (contact - mid))
+        x = self.center[0] + np.trunc(s1 * x1[:, None] + s2 * (tx - x1)[:, None])
+        y = self.center[1] + np.trunc(s1 * y1[:, None] + s2 * (ty - y1)[:, None])
+
+        # Like the task, only log samples after movement where the position changed
+        in_trial = (t >= start) & (t <= end)
+        moved_off = (x != self.center[0]) | (y != self.center[1])
+        changed = np.ones_like(in_trial)
+        changed[:, 1:] = (x[:, 1:] != x[:, :-1]) | (y[:, 1:] != y[:, :-1])
+        rows, frames = np.nonzero(in_trial & moved_off & changed)
+        trial_idx = idx[rows]
+        return np.column_stack([
+            trials['block_num'][trial_idx],
+            trials['trial_num'][trial_idx],
+            t[0, frames].astype(np.int64),
+            x[rows, frames].astype(np.int64),
+            y[rows, frames].astype(np.int64),
+        ])
+
+
+def simulate_batch(seed, first, count, geometry):
+    """Simulates a batch of participants in a worker process.
+
+    Args:
+        seed (:obj:`numpy.random.SeedSequence`): The seed for the batch.
+        first (int): The index of the first participant in the batch (used for
+            counterbalancing conditions).
+        count (int): The number of participants to simulate.
+        geometry (dict): The screen geometry to use (see :class:`SessionModel`).
+
+    Returns:
+        tuple: The participant, trial, trial error, KVIQ, and gamepad rows for the
+        batch, with participant IDs given as indices relative to the start of the
+        batch.
+
+    """
+    rng = np.random.default_rng(seed)
+    angles, dists = target_schedule()
+    hands, hand_p = HANDEDNESS
+    created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    participants, trials, errors, kviq, gamepad = [], [], [], [], []
+    for i in range(count):
+        condition = CONDITIONS[(first + i) % len(CONDITIONS)]
+        handedness = rng.choice(hands, p=hand_p)
+        participants.append((
+            i, "{0:032x}".format(int(rng.integers(0, 2 ** 63))),
+            rng.choice(['m', 'f', 'n'], p=[0.45, 0.5, 0.05]),
+            int(rng.integers(18, 40)), handedness, int(rng.integers(1, 11)),
+            created,
+        ))
+
+        model = SessionModel(rng, condition, handedness, geometry)
+        t, samples = model.simulate(angles, dists)
+        trials += list(zip(
+            [i] * len(t['trial_num']), t['block_num'].tolist(),
+            t['trial_num'].tolist(), t['trial_type'].tolist(),
+            [MAPPING] * len(t['trial_num']), t['dominant'].astype(int).tolist(),
+            t['target_onset'].tolist(), t['onset_err'].tolist(),
+            t['target_dist'].tolist(), t['target_angle'].tolist(),
+            _na(t['movement_rt']),
+            _na(t['contact_rt']), _na(t['response_rt']), _na(t['initial_angle']),
+            t['resp_trigger'].tolist(), ["NA"] * len(t['trial_num']),
+            t['target_x'].tolist(), t['target_y'].tolist(),
+        ))
+
+        # Errors for recycled trials (all of which happened after target onset)
+        recycled = np.nonzero(t['recycled'])[0]
+        codes = np.where(t['dominant'], 'wrong_hand', 'wrong_hand_nd')
+        codes = np.where(t['trial_type'] == 'MI', 'stick_mi', codes)
+        codes = np.where(t['trial_type'] == 'CC', 'stick_cc', codes)
+        errors += [
+            (i, int(t['block_num'][j]), int(t['trial_num'][j]),
+             int(t['dominant'][j]), str(codes[j]), 1)
+            for j in recycled
+        ]
+
+        if len(samples):
+            ids = np.full((len(samples), 1), i, dtype=np.int64)
+            gamepad.append(np.hstack([ids, samples]))
+
+        # KVIQ responses and movement times
+        for movement in KVIQ_MOVEMENTS:
+            phys = rng.lognormal(np.log(3.0), 0.3)
+            kviq.append((
+                i, movement, int(rng.integers(1, 6)), int(rng.integers(1, 6)),
+                phys, phys * rng.uniform(0.8, 1.4), phys * rng.uniform(0.8, 1.4),
+            ))
+
+    if len(gamepad):
+        gamepad = np.vstack(gamepad)
+    else:
+        gamepad = np.zeros((0, 6), dtype=np.int64)
+    return participants, trials, errors, kviq, gamepad
+
+
+def _offset_ids(rows, base):
+    # Converts batch-relative participant indices to real participant IDs
+    for row in rows:
+        yield (row[0] + base,) + tuple(row[1:])
+
+
+def write_batch(db, base_id, batch):
+    """Writes a batch of simulated participants to the database in one transaction.
+
+    """
+    participants, trials, errors, kviq, gamepad = batch
+    gamepad = gamepad.copy()
+    gamepad[:, 0] += base_id
+    with db:
+        db.executemany(
+            "INSERT INTO participants (id, userhash, gender, age, handedness, "
+            "game_skill, created) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _offset_ids(participants, base_id)
+        )
+        db.executemany(
+            "INSERT INTO trials (participant_id, block_num, trial_num, trial_type, "
+            "mapping, dominant, target_onset, onset_err, target_dist, "
+            "target_angle, movement_rt, contact_rt, response_rt, initial_angle, resp_trigger, "
+            "err, target_x, target_y) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            _offset_ids(trials, base_id)
+        )
+        db.executemany(
+            "INSERT INTO trial_errors (participant_id, block_num, trial_num, "
+            "dominant, err, target_shown) VALUES (?, ?, ?, ?, ?, ?)",
+            _offset_ids(errors, base_id)
+        )
+        db.executemany(
+            "INSERT INTO kviq (participant_id, movement, vividness, intensity, "
+            "physical_time, visual_time, kinaesthetic_time) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            _offset_ids(kviq, base_id)
+        )
+        db.executemany(
+            "INSERT INTO gamepad (participant_id, block_num, trial_num, \"time\", "
+            "stick_x, stick_y) VALUES (?, ?, ?, ?, ?, ?)",
+            gamepad.tolist()
+        )
+    return len(gamepad)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('-n', '--participants', type=int, default=1000,
+        help="number of participants to simulate (default: 1000)")
+    parser.add_argument('--db', required=True,
+        help="database to write to (created from the project schema if missing)")
+    parser.add_argument('--seed', type=int, default=None,
+        help="random seed for reproducible datasets")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+        help="number of worker processes (default: number of CPUs)")
+    parser.add_argument('--batch-size', type=int, default=50,
+        help="participants simulated per worker task (default: 50)")
+    parser.add_argument('--screen', default="1920x1080",
+        help="simulated screen resolution (default: 1920x1080)")
+    parser.add_argument('--ppd', type=float, default=38.0,
+        help="simulated pixels per degree of visual angle (default: 38)")
+    args = parser.parse_args()
+
+    res_x, res_y = [int(i) for i in args.screen.lower().split("x")]
+    geometry = {'center': (res_x // 2, res_y // 2), 'ppd': args.ppd}
+
+    db = connect(args.db, create=True)
+    db.execute("PRAGMA synchronous = OFF")
+    last_id = db.execute("SELECT MAX(id) FROM participants").fetchone()[0]
+    first_id = (last_id or 0) + 1
+
+    # Spawn independent, reproducible seeds for each batch of participants
+    starts = list(range(0, args.participants, args.batch_size))
+    seeds = np.random.SeedSequence(args.seed).spawn(len(starts))
+
+    start_time = time.perf_counter()
+    n_done, n_samples = 0, 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = {}
+        for first, seed in zip(starts, seeds):
+            count = min(args.batch_size, args.participants - first)
+            f = pool.submit(simulate_batch, seed, first, count, geometry)
+            futures[f] = first
+        for f in as_completed(futures):
+            n_samples += write_batch(db, first_id + futures[f], f.result())
+            n_done += len(f.result()[0])
+            sys.stdout.write("\rSimulated {0} / {1} participants".format(
+                n_done, args.participants
+            ))
+            sys.stdout.flush()
+
+    elapsed = time.perf_counter() - start_time
+    print("\nWrote {0} participants ({1} gamepad samples) in {2:.1f} s.".format(
+        n_done, n_samples, elapsed
+    ))
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Displays live telemetry from a running MotorMapping session.
+
+Listens on the same local UNIX socket as the experiment's telemetry publisher
+(enabled with ``telemetry = True`` in the project's params file) and prints a
+status line with the current trial, phase, cursor position, trigger values, and
+error rate for the current block.
+
+Usage:
+    python tools/telemetry_reader.py [--socket /tmp/motormapping_telemetry.sock]
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import sys
+import time
+import socket
+import argparse
+
+from dbutils import EXP_ASSETS
+
+# Use the same frame format as the experiment's publisher
+sys.path.insert(0, os.path.join(EXP_ASSETS, "Resources", "code"))
+from telemetry import FRAME, decode
+
+DEFAULT_SOCKET = "/tmp/motormapping_telemetry.sock"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET,
+        help="path of the telemetry socket (default: {0})".format(DEFAULT_SOCKET))
+    parser.add_argument('--rate', type=float, default=10.0,
+        help="maximum status updates per second (default: 10)")
+    args = parser.parse_args()
+
+    if os.path.exists(args.socket):
+        os.remove(args.socket)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sock.bind(args.socket)
+    print("Waiting for telemetry on {0}...".format(args.socket))
+
+    # Print the most recent frame at (at most) the requested rate, discarding
+    # any older frames received in the meantime
+    interval = 1.0 / args.rate
+    last_print = 0
+    received = 0
+    latest = None
+    try:
+        while True:
+            # If a frame is waiting to be printed, only block until it's due
+            wait = None
+            if latest is not None:
+                wait = max(last_print + interval - time.perf_counter(), 0.001)
+            sock.settimeout(wait)
+            try:
+                latest = sock.recv(FRAME.size)
+                received += 1
+            except socket.timeout:
+                pass
+            now = time.perf_counter()
+            if latest is None or now - last_print < interval:
+                continue
+            last_print = now
+            f = decode(latest)
+            latest = None
+            # NOTE: Errors are counted per block, same as the trial number
+            attempts = f['trial'] + f['errors']
+            err_rate = f['errors'] / float(attempts) if attempts else 0.0
+            status = (
+                "Block {block} ({phase}), trial {trial:>3} | "
+                "cursor ({x:>5}, {y:>5}) | triggers {lt:.2f} / {rt:.2f} | "
+                "block errors {errors} ({rate:.0%}), last: {last_error} | frames {n}"
+            ).format(
+                x=f['cursor'][0], y=f['cursor'][1], lt=f['triggers'][0],
+                rt=f['triggers'][1], rate=err_rate, n=received, **f
+            )
+            sys.stdout.write("\r" + status)
+            sys.stdout.flush()
+    except KeyboardInterrupt:
+        print("")
+    finally:
+        sock.close()
+        os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
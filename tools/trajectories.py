@@ -0,0 +1,151 @@
+"""A streaming reader for per-trial cursor trajectories from the gamepad table.
+
+Instead of querying the samples for each trial separately, :class:`TrajectoryReader`
+reads the whole (optionally filtered) ``gamepad`` table in a single scan in
+storage order, where each trial's samples are stored together. Rows are fetched
+in fixed-size chunks on a background thread and split into trials lazily as
+they're iterated over, so memory use is bounded by the chunk size (and the number
+of chunks to prefetch) rather than the size of the dataset. For example::
+
+    from trajectories import TrajectoryReader
+
+    for key, samples in TrajectoryReader("merged.db", blocks=[3], hand="nondominant"):
+        t, x, y = samples.T
+        ...
+
+"""
+
+__author__ = "Austin Hurst"
+
+import queue
+import sqlite3
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+TrialKey = namedtuple("TrialKey", ["participant_id", "block_num", "trial_num"])
+
+_DONE = object()
+
+
+class TrajectoryReader(object):
+    """Lazily yields ``(TrialKey, samples)`` pairs for each trial with cursor data.
+
+    Each ``samples`` array has one row per logged sample, with columns for the
+    time (ms from target onset) and the cursor's x and y screen coordinates.
+
+    Args:
+        db_path (str): The path of the database to read.
+        participants (list, optional): If given, only trials for these
+            participant IDs are read.
+        blocks (list, optional): If given, only trials from these block numbers
+            are read.
+        hand (str, optional): If 'dominant' or 'nondominant', only trials for the
+            given hand are read.
+        err (str, optional): If given, only trials with this error code are read
+            (e.g. 'NA' for trials without errors).
+        chunk_size (int, optional): The number of samples to fetch at a time.
+            Defaults to 100000.
+        prefetch (int, optional): The maximum number of chunks to fetch ahead of
+            the consumer. Defaults to 2.
+
+    """
+    def __init__(self, db_path, participants=None, blocks=None, hand=None,
+                 err=None, chunk_size=100000, prefetch=2):
+        if hand not in (None, "dominant", "nondominant"):
+            raise ValueError("hand must be 'dominant', 'nondominant', or None.")
+        self.db_path = db_path
+        self.participants = participants
+        self.blocks = blocks
+        self.hand = hand
+        self.err = err
+        self.chunk_size = chunk_size
+        self.prefetch = prefetch
+
+    def _query(self):
+        q = (
+            "SELECT g.participant_id, g.block_num, g.trial_num, g.time, g.stick_x, "
+            "g.stick_y FROM gamepad AS g"
+        )
+        where, params = ([], [])
+        if self.hand or self.err is not None:
+            # Keep gamepad as the outer loop so rows stay in storage order
+            q += (
+                " CROSS JOIN trials AS t ON t.participant_id = g.participant_id "
+                "AND t.block_num = g.block_num AND t.trial_num = g.trial_num"
+            )
+            if self.hand:
+                vals = ("1", "true") if self.hand == "dominant" else ("0", "false")
+                where.append("lower(t.dominant) IN (?, ?)")
+                params += vals
+            if self.err is not None:
+                where.append("t.err = ?")
+                params.append(self.err)
+        for col, vals in [("participant_id", self.participants),
+                          ("block_num", self.blocks)]:
+            if vals is not None:
+                vals = list(vals)
+                where.append("g.{0} IN ({1})".format(col, ", ".join("?" * len(vals))))
+                params += vals
+        if where:
+            q += " WHERE " + " AND ".join(where)
+        return (q + " ORDER BY g.id", params)
+
+    def _fetch(self, out, stop):
+        # Reads chunks of rows on a background thread with its own connection
+        try:
+            db = sqlite3.connect(self.db_path)
+            try:
+                q, params = self._query()
+                cur = db.execute(q, params)
+                while not stop.is_set():
+                    rows = cur.fetchmany(self.chunk_size)
+                    if not rows:
+                        break
+                    chunk = np.asarray(rows, dtype=np.float64)
+                    while not stop.is_set():
+                        try:
+                            out.put(chunk, timeout=0.1)
+                            break
+                        except queue.Full:
+                            pass
+            finally:
+                db.close()
+        except Exception as e:
+            out.put(e)
+        out.put(_DONE)
+
+    def _chunks(self):
+        out = queue.Queue(maxsize=max(1, self.prefetch))
+        stop = threading.Event()
+        worker = threading.Thread(target=self._fetch, args=(out, stop), daemon=True)
+        worker.start()
+        try:
+            while True:
+                chunk = out.get()
+                if chunk is _DONE:
+                    break
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            stop.set()
+            worker.join()
+
+    def __iter__(self):
+        pending = None
+        for chunk in self._chunks():
+            if pending is not None:
+                # Prepend the unfinished trial from the end of the last chunk
+                chunk = np.concatenate([pending, chunk])
+            keys = chunk[:, :3]
+            changes = np.flatnonzero((keys[1:] != keys[:-1]).any(axis=1)) + 1
+            starts = np.concatenate([[0], changes])
+            ends = np.concatenate([changes, [len(chunk)]])
+            # The last trial in a chunk may continue in the next one
+            for s, e in zip(starts[:-1], ends[:-1]):
+                yield (TrialKey(*(int(k) for k in keys[s])), chunk[s:e, 3:])
+            pending = chunk[starts[-1]:]
+        if pending is not None and len(pending):
+            yield (TrialKey(*(int(k) for k in pending[0, :3])), pending[:, 3:])
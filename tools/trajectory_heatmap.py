@@ -0,0 +1,243 @@
+"""Renders cursor occupancy heatmaps in a target-aligned frame.
+
+Cursor samples from the ``gamepad`` table are streamed (joined to their trials)
+in fixed-size chunks, rotated so that each trial's target lies directly above the
+origin, and accumulated into 2D histograms for each combination of condition,
+input mapping, and hand. Since only one chunk of samples is in memory at a time,
+peak memory use doesn't depend on the size of the dataset.
+
+Since the screen size and resolution aren't stored in the database, the cursor
+origin and pixels-per-degree for each participant are estimated from their
+target locations, distances, and angles, so heatmaps are in degrees of visual
+angle and can be combined across computers.
+
+Histograms are saved to a single .npz file, and (optionally) as PNG images.
+
+Usage:
+    python tools/trajectory_heatmap.py --db merged.db -o heatmaps --png
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import zlib
+import time
+import struct
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from dbutils import connect, default_db_path
+
+TRAINING_BLOCK = 2
+
+
+def estimate_geometry(db):
+    """Estimates the cursor origin and pixels per degree for each participant.
+
+    Each trial's target is at ``origin + dist * ppd * (sin(angle), -cos(angle))``,
+    so the origin and ppd can be solved for with least squares.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+
+    Returns:
+        tuple: A sorted array of participant IDs and an (n, 3) array of their
+        estimated (origin_x, origin_y, ppd).
+
+    """
+    rows = db.execute(
+        "SELECT participant_id, target_dist, target_angle, target_x, target_y "
+        "FROM trials ORDER BY participant_id"
+    ).fetchall()
+    if not len(rows):
+        return (np.zeros(0, np.int64), np.zeros((0, 3)))
+    arr = np.asarray(rows, dtype=np.float64)
+    ids, starts = np.unique(arr[:, 0].astype(np.int64), return_index=True)
+    geometry = np.zeros((len(ids), 3))
+    for i, chunk in enumerate(np.split(arr, starts[1:])):
+        rad = np.radians(chunk[:, 2])
+        n = len(chunk)
+        a = np.zeros((n * 2, 3))
+        a[:n, 0] = 1
+        a[n:, 1] = 1
+        a[:n, 2] = chunk[:, 1] * np.sin(rad)
+        a[n:, 2] = -chunk[:, 1] * np.cos(rad)
+        b = np.concatenate([chunk[:, 3], chunk[:, 4]])
+        geometry[i] = np.linalg.lstsq(a, b, rcond=None)[0]
+    return (ids, geometry)
+
+
+def stream_samples(db, chunk_size=200000, block=None):
+    """Streams cursor samples joined to their trial info in fixed-size chunks.
+
+    Yields:
+        tuple: Arrays of participant IDs, cursor x/y positions, target angles,
+        and the (condition, mapping, dominant) group keys for each sample.
+
+    """
+    q = (
+        "WITH conds AS (SELECT participant_id, MIN(trial_type) AS cond "
+        "FROM trials WHERE block_num = {0} GROUP BY participant_id) "
+        "SELECT g.participant_id, g.stick_x, g.stick_y, t.target_angle, c.cond, "
+        "t.mapping, t.dominant FROM gamepad AS g CROSS JOIN trials AS t "
+        "ON t.participant_id = g.participant_id AND t.block_num = g.block_num "
+        "AND t.trial_num = g.trial_num "
+        "LEFT JOIN conds AS c ON c.participant_id = g.participant_id"
+    ).format(TRAINING_BLOCK)
+    params = ()
+    if block is not None:
+        q += " WHERE g.block_num = ?"
+        params = (block,)
+    cur = db.execute(q, params)
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            break
+        cols = list(zip(*rows))
+        dominant = np.char.lower(np.asarray(cols[6]).astype(str))
+        hands = np.where(np.isin(dominant, ["1", "true"]), "dominant", "nondominant")
+        keys = np.char.add(
+            np.char.add(np.asarray(cols[4]).astype(str), "/"),
+            np.char.add(np.char.add(np.asarray(cols[5]).astype(str), "/"), hands)
+        )
+        yield (
+            np.asarray(cols[0], dtype=np.int64),
+            np.asarray(cols[1], dtype=np.float64),
+            np.asarray(cols[2], dtype=np.float64),
+            np.asarray(cols[3], dtype=np.float64),
+            keys,
+        )
+
+
+def target_aligned(x, y, angle, origin_x, origin_y, ppd):
+    """Rotates cursor positions into a frame where the target is straight up.
+
+    Returns:
+        tuple: The distance (in degrees) of each sample to the right of and along
+        the origin-to-target axis.
+
+    """
+    dx = (x - origin_x) / ppd
+    dy = (y - origin_y) / ppd
+    rad = np.radians(angle)
+    sin, cos = np.sin(rad), np.cos(rad)
+    along = dx * sin - dy * cos
+    right = dx * cos + dy * sin
+    return (right, along)
+
+
+def accumulate(db, bins=200, extent=10.0, chunk_size=200000, block=None):
+    """Accumulates target-aligned occupancy histograms for each group.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+        bins (int, optional): The number of bins along each axis.
+        extent (float, optional): The half-width (in degrees) of the histograms.
+        chunk_size (int, optional): The number of samples to load at a time.
+        block (int, optional): If given, only samples from this block are used.
+
+    Returns:
+        tuple: A dict of (bins, bins) histograms for each group key, the bin
+        edges, and the total number of samples processed.
+
+    """
+    ids, geometry = estimate_geometry(db)
+    edges = np.linspace(-extent, extent, bins + 1)
+    hists = OrderedDict()
+    total = 0
+    for pid, x, y, angle, keys in stream_samples(db, chunk_size, block):
+        geo = geometry[np.searchsorted(ids, pid)]
+        right, along = target_aligned(x, y, angle, geo[:, 0], geo[:, 1], geo[:, 2])
+        groups, idx = np.unique(keys, return_inverse=True)
+        idx = idx.reshape(-1)
+        for i, key in enumerate(groups):
+            mask = idx == i
+            h, _, _ = np.histogram2d(along[mask], right[mask], bins=[edges, edges])
+            if key not in hists:
+                hists[key] = np.zeros((bins, bins), dtype=np.float64)
+            hists[key] += h
+        total += len(pid)
+    return (hists, edges, total)
+
+
+def _hot(values):
+    # Maps values from 0 to 1 to a black-red-yellow-white colour scale
+    v = np.clip(values, 0, 1)[..., np.newaxis] * 3.0
+    rgb = np.clip(np.concatenate([v, v - 1, v - 2], axis=-1), 0, 1)
+    return (rgb * 255).astype(np.uint8)
+
+
+def write_png(path, hist):
+    """Writes a histogram to a PNG image on a log colour scale.
+
+    The image is flipped vertically so that the target is at the top, and is
+    written with only the standard library (no imaging packages required).
+
+    """
+    scaled = np.log1p(hist)
+    if scaled.max() > 0:
+        scaled = scaled / scaled.max()
+    img = _hot(scaled[::-1])
+    h, w = img.shape[:2]
+    raw = b"".join(b"\x00" + img[row].tobytes() for row in range(h))
+
+    def chunk(kind, data):
+        crc = zlib.crc32(kind + data) & 0xFFFFFFFF
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", crc)
+
+    with open(path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        f.write(chunk(b"IHDR", struct.pack(">IIBBBBB", w, h, 8, 2, 0, 0, 0)))
+        f.write(chunk(b"IDAT", zlib.compress(raw, 6)))
+        f.write(chunk(b"IEND", b""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--db', default=default_db_path(),
+        help="database to read (default: the project database)")
+    parser.add_argument('-o', '--output', default="heatmaps",
+        help="output folder (default: ./heatmaps)")
+    parser.add_argument('--bins', type=int, default=200,
+        help="number of bins along each axis (default: 200)")
+    parser.add_argument('--extent', type=float, default=10.0,
+        help="half-width of the heatmaps in degrees (default: 10)")
+    parser.add_argument('--block', type=int, default=None,
+        help="only include samples from the given block number")
+    parser.add_argument('--chunk-size', type=int, default=200000,
+        help="number of samples to load at a time (default: 200000)")
+    parser.add_argument('--png', action='store_true',
+        help="also save each heatmap as a PNG image")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    db = connect(args.db)
+    hists, edges, total = accumulate(
+        db, args.bins, args.extent, args.chunk_size, args.block
+    )
+    db.close()
+
+    if not os.path.isdir(args.output):
+        os.makedirs(args.output)
+    keys = list(hists.keys())
+    np.savez_compressed(
+        os.path.join(args.output, "heatmaps.npz"), keys=np.asarray(keys),
+        edges=edges, hists=np.stack([hists[k] for k in keys]) if keys else []
+    )
+    if args.png:
+        for key in keys:
+            name = key.replace("/", "_") + ".png"
+            write_png(os.path.join(args.output, name), hists[key])
+
+    print("Binned {0} samples into {1} heatmaps in {2:.1f} s.".format(
+        total, len(keys), time.perf_counter() - start
+    ))
+    for key in keys:
+        print(" - {0}: {1} samples".format(key, int(hists[key].sum())))
+
+
+if __name__ == "__main__":
+    main()
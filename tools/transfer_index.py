@@ -0,0 +1,199 @@
+"""Computes lateral transfer indices for every participant in a database.
+
+For each participant, mean response and contact RTs (for trials without errors or
+timeouts) are computed for four parts of the session:
+
+- ``baseline``: the practice block (dominant hand)
+- ``train_end``: the last 20 trials of the training block (dominant hand)
+- ``test_d`` / ``test_nd``: the test block, for the dominant/non-dominant hand
+
+From these, the improvement from baseline for each hand in the test block and
+the transfer index (the non-dominant hand's improvement as a percentage of the
+dominant hand's) are derived. All participants are processed in one vectorized
+pass over the trials table, and the results are cached next to the database
+keyed by its last trial ID, so repeated runs on unchanged data are instant.
+
+Usage:
+    python tools/transfer_index.py [--db path/to/MotorMapping.db] [-o transfer.txt]
+
+"""
+
+__author__ = "Austin Hurst"
+
+import os
+import io
+import time
+import argparse
+
+import numpy as np
+
+from dbutils import connect, default_db_path
+
+PRACTICE_BLOCK = 1
+TRAINING_BLOCK = 2
+TEST_BLOCK = 3
+END_TRIALS = 20
+CONDITIONS = ['PP', 'MI', 'CC']
+
+PERIODS = ['baseline', 'train_end', 'test_d', 'test_nd']
+MEASURES = ['response', 'contact']
+
+
+def output_columns():
+    """Gets the names of the columns in the transfer index results.
+
+    """
+    cols = []
+    for m in MEASURES:
+        cols += ["{0}_{1}".format(m, p) for p in PERIODS]
+        cols += [m + "_gain_d", m + "_gain_nd", m + "_transfer"]
+    return cols
+
+
+def cache_path(db_path):
+    return os.path.splitext(db_path)[0] + "_transfer_cache.npz"
+
+
+def _to_float(values):
+    arr = np.asarray(values, dtype=object)
+    arr[arr == "NA"] = np.nan
+    return arr.astype(np.float64)
+
+
+def compute_transfer(db):
+    """Computes transfer indices for all participants in one pass over the trials.
+
+    Args:
+        db (:obj:`sqlite3.Connection`): The database connection to use.
+
+    Returns:
+        tuple: An array of participant IDs, an array of their conditions, and an
+        (n_participants, n_columns) array of results (see :func:`output_columns`),
+        with NaN for any values that couldn't be computed.
+
+    """
+    rows = db.execute(
+        "SELECT participant_id, block_num, trial_num, trial_type, dominant, "
+        "response_rt, contact_rt, err FROM trials"
+    ).fetchall()
+    if not len(rows):
+        return (np.zeros(0, np.int64), np.zeros(0, "<U2"),
+                np.zeros((0, len(output_columns()))))
+
+    cols = list(zip(*rows))
+    ids, p = np.unique(np.asarray(cols[0], dtype=np.int64), return_inverse=True)
+    p = p.reshape(-1)
+    block = np.asarray(cols[1], dtype=np.int64)
+    trial = np.asarray(cols[2], dtype=np.int64)
+    ttype = np.asarray(cols[3], dtype="<U8")
+    dom = np.isin(np.char.lower(np.asarray(cols[4]).astype(str)), ["1", "true"])
+    ok = np.asarray(cols[7], dtype=object) == "NA"
+    n = len(ids)
+
+    # Get each participant's condition from their training trial types
+    conds = np.full(n, "NA", dtype="<U2")
+    training = block == TRAINING_BLOCK
+    conds[p[training]] = ttype[training]
+
+    # Find the last trials of each participant's training block
+    last = np.zeros(n, dtype=np.int64)
+    np.maximum.at(last, p[training], trial[training])
+    train_end = training & (trial > last[p] - END_TRIALS)
+
+    # Assign each trial to a part of the session (-1 if not used)
+    period = np.full(len(p), -1, dtype=np.int64)
+    period[(block == PRACTICE_BLOCK) & dom] = 0
+    period[train_end & dom] = 1
+    period[(block == TEST_BLOCK) & dom] = 2
+    period[(block == TEST_BLOCK) & ~dom] = 3
+    used = ok & (period >= 0)
+
+    results = []
+    for measure in MEASURES:
+        rt = _to_float(cols[5] if measure == "response" else cols[6])
+        valid = used & ~np.isnan(rt)
+        index = p[valid] * len(PERIODS) + period[valid]
+        size = n * len(PERIODS)
+        sums = np.bincount(index, weights=rt[valid], minlength=size)
+        counts = np.bincount(index, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = (sums / counts).reshape(n, len(PERIODS))
+            gain_d = means[:, 0] - means[:, 2]
+            gain_nd = means[:, 0] - means[:, 3]
+            transfer = np.where(gain_d > 0, gain_nd / gain_d * 100.0, np.nan)
+        results += [means, gain_d[:, None], gain_nd[:, None], transfer[:, None]]
+
+    return (ids, conds, np.hstack(results))
+
+
+def load_or_compute(db_path, refresh=False):
+    """Loads cached transfer results for a database, recomputing them if stale.
+
+    The cache is considered valid if the last trial ID in the database matches
+    the one the cached results were computed with.
+
+    Returns:
+        tuple: The participant IDs, conditions, results, and whether the cached
+        results were used.
+
+    """
+    db = connect(db_path)
+    last_id = db.execute("SELECT MAX(id) FROM trials").fetchone()[0] or 0
+    cache = cache_path(db_path)
+    if os.path.isfile(cache) and not refresh:
+        with np.load(cache) as f:
+            if int(f['last_id']) == last_id:
+                db.close()
+                return (f['ids'], f['conditions'], f['results'], True)
+
+    ids, conds, results = compute_transfer(db)
+    db.close()
+    np.savez(cache, last_id=last_id, ids=ids, conditions=conds, results=results)
+    return (ids, conds, results, False)
+
+
+def write_results(path, ids, conds, results):
+    """Writes the transfer results to a tab-separated text file.
+
+    """
+    with io.open(path, "w", encoding="utf-8") as f:
+        f.write("\t".join(["participant_id", "condition"] + output_columns()) + "\n")
+        for pid, cond, row in zip(ids, conds, results):
+            vals = ["NA" if np.isnan(v) else "{0:.3f}".format(v) for v in row]
+            f.write("\t".join([str(pid), str(cond)] + vals) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument('--db', default=default_db_path(),
+        help="database to analyze (default: the project database)")
+    parser.add_argument('-o', '--output', default=None,
+        help="tab-separated file to write per-participant results to")
+    parser.add_argument('--refresh', action='store_true',
+        help="ignore any cached results and recompute")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    ids, conds, results, cached = load_or_compute(args.db, args.refresh)
+    elapsed = time.perf_counter() - start
+    src = "from cache" if cached else "computed"
+    print("Transfer indices for {0} participants ({1} in {2:.2f} s)".format(
+        len(ids), src, elapsed
+    ))
+
+    cols = output_columns()
+    t_col = cols.index("response_transfer")
+    print("\nMean response RT transfer index (%) by condition:")
+    for cond in CONDITIONS:
+        vals = results[conds == cond, t_col]
+        vals = vals[~np.isnan(vals)]
+        if len(vals):
+            print(" - {0}: {1:.1f} (n = {2})".format(cond, vals.mean(), len(vals)))
+
+    if args.output:
+        write_results(args.output, ids, conds, results)
+        print("\nResults written to '{0}'.".format(args.output))
+
+
+if __name__ == "__main__":
+    main()